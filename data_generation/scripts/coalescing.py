@@ -0,0 +1,86 @@
+import re
+
+from generation_engine import response_text
+
+# Section header the coalesced prompts ask the model to repeat before each topic's requests.
+TOPIC_HEADER = "### Topic {index}"
+TOPIC_HEADER_PATTERN = re.compile(r"^\s*#*\s*Topic\s+(\d+)\s*[:.]?\s*$", re.IGNORECASE | re.MULTILINE)
+
+def split_topics(generated_text, num_topics):
+    """
+    Splits a tagged response into the text written under each topic header.
+
+    Parameters:
+    - generated_text: str, the response to a coalesced prompt.
+    - num_topics: int, number of topics the prompt asked for.
+
+    Returns:
+    - list: One string per topic (empty if the model skipped it). Text before the first
+      header, and sections with an out-of-range index, are dropped.
+    """
+    sections = [""] * num_topics
+    matches = list(TOPIC_HEADER_PATTERN.finditer(generated_text))
+    for match, next_match in zip(matches, matches[1:] + [None]):
+        index = int(match.group(1)) - 1
+        if 0 <= index < num_topics:
+            end = next_match.start() if next_match else len(generated_text)
+            sections[index] += generated_text[match.end():end]
+    return sections
+
+def pack(units, group_size):
+    """Splits a list of units into consecutive groups of at most `group_size`."""
+    return [units[i:i + group_size] for i in range(0, len(units), group_size)]
+
+def generate_coalesced(client, units, num_requests, build_prompt, parse_section, group_size=4, max_rounds=3,
+                       stats=None):
+    """
+    Generates records for many units (leaf topics, safety types) with several units per API call.
+
+    Each call packs up to `group_size` units into one tagged prompt; the response is split
+    back per unit by its topic header. Units that come back with fewer than `num_requests`
+    records are re-packed and asked only for the shortfall, for up to `max_rounds` rounds.
+
+    Parameters:
+    - client: GenerationClient used to call the API.
+    - units: List of unit descriptions (tuples), passed back to the callbacks.
+    - num_requests: int, records wanted per unit.
+    - build_prompt: Function mapping a list of (unit, count) pairs to one coalesced prompt.
+    - parse_section: Function mapping (unit, section text) to that unit's records.
+    - group_size: int, maximum units per API call.
+    - max_rounds: int, maximum calls any one unit takes part in.
+    - stats: Optional dict updated with "calls", "rounds" and "short_units" (units re-requested).
+
+    Yields:
+    - (unit, records, error): As each unit completes. `error` is set only when an API call
+      for the unit failed after retries; a unit still short after `max_rounds` is yielded
+      with the records it has.
+    """
+    stats = stats if stats is not None else {}
+    stats.update({"calls": 0, "rounds": 0, "short_units": 0})
+    records = {unit: [] for unit in units}
+    pending = list(units)
+
+    for round_index in range(max_rounds):
+        if not pending:
+            break
+        stats["rounds"] += 1
+        groups = pack([(unit, num_requests - len(records[unit])) for unit in pending], group_size)
+        stats["calls"] += len(groups)
+        pending = []
+        for group, generated_texts, error in client.run(
+            groups,
+            lambda group: {"inputs": build_prompt(group)},
+            lambda group, generated_texts: generated_texts,
+        ):
+            if error is not None:
+                for unit, _ in group:
+                    yield unit, None, error
+                continue
+            sections = split_topics(response_text(generated_texts), len(group))
+            for (unit, _), section in zip(group, sections):
+                records[unit].extend(parse_section(unit, section))
+                if len(records[unit]) >= num_requests or round_index == max_rounds - 1:
+                    yield unit, records[unit], None
+                else:
+                    pending.append(unit)
+        stats["short_units"] += len(pending)
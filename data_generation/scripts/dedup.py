@@ -0,0 +1,243 @@
+import re
+import sys
+import json
+import sqlite3
+import hashlib
+import argparse
+
+import numpy as np
+
+# Mersenne prime for the universal hash family (a * x + b) mod p.
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64(0xFFFFFFFF)
+WRAPPER_TAGS = re.compile(r"</?(user|assistant)>")
+NON_WORD = re.compile(r"[\W_]+")
+
+def normalize(text):
+    """Lowercases text, drops the <user>/<assistant> wrappers and collapses punctuation and whitespace."""
+    return NON_WORD.sub(" ", WRAPPER_TAGS.sub(" ", text).lower()).strip()
+
+def lsh_params(threshold, num_perm):
+    """
+    Picks the LSH banding (bands, rows) whose S-curve midpoint (1/b)^(1/r) is closest to `threshold`.
+
+    Parameters:
+    - threshold: float, Jaccard similarity at which records count as duplicates.
+    - num_perm: int, MinHash signature length.
+
+    Returns:
+    - (bands, rows) with bands * rows <= num_perm.
+    """
+    candidates = [(num_perm // rows, rows) for rows in range(1, num_perm + 1)]
+    return min(candidates, key=lambda params: abs((1 / params[0]) ** (1 / params[1]) - threshold))
+
+class MinHasher:
+    """
+    MinHash signatures over character shingles of normalized text.
+
+    Parameters:
+    - num_perm: int, number of hash permutations (signature length).
+    - shingle_size: int, characters per shingle.
+    - seed: int, seed of the permutation parameters; indexes built with different seeds are incompatible.
+    """
+
+    def __init__(self, num_perm=128, shingle_size=5, seed=1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        # a, b and the 32-bit shingle hashes keep a * x + b below 2**64.
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text):
+        text = normalize(text)
+        if len(text) <= self.shingle_size:
+            return {text}
+        return {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        """Returns the MinHash signature of `text` as a uint32 array of length num_perm."""
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in self.shingles(text)],
+            dtype=np.uint64,
+        )
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=1).astype(np.uint32)
+
+class DedupIndex:
+    """
+    Persistent MinHash/LSH index that flags near-duplicate records as they stream in.
+
+    Each kept record's signature is split into LSH bands; a new record becomes a
+    candidate match of every indexed record it shares a band with, and is a duplicate
+    if the estimated Jaccard similarity of their signatures reaches `threshold`.
+    Signatures and band keys live in SQLite, so memory stays bounded however many
+    rows are indexed, and the index carries over between runs. Duplicates are not
+    indexed themselves.
+
+    Parameters:
+    - path: SQLite file of the index (":memory:" for a throwaway index).
+    - threshold: float, Jaccard similarity at or above which a record is a duplicate.
+    - num_perm: int, MinHash signature length.
+    - shingle_size: int, characters per shingle.
+    - commit_every: int, records between commits to disk.
+    """
+
+    def __init__(self, path=":memory:", threshold=0.8, num_perm=128, shingle_size=5, commit_every=1000):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.commit_every = commit_every
+        self.pending = 0
+        self.stats = {}
+
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, text TEXT NOT NULL, signature BLOB NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS bands (key INTEGER NOT NULL, record_id INTEGER NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS bands_key ON bands (key)")
+        # Signatures from different settings are not comparable: refuse to mix them.
+        settings = json.dumps({"num_perm": num_perm, "shingle_size": shingle_size, "bands": self.bands, "rows": self.rows})
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+        if row is None:
+            self.db.execute("INSERT INTO meta (key, value) VALUES ('settings', ?)", (settings,))
+        elif row[0] != settings:
+            raise ValueError(f"Index {path} was built with settings {row[0]}, not {settings}.")
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def band_keys(self, signature):
+        """Hashes each band of a signature, together with its band number, to a signed 64-bit key."""
+        data = signature.tobytes()
+        width = self.rows * signature.itemsize
+        return [
+            int.from_bytes(hashlib.blake2b(band.to_bytes(2, "little") + data[band * width:(band + 1) * width],
+                                           digest_size=8).digest(), "little", signed=True)
+            for band in range(self.bands)
+        ]
+
+    def query(self, signature, keys=None):
+        """
+        Finds the most similar indexed record sharing an LSH band with `signature`.
+
+        Returns:
+        - (record_id, text, similarity) of the best match at or above the threshold, or None.
+        """
+        keys = keys if keys is not None else self.band_keys(signature)
+        candidates = self.db.execute(
+            f"SELECT DISTINCT records.id, records.text, records.signature FROM bands "
+            f"JOIN records ON records.id = bands.record_id WHERE bands.key IN ({','.join('?' * len(keys))})",
+            keys,
+        ).fetchall()
+        best = None
+        for record_id, text, blob in candidates:
+            similarity = float(np.mean(np.frombuffer(blob, dtype=np.uint32) == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[2]):
+                best = (record_id, text, similarity)
+        return best
+
+    def add(self, text, signature=None, keys=None):
+        """Indexes one record and returns its id."""
+        signature = signature if signature is not None else self.hasher.signature(text)
+        keys = keys if keys is not None else self.band_keys(signature)
+        record_id = self.db.execute("INSERT INTO records (text, signature) VALUES (?, ?)",
+                                    (text, signature.tobytes())).lastrowid
+        self.db.executemany("INSERT INTO bands (key, record_id) VALUES (?, ?)", [(key, record_id) for key in keys])
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+        return record_id
+
+    def check(self, text, category=None):
+        """
+        Checks one record against the index and indexes it if it is new.
+
+        Parameters:
+        - text: str, the record text (e.g. the "user" field).
+        - category: Optional category the per-category duplicate rates are reported under.
+
+        Returns:
+        - None if the record is new, otherwise {"duplicate_of": text, "similarity": float}.
+        """
+        signature = self.hasher.signature(text)
+        keys = self.band_keys(signature)
+        match = self.query(signature, keys)
+        counts = self.stats.setdefault(category, {"records": 0, "duplicates": 0})
+        counts["records"] += 1
+        if match is not None:
+            counts["duplicates"] += 1
+            return {"duplicate_of": match[1], "similarity": round(match[2], 4)}
+        self.add(text, signature, keys)
+        return None
+
+    def filter_records(self, records, text_field="user", category_field="category"):
+        """Returns the records of a batch that are not near-duplicates of anything indexed so far."""
+        return [record for record in records
+                if self.check(record[text_field], record.get(category_field)) is None]
+
+    def report(self):
+        """Per-category record and duplicate counts, with duplicate rates, plus an overall total."""
+        report = {}
+        for category, counts in sorted(self.stats.items(), key=lambda item: str(item[0])):
+            report[str(category)] = {**counts, "duplicate_rate": counts["duplicates"] / max(counts["records"], 1)}
+        records = sum(counts["records"] for counts in self.stats.values())
+        duplicates = sum(counts["duplicates"] for counts in self.stats.values())
+        report["total"] = {"records": records, "duplicates": duplicates,
+                           "duplicate_rate": duplicates / max(records, 1), "indexed": len(self)}
+        return report
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        if self.db is not None:
+            self.commit()
+            self.db.close()
+            self.db = None
+
+def iter_records(input_file):
+    """Lazily reads JSONL records from a file, or from stdin when `input_file` is "-"."""
+    stream = sys.stdin if input_file == "-" else open(input_file, "r")
+    try:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop or flag near-duplicate records in generated JSONL data.")
+    parser.add_argument("--input_file", type=str, required=True, help="JSONL file to deduplicate ('-' reads stdin as records arrive).")
+    parser.add_argument("--output_file", type=str, required=True, help="JSONL file for the kept (or flagged) records.")
+    parser.add_argument("--index", type=str, default="dedup_index.sqlite", help="Persistent index shared across runs.")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Jaccard similarity at which records are duplicates.")
+    parser.add_argument("--num_perm", type=int, default=128, help="MinHash signature length.")
+    parser.add_argument("--shingle_size", type=int, default=5, help="Characters per shingle.")
+    parser.add_argument("--mode", choices=["drop", "flag"], default="drop", help="Drop duplicates, or keep them with a 'duplicate_of' field.")
+    parser.add_argument("--text_field", type=str, default="user", help="Record field compared for duplicates.")
+    parser.add_argument("--category_field", type=str, default="category", help="Record field duplicate rates are reported by (e.g. safety_type).")
+    args = parser.parse_args()
+
+    index = DedupIndex(args.index, threshold=args.threshold, num_perm=args.num_perm, shingle_size=args.shingle_size)
+    print(f"Index {args.index}: {len(index)} records, {index.bands} bands x {index.rows} rows", file=sys.stderr)
+    with open(args.output_file, "w") as output:
+        for record in iter_records(args.input_file):
+            duplicate = index.check(record[args.text_field], record.get(args.category_field))
+            if duplicate is None:
+                output.write(json.dumps(record) + "\n")
+            elif args.mode == "flag":
+                output.write(json.dumps({**record, **duplicate}) + "\n")
+    report = index.report()
+    index.close()
+
+    for category, counts in report.items():
+        print(f"{category}: {counts['duplicates']}/{counts['records']} duplicates ({counts['duplicate_rate']:.1%})")
+    print(f"Index now holds {report['total']['indexed']} records; output written to {args.output_file}")
+
+if __name__ == "__main__":
+    main()
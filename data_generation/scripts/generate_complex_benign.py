@@ -1,10 +1,12 @@
-import os
 import sys
 import json
-import requests
 import argparse
 
 from tokens import load_auth_token
+from generation_engine import GenerationClient, response_text
+from coalescing import generate_coalesced
+from incremental_output import IncrementalWriter
+from dedup import DedupIndex
 
 # Define safety types
 SAFETY_TYPES = [
@@ -50,38 +52,54 @@ def extract_requests(generated_text):
     """
     return [line.strip() for line in generated_text.splitlines() if line.strip().startswith("Request:")]
 
-# Generate safety requests using the HF API
-def generate_requests(num_requests, safety_type):
+# Build the generation prompt for one safety type
+def build_prompt(num_requests, safety_type):
     """
-    Generate requests using Hugging Face's inference API based on the specified safety type and number of requests.
+    Fills the benign-request template for one safety type.
 
     Parameters:
     - num_requests: int, number of requests to generate.
     - safety_type: str, the safety type to focus on.
 
     Returns:
-    - list: List of formatted user/assistant JSON objects.
+    - str: The prompt sent to the model.
     """
-    prompt = (f"{template['task_description'].replace('{num_requests}', str(num_requests)).replace('{safety_type}', safety_type)}\n\n"
-             f"Examples:\n"
-             + "\n".join([f"Request: {example}" for example in template['examples']]) + "\n\n"
-             f"{template['format'].replace('{num_requests}', str(num_requests)).replace('{safety_type}', safety_type)}")
+    return (f"{template['task_description'].replace('{num_requests}', str(num_requests)).replace('{safety_type}', safety_type)}\n\n"
+            f"Examples:\n"
+            + "\n".join([f"Request: {example}" for example in template['examples']]) + "\n\n"
+            f"{template['format'].replace('{num_requests}', str(num_requests)).replace('{safety_type}', safety_type)}")
 
-    payload = {"inputs": prompt}
+# Build one prompt covering several safety types
+def build_coalesced_prompt(group):
+    """
+    Fills the coalesced benign-request template for several safety types at once.
 
-    response = requests.post(API_URL, headers=HEADERS, json=payload)
+    Parameters:
+    - group: List of ((safety_type,), num_requests) pairs.
 
-    if response.status_code != 200:
-        raise Exception(f"HF API Error: {response.status_code} - {response.text}")
+    Returns:
+    - str: The prompt sent to the model, asking for one tagged section per safety type.
+    """
+    sections = [template['coalesced_task_description'].replace('{num_topics}', str(len(group))),
+                "Examples:\n" + "\n".join([f"Request: {example}" for example in template['examples']])]
+    for index, ((safety_type,), num_requests) in enumerate(group, start=1):
+        sections.append(template['coalesced_topic'].replace('{index}', str(index))
+                        .replace('{num_requests}', str(num_requests)).replace('{safety_type}', safety_type))
+    sections.append(template['coalesced_format'])
+    return "\n\n".join(sections)
+
+# Turn generated text into fine-tuning records
+def parse_text(generated_text, safety_type):
+    """
+    Extracts the generated requests from text and attaches the safety type.
 
-    generated_texts = response.json()
-    if isinstance(generated_texts, list):
-        generated_text = '\n'.join(text.get('generated_text', '').strip() for text in generated_texts)
-    else:
-        generated_text = generated_texts.get('generated_text', '').strip()
-    if not generated_text:
-        raise ValueError("No generated text returned by the API.")
+    Parameters:
+    - generated_text: str, the generated text (or one safety type's section of it).
+    - safety_type: str, the safety type the requests were generated for.
 
+    Returns:
+    - list: List of formatted user/assistant JSON objects.
+    """
     # Extract requests from the generated text
     requests_list = extract_requests(generated_text)
 
@@ -96,32 +114,111 @@ def generate_requests(num_requests, safety_type):
     ]
     return fine_tuning_data
 
+# Turn an API response into fine-tuning records
+def parse_response(generated_texts, safety_type):
+    """
+    Extracts the generated requests from an API response and attaches the safety type.
+
+    Parameters:
+    - generated_texts: The decoded JSON response of the HF API.
+    - safety_type: str, the safety type the requests were generated for.
+
+    Returns:
+    - list: List of formatted user/assistant JSON objects.
+    """
+    generated_text = response_text(generated_texts)
+    if not generated_text:
+        raise ValueError("No generated text returned by the API.")
+    return parse_text(generated_text, safety_type)
+
+# Generate safety requests using the HF API
+def generate_requests(num_requests, safety_type, client):
+    """
+    Generate requests using Hugging Face's inference API based on the specified safety type and number of requests.
+
+    Parameters:
+    - num_requests: int, number of requests to generate.
+    - safety_type: str, the safety type to focus on.
+    - client: GenerationClient used to call the API.
+
+    Returns:
+    - list: List of formatted user/assistant JSON objects.
+    """
+    generated_texts = client.post({"inputs": build_prompt(num_requests, safety_type)})
+    return parse_response(generated_texts, safety_type)
+
 # Main script
 def main():
     parser = argparse.ArgumentParser(description="Generate safety requests for fine-tuning.")
     parser.add_argument("--num_requests", type=int, default=10, help="Number of requests to generate per safety type.")
     parser.add_argument("--output_file", type=str, default="fine_tuning_data.jsonl", help="Output file for the generated requests.")
+    parser.add_argument("--api_url", type=str, default=API_URL, help="Inference API endpoint.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of API requests in flight.")
+    parser.add_argument("--rate_limit", type=float, default=None, help="Maximum API requests per second.")
+    parser.add_argument("--max_retries", type=int, default=5, help="Retries per request on 429/5xx and connection errors.")
+    parser.add_argument("--resume", action="store_true", help="Keep existing output and skip safety types already written.")
+    parser.add_argument("--coalesce", type=int, default=1, help="Safety types packed into each API call (1 disables coalescing).")
+    parser.add_argument("--max_rounds", type=int, default=3, help="Calls a coalesced safety type may take to reach --num_requests.")
+    parser.add_argument("--dedup_index", type=str, default=None, help="Persistent near-duplicate index; duplicates are dropped before writing.")
+    parser.add_argument("--dedup_threshold", type=float, default=0.8, help="Jaccard similarity at which generated requests are duplicates.")
     args = parser.parse_args()
 
     num_requests = args.num_requests
     output_file = args.output_file
-
-    if os.path.exists(output_file):
-        os.remove(output_file)  # Clear the output file if it already exists
-
-    all_data = []
+    writer = IncrementalWriter(output_file, resume=args.resume)
+    dedup = DedupIndex(args.dedup_index, threshold=args.dedup_threshold) if args.dedup_index else None
+    safety_types = [safety_type for safety_type in SAFETY_TYPES if not writer.is_done((safety_type,))]
     for safety_type in SAFETY_TYPES:
-        print(f"Generating requests for safety type: {safety_type}")
-        fine_tuning_data = generate_requests(num_requests, safety_type)
-        all_data.extend(fine_tuning_data)
+        if safety_type not in safety_types:
+            print(f"Skipping completed safety type: {safety_type}")
+
+    client = GenerationClient(args.api_url, HEADERS, concurrency=args.concurrency, rate=args.rate_limit,
+                              max_retries=args.max_retries)
+    if args.coalesce > 1:
+        coalesce_stats = {}
+        outcomes = (
+            (safety_type, fine_tuning_data, error)
+            for (safety_type,), fine_tuning_data, error in generate_coalesced(
+                client, [(safety_type,) for safety_type in safety_types], num_requests, build_coalesced_prompt,
+                lambda unit, section: parse_text(section, *unit),
+                group_size=args.coalesce, max_rounds=args.max_rounds, stats=coalesce_stats,
+            )
+        )
+    else:
+        outcomes = client.run(
+            safety_types,
+            lambda safety_type: {"inputs": build_prompt(num_requests, safety_type)},
+            lambda safety_type, generated_texts: parse_response(generated_texts, safety_type),
+        )
+
+    failed, records = [], 0
+    for safety_type, fine_tuning_data, error in outcomes:
+        if error is not None:
+            print(f"Failed generating requests for safety type: {safety_type}: {error}")
+            failed.append(safety_type)
+            continue
+        if dedup is not None:
+            fine_tuning_data = dedup.filter_records(fine_tuning_data, category_field="safety_type")
+        # Append to JSONL as soon as the safety type is done
+        writer.write_unit((safety_type,), fine_tuning_data)
+        if dedup is not None:
+            dedup.commit()
+        records += len(fine_tuning_data)
         print(f"Finished generating requests for: {safety_type}")
-
-    # Write to JSONL with metadata
-    with open(output_file, "w") as file:
-        for entry in all_data:
-            file.write(json.dumps(entry) + "\n")
-
-    print(f"Data written to {output_file}")
+    client.close()
+    if dedup is not None:
+        for name, counts in dedup.report().items():
+            print(f"Duplicates dropped for {name}: {counts['duplicates']}/{counts['records']} ({counts['duplicate_rate']:.1%})")
+        dedup.close()
+
+    print(f"Data written to {output_file} ({client.stats['requests']} API calls, {client.stats['retries']} retries)")
+    print(f"{records} records for {len(safety_types)} safety types, ~{client.tokens_per_record(records):.0f} tokens per record")
+    if args.coalesce > 1:
+        print(f"Coalesced {args.coalesce} safety types per call: {coalesce_stats['calls']} calls in "
+              f"{coalesce_stats['rounds']} round(s), {coalesce_stats['short_units']} short safety types re-requested")
+    if failed:
+        print(f"{len(failed)} safety type(s) failed after retries; rerun with --resume to retry them.")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,12 @@
-import os
 import sys
 import json
-import requests
 import argparse
 
 from tokens import load_auth_token
+from generation_engine import GenerationClient, response_text
+from coalescing import generate_coalesced
+from incremental_output import IncrementalWriter
+from dedup import DedupIndex
 
 # Load authentication token
 TOKEN = load_auth_token()
@@ -45,10 +47,10 @@ def extract_requests(generated_text):
             print("Debug: Blank request detected in generated_text:\n", generated_text)
     return [req for req in requests if req]
 
-# Generate harmful requests using the HF API
-def generate_requests(num_requests, category, sub_category, leaf_topic, description):
+# Build the generation prompt for one taxonomy leaf topic
+def build_prompt(num_requests, category, sub_category, leaf_topic, description):
     """
-    Generate harmful requests using Hugging Face's inference API based on taxonomy dimensions.
+    Fills the harmful-request template for one taxonomy leaf topic.
 
     Parameters:
     - num_requests: int, number of requests to generate.
@@ -58,7 +60,7 @@ def generate_requests(num_requests, category, sub_category, leaf_topic, descript
     - description: str, the description of the leaf topic.
 
     Returns:
-    - list: List of formatted user/assistant JSON objects.
+    - str: The prompt sent to the model.
     """
     prompt = (f"{template['task_description'].replace('{num_requests}', str(num_requests))}")
     prompt = prompt.replace("{category}", category)
@@ -66,25 +68,43 @@ def generate_requests(num_requests, category, sub_category, leaf_topic, descript
     prompt = prompt.replace("{leaf_topic}", leaf_topic)
     prompt = prompt.replace("{description}", description)
     prompt += f"\n\n{template['format']}"
+    return prompt
 
-    payload = {"inputs": prompt}
-
-    response = requests.post(API_URL, headers=HEADERS, json=payload)
+# Build one prompt covering several taxonomy leaf topics
+def build_coalesced_prompt(group):
+    """
+    Fills the coalesced harmful-request template for several leaf topics at once.
 
-    if response.status_code != 200:
-        raise Exception(f"HF API Error: {response.status_code} - {response.text}")
+    Parameters:
+    - group: List of ((category, sub_category, leaf_topic, description), num_requests) pairs.
 
-    generated_texts = response.json()
-    if isinstance(generated_texts, list):
-        generated_text = '\n'.join(text.get('generated_text', '').strip() for text in generated_texts if text.get('generated_text'))
-    else:
-        generated_text = generated_texts.get('generated_text', '').strip()
-    if not generated_text:
-        raise ValueError("No generated text returned by the API.")
+    Returns:
+    - str: The prompt sent to the model, asking for one tagged section per leaf topic.
+    """
+    sections = [template['coalesced_task_description'].replace('{num_topics}', str(len(group)))]
+    for index, ((category, sub_category, leaf_topic, description), num_requests) in enumerate(group, start=1):
+        section = template['coalesced_topic'].replace('{index}', str(index))
+        section = section.replace('{num_requests}', str(num_requests))
+        section = section.replace('{category}', category)
+        section = section.replace('{sub_category}', sub_category)
+        section = section.replace('{leaf_topic}', leaf_topic)
+        section = section.replace('{description}', description)
+        sections.append(section)
+    sections.append(template['coalesced_format'])
+    return "\n\n".join(sections)
+
+# Turn generated text into fine-tuning records
+def parse_text(generated_text, category, sub_category, leaf_topic, description):
+    """
+    Extracts the generated requests from text and attaches taxonomy metadata.
 
-    # Debug: Print the raw generated_text
-    #print("Debug: Raw generated_text:\n", generated_text)
+    Parameters:
+    - generated_text: str, the generated text (or one topic's section of it).
+    - category, sub_category, leaf_topic, description: Taxonomy metadata of the request.
 
+    Returns:
+    - list: List of formatted user/assistant JSON objects.
+    """
     # Extract requests from the generated text
     requests_list = extract_requests(generated_text)
 
@@ -102,37 +122,124 @@ def generate_requests(num_requests, category, sub_category, leaf_topic, descript
     ]
     return fine_tuning_data
 
+# Turn an API response into fine-tuning records
+def parse_response(generated_texts, category, sub_category, leaf_topic, description):
+    """
+    Extracts the generated requests from an API response and attaches taxonomy metadata.
+
+    Parameters:
+    - generated_texts: The decoded JSON response of the HF API.
+    - category, sub_category, leaf_topic, description: Taxonomy metadata of the request.
+
+    Returns:
+    - list: List of formatted user/assistant JSON objects.
+    """
+    generated_text = response_text(generated_texts)
+    if not generated_text:
+        raise ValueError("No generated text returned by the API.")
+
+    # Debug: Print the raw generated_text
+    #print("Debug: Raw generated_text:\n", generated_text)
+
+    return parse_text(generated_text, category, sub_category, leaf_topic, description)
+
+# Generate harmful requests using the HF API
+def generate_requests(num_requests, category, sub_category, leaf_topic, description, client):
+    """
+    Generate harmful requests using Hugging Face's inference API based on taxonomy dimensions.
+
+    Parameters:
+    - num_requests: int, number of requests to generate.
+    - category: str, the main category of the taxonomy.
+    - sub_category: str, the subcategory within the taxonomy.
+    - leaf_topic: str, the fine-grained topic of the taxonomy.
+    - description: str, the description of the leaf topic.
+    - client: GenerationClient used to call the API.
+
+    Returns:
+    - list: List of formatted user/assistant JSON objects.
+    """
+    prompt = build_prompt(num_requests, category, sub_category, leaf_topic, description)
+    generated_texts = client.post({"inputs": prompt})
+    return parse_response(generated_texts, category, sub_category, leaf_topic, description)
+
 # Main script
 def main():
     parser = argparse.ArgumentParser(description="Generate harmful requests for fine-tuning.")
     parser.add_argument("--num_requests", type=int, default=5, help="Number of requests to generate per taxonomy leaf topic.")
     parser.add_argument("--output_file", type=str, default="harmful_requests.jsonl", help="Output file for the generated requests.")
+    parser.add_argument("--api_url", type=str, default=API_URL, help="Inference API endpoint.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of API requests in flight.")
+    parser.add_argument("--rate_limit", type=float, default=None, help="Maximum API requests per second.")
+    parser.add_argument("--max_retries", type=int, default=5, help="Retries per request on 429/5xx and connection errors.")
+    parser.add_argument("--resume", action="store_true", help="Keep existing output and skip leaf topics already written.")
+    parser.add_argument("--coalesce", type=int, default=1, help="Leaf topics packed into each API call (1 disables coalescing).")
+    parser.add_argument("--max_rounds", type=int, default=3, help="Calls a coalesced leaf topic may take to reach --num_requests.")
+    parser.add_argument("--dedup_index", type=str, default=None, help="Persistent near-duplicate index; duplicates are dropped before writing.")
+    parser.add_argument("--dedup_threshold", type=float, default=0.8, help="Jaccard similarity at which generated requests are duplicates.")
     args = parser.parse_args()
 
     num_requests = args.num_requests
     output_file = args.output_file
+    writer = IncrementalWriter(output_file, resume=args.resume)
+    dedup = DedupIndex(args.dedup_index, threshold=args.dedup_threshold) if args.dedup_index else None
 
-    if os.path.exists(output_file):
-        os.remove(output_file)  # Clear the output file if it already exists
-
-    all_data = []
-
+    jobs = []
     for category, subcategories in taxonomy.items():
         for sub_category_key, sub_category_data in subcategories.items():
             sub_category_name = sub_category_data["subcat_name"]
             description = sub_category_data["description"]
             for leaf_topic in sub_category_data["leaf_topics"]:
-                print(f"Generating requests for category: {category}, sub_category: {sub_category_name}, leaf_topic: {leaf_topic}")
-                fine_tuning_data = generate_requests(num_requests, category, sub_category_name, leaf_topic, description)
-                all_data.extend(fine_tuning_data)
-                print(f"Finished generating requests for: {leaf_topic}")
-
-    # Write to JSONL with metadata
-    with open(output_file, "w") as file:
-        for entry in all_data:
-            file.write(json.dumps(entry) + "\n")
-
-    print(f"Data written to {output_file}")
+                if writer.is_done((category, sub_category_name, leaf_topic)):
+                    print(f"Skipping completed leaf_topic: {leaf_topic}")
+                    continue
+                jobs.append((category, sub_category_name, leaf_topic, description))
+
+    client = GenerationClient(args.api_url, HEADERS, concurrency=args.concurrency, rate=args.rate_limit,
+                              max_retries=args.max_retries)
+    if args.coalesce > 1:
+        coalesce_stats = {}
+        outcomes = generate_coalesced(
+            client, jobs, num_requests, build_coalesced_prompt,
+            lambda job, section: parse_text(section, *job),
+            group_size=args.coalesce, max_rounds=args.max_rounds, stats=coalesce_stats,
+        )
+    else:
+        outcomes = client.run(
+            jobs,
+            lambda job: {"inputs": build_prompt(num_requests, *job)},
+            lambda job, generated_texts: parse_response(generated_texts, *job),
+        )
+
+    failed, records = [], 0
+    for job, fine_tuning_data, error in outcomes:
+        category, sub_category_name, leaf_topic, description = job
+        if error is not None:
+            print(f"Failed generating requests for category: {category}, sub_category: {sub_category_name}, leaf_topic: {leaf_topic}: {error}")
+            failed.append(job)
+            continue
+        if dedup is not None:
+            fine_tuning_data = dedup.filter_records(fine_tuning_data, category_field="category")
+        # Append to JSONL with metadata as soon as the leaf topic is done
+        writer.write_unit((category, sub_category_name, leaf_topic), fine_tuning_data)
+        if dedup is not None:
+            dedup.commit()
+        records += len(fine_tuning_data)
+        print(f"Finished generating requests for: {leaf_topic}")
+    client.close()
+    if dedup is not None:
+        for name, counts in dedup.report().items():
+            print(f"Duplicates dropped for {name}: {counts['duplicates']}/{counts['records']} ({counts['duplicate_rate']:.1%})")
+        dedup.close()
+
+    print(f"Data written to {output_file} ({client.stats['requests']} API calls, {client.stats['retries']} retries)")
+    print(f"{records} records for {len(jobs)} leaf topics, ~{client.tokens_per_record(records):.0f} tokens per record")
+    if args.coalesce > 1:
+        print(f"Coalesced {args.coalesce} leaf topics per call: {coalesce_stats['calls']} calls in "
+              f"{coalesce_stats['rounds']} round(s), {coalesce_stats['short_units']} short leaf topics re-requested")
+    if failed:
+        print(f"{len(failed)} leaf topic(s) failed after retries; rerun with --resume to retry them.")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
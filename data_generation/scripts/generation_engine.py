@@ -0,0 +1,183 @@
+import re
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth retrying: rate limiting, model loading and transient gateway errors.
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Word pieces and punctuation; a tokenizer-free proxy for the token counts the API bills.
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text):
+    """Roughly estimates the number of model tokens in `text` without loading a tokenizer."""
+    return len(TOKEN_PATTERN.findall(text))
+
+def response_text(generated_texts):
+    """
+    Joins the generated text of an HF inference API response.
+
+    Parameters:
+    - generated_texts: The decoded JSON response, a list of {"generated_text": ...} dicts or one such dict.
+
+    Returns:
+    - str: The generated text, stripped.
+    """
+    if isinstance(generated_texts, list):
+        return '\n'.join(text.get('generated_text', '').strip() for text in generated_texts if isinstance(text, dict)).strip()
+    if isinstance(generated_texts, dict):
+        return generated_texts.get('generated_text', '').strip()
+    return ""
+
+class GenerationError(Exception):
+    """Raised when a generation request fails permanently or runs out of retries."""
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting the request rate across all workers.
+
+    Parameters:
+    - rate: float, tokens added per second.
+    - capacity: int, maximum burst size.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class GenerationClient:
+    """
+    Pooled, rate-limited HTTP client for the text-generation inference API.
+
+    All workers share one `requests.Session` whose connection pool is sized to the
+    concurrency limit. Retryable failures back off exponentially with full jitter,
+    honouring `Retry-After` when the server sends it.
+
+    Parameters:
+    - api_url: str, the inference endpoint.
+    - headers: dict, request headers (e.g. the Authorization bearer token).
+    - concurrency: int, maximum requests in flight.
+    - rate: float, optional maximum requests per second across all workers.
+    - max_retries: int, retries per request before giving up.
+    - backoff_base: float, seconds for the first backoff step.
+    - backoff_max: float, cap on a single backoff delay in seconds.
+    - timeout: float, per-request timeout in seconds.
+    """
+
+    def __init__(self, api_url, headers=None, concurrency=4, rate=None, max_retries=5, backoff_base=1.0,
+                 backoff_max=30.0, timeout=120.0):
+        self.api_url = api_url
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, capacity=max(1, concurrency)) if rate else None
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        self.session.mount(api_url, HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self.stats_lock = threading.Lock()
+
+    def post(self, payload):
+        """
+        Sends one generation request, retrying transient failures.
+
+        Parameters:
+        - payload: dict, JSON body for the API.
+
+        Returns:
+        - The decoded JSON response.
+
+        Raises:
+        - GenerationError: On a non-retryable status or once retries are exhausted.
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+            self._count("requests")
+            retry_after = None
+            try:
+                response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code == 200:
+                    result = response.json()
+                    self._count("prompt_tokens", estimate_tokens(payload.get("inputs", "")))
+                    self._count("completion_tokens", estimate_tokens(response_text(result)))
+                    return result
+                error = f"HF API Error: {response.status_code} - {response.text}"
+                if response.status_code not in RETRYABLE_STATUS:
+                    break
+                retry_after = response.headers.get("Retry-After")
+
+            if attempt == self.max_retries:
+                break
+            self._count("retries")
+            time.sleep(self.backoff_delay(attempt, retry_after))
+
+        self._count("failures")
+        raise GenerationError(error)
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, or the server's Retry-After if it is longer."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        try:
+            return max(delay, min(float(retry_after), self.backoff_max))
+        except (TypeError, ValueError):
+            return delay
+
+    def run(self, jobs, build_payload, handle_response):
+        """
+        Runs generation jobs concurrently and yields their results as they complete.
+
+        Parameters:
+        - jobs: Iterable of job descriptions (any object).
+        - build_payload: Function mapping a job to its JSON payload.
+        - handle_response: Function mapping (job, response JSON) to the job's result.
+
+        Yields:
+        - (job, result, error): `error` is None on success, otherwise the exception and `result` is None.
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {
+                executor.submit(lambda job: handle_response(job, self.post(build_payload(job))), job): job
+                for job in jobs
+            }
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+
+    def close(self):
+        self.session.close()
+
+    def tokens_per_record(self, records):
+        """Estimated prompt plus completion tokens spent per generated record."""
+        return (self.stats["prompt_tokens"] + self.stats["completion_tokens"]) / max(records, 1)
+
+    def _count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
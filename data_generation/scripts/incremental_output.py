@@ -0,0 +1,66 @@
+import os
+import json
+import threading
+
+class IncrementalWriter:
+    """
+    Appends generated records to a JSONL file one unit of work at a time.
+
+    Each unit (a taxonomy leaf topic or a safety type) is written with a single
+    flushed and fsynced append, then recorded in a manifest next to the output. The
+    manifest also stores the output size after the last completed unit, so a restart
+    truncates anything a crash left half-written and skips units already done.
+
+    Parameters:
+    - output_file: str, the JSONL output file.
+    - resume: bool, keep existing output and manifest instead of starting over.
+    """
+
+    def __init__(self, output_file, resume=False):
+        self.output_file = output_file
+        self.manifest_file = f"{output_file}.manifest.json"
+        self.lock = threading.Lock()
+
+        if not resume:
+            for path in (output_file, self.manifest_file):
+                if os.path.exists(path):
+                    os.remove(path)  # Start over: clear previous output and manifest
+
+        self.manifest = {"completed": [], "output_size": 0}
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file, "r") as f:
+                self.manifest = json.load(f)
+        self.completed = {tuple(unit) for unit in self.manifest["completed"]}
+
+        # Drop records of a unit that was being written when the previous run stopped.
+        with open(self.output_file, "ab") as f:
+            f.truncate(self.manifest["output_size"])
+
+    def is_done(self, unit):
+        """Whether `unit` (a tuple of its identifying fields) is already written."""
+        return tuple(unit) in self.completed
+
+    def write_unit(self, unit, records):
+        """
+        Appends all records of one unit and marks it completed.
+
+        Parameters:
+        - unit: tuple identifying the unit, e.g. (category, sub_category, leaf_topic).
+        - records: list of JSON-serializable records.
+        """
+        data = "".join(json.dumps(entry) + "\n" for entry in records).encode("utf-8")
+        with self.lock:
+            with open(self.output_file, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                output_size = f.tell()
+            self.completed.add(tuple(unit))
+            self.manifest["completed"].append(list(unit))
+            self.manifest["output_size"] = output_size
+            tmp_file = f"{self.manifest_file}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(self.manifest, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.manifest_file)
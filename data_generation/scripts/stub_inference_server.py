@@ -0,0 +1,116 @@
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from coalescing import TOPIC_HEADER, TOPIC_HEADER_PATTERN, split_topics
+
+# Matches "Generate 5 diverse requests" / "generating 10 diverse requests" in both templates.
+NUM_REQUESTS_PATTERN = re.compile(r"[Gg]enerat\w* (\d+) diverse requests")
+# Matches the per-topic count in coalesced prompts.
+TOPIC_REQUESTS_PATTERN = re.compile(r"Number of requests: (\d+)")
+
+class StubInferenceServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the HF text-generation inference API.
+
+    Answers each POST with `[{"generated_text": ...}]` holding as many "Request:" lines
+    as the prompt asks for. Latency and failures can be injected to exercise retries.
+
+    Parameters:
+    - address: (host, port) to bind; port 0 picks a free port.
+    - latency: float, seconds to sleep before answering.
+    - fail_first: int, number of initial requests answered with `fail_status`.
+    - fail_status: int, status code used for injected failures.
+    - error_rate: float, probability of failing any later request with `fail_status`.
+    - response_fn: Optional function mapping the prompt to the generated text.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, fail_first=0, fail_status=503, error_rate=0.0,
+                 response_fn=None):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.error_rate = error_rate
+        self.response_fn = response_fn or default_response
+        self.requests_seen = 0
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/models/stub"
+
+    def start(self):
+        """Serves on a background thread and returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def default_response(prompt):
+    topics = [int(match.group(1)) for match in TOPIC_HEADER_PATTERN.finditer(prompt)]
+    if topics:
+        # Coalesced prompt: answer every topic under its own header.
+        lines, sections = [], split_topics(prompt, max(topics))
+        for index in topics:
+            match = TOPIC_REQUESTS_PATTERN.search(sections[index - 1])
+            lines.append(TOPIC_HEADER.format(index=index))
+            lines.extend(stub_requests(f"{prompt}{index}", int(match.group(1)) if match else 1))
+        return "\n".join(lines)
+    match = NUM_REQUESTS_PATTERN.search(prompt)
+    return "\n".join(stub_requests(prompt, int(match.group(1)) if match else 1))
+
+def stub_requests(seed, count):
+    return [f"Request: Stub request {i + 1} for prompt {abs(hash(seed)) % 10000}" for i in range(count)]
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with server.lock:
+            server.requests_seen += 1
+            seen = server.requests_seen
+            server.prompts.append(body.get("inputs", ""))
+        time.sleep(server.latency)
+
+        if seen <= server.fail_first or random.random() < server.error_rate:
+            self.send_json(server.fail_status, {"error": "Injected failure"})
+            return
+        self.send_json(200, [{"generated_text": server.response_fn(body.get("inputs", ""))}])
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stub of the HF inference API.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response.")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests failed with --fail_status.")
+    parser.add_argument("--fail_status", type=int, default=503, help="Status code for injected failures.")
+    args = parser.parse_args()
+
+    server = StubInferenceServer(("127.0.0.1", args.port), latency=args.latency, fail_status=args.fail_status,
+                                 error_rate=args.error_rate)
+    print(f"Stub inference API listening on {server.url}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
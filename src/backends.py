@@ -0,0 +1,165 @@
+import os
+import json
+import argparse
+
+import torch
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
+from transformers.modeling_outputs import SequenceClassifierOutput
+
+from utils import load_prompts, score_guardian_hap
+
+try:
+    import onnxruntime
+except ImportError:  # Optional: only the ONNX Runtime backend needs it
+    onnxruntime = None
+
+BACKENDS = ["torch", "onnx"]
+ONNX_INPUTS = ["input_ids", "attention_mask"]
+
+def _require_onnxruntime():
+    if onnxruntime is None:
+        raise ImportError("The ONNX backend requires onnxruntime (pip install onnxruntime).")
+
+class OnnxSequenceClassifier:
+    """
+    ONNX Runtime session standing in for a HAP `AutoModelForSequenceClassification`.
+
+    Called like the PyTorch model (`model(**inputs).logits`), so `score_guardian_hap`
+    and everything built on it run unchanged on either backend.
+
+    Parameters:
+    - path: str, the .onnx file (its directory also holds the exported config).
+    - threads: Optional number of intra-op threads for the session.
+    - providers: Optional ONNX Runtime execution providers (defaults to CPU).
+    """
+
+    def __init__(self, path, threads=None, providers=None):
+        _require_onnxruntime()
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=providers or ["CPUExecutionProvider"])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        config_dir = os.path.dirname(os.path.abspath(path))
+        # Keeps VerdictCache keys distinct from the PyTorch model's.
+        self.config = AutoConfig.from_pretrained(config_dir) if os.path.exists(os.path.join(config_dir, "config.json")) else None
+        if self.config is not None:
+            self.config._name_or_path = os.path.abspath(path)
+
+    def __call__(self, **inputs):
+        feeds = {name: inputs[name].detach().cpu().numpy() for name in self.input_names}
+        logits = self.session.run(["logits"], feeds)[0]
+        return SequenceClassifierOutput(logits=torch.from_numpy(logits))
+
+    def eval(self):
+        return self
+
+def load_hap_backend(path, backend="torch", device=torch.device("cpu"), threads=None):
+    """
+    Loads a HAP classifier and its tokenizer on the requested backend.
+
+    Parameters:
+    - path: Model id or directory; for "onnx", a directory written by `export_onnx`
+      (its model.onnx, or model.int8.onnx if `path` names that file directly).
+    - backend: "torch" or "onnx".
+    - device: torch.device for the PyTorch backend (ONNX Runtime runs on CPU).
+    - threads: Optional intra-op thread count for the ONNX session.
+
+    Returns:
+    - (model, tokenizer)
+    """
+    if backend == "torch":
+        tokenizer = AutoTokenizer.from_pretrained(path)
+        return AutoModelForSequenceClassification.from_pretrained(path).to(device).eval(), tokenizer
+    if backend == "onnx":
+        model_path = path if path.endswith(".onnx") else os.path.join(path, "model.onnx")
+        tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(os.path.abspath(model_path)))
+        return OnnxSequenceClassifier(model_path, threads=threads), tokenizer
+    raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}.")
+
+def export_onnx(model, tokenizer, output_dir, optimize=True, quantize=False, opset=17):
+    """
+    Exports a HAP sequence classifier to ONNX.
+
+    Writes model.onnx with dynamic batch and sequence axes, plus the tokenizer and config
+    so the directory loads on its own. Optionally also writes an offline-optimized graph
+    and a dynamically int8-quantized copy.
+
+    Parameters:
+    - model: PyTorch sequence classification model.
+    - tokenizer: Its tokenizer.
+    - output_dir: str, directory to write to.
+    - optimize: Whether to replace model.onnx with ONNX Runtime's fully optimized graph.
+    - quantize: Whether to also write model.int8.onnx (int8 weights, dynamic activations).
+    - opset: int, ONNX opset version.
+
+    Returns:
+    - dict mapping "fp32" (and "int8") to the written model paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    model = model.float().eval().cpu()
+    sample = tokenizer(["Export sample text.", "Two"], padding=True, return_tensors="pt")
+    path = os.path.join(output_dir, "model.onnx")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ONNX_INPUTS}
+    dynamic_axes["logits"] = {0: "batch"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model, (sample["input_ids"], sample["attention_mask"]), path,
+            input_names=ONNX_INPUTS, output_names=["logits"], dynamic_axes=dynamic_axes,
+            opset_version=opset, dynamo=False,
+        )
+    model.config.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    paths = {"fp32": path}
+
+    if optimize or quantize:
+        _require_onnxruntime()
+    if quantize:
+        # Quantize the plain export: the optimizer's fused contrib ops cannot be quantized.
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        paths["int8"] = os.path.join(output_dir, "model.int8.onnx")
+        quantize_dynamic(path, paths["int8"], weight_type=QuantType.QInt8)
+    if optimize:
+        # Run the optimizer once at export time instead of on every session start.
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.optimized_model_filepath = os.path.join(output_dir, "model.optimized.onnx")
+        onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        os.replace(options.optimized_model_filepath, path)
+    return paths
+
+def validate(texts, reference_model, candidate_model, tokenizer, device=torch.device("cpu"), batch_size=32):
+    """
+    Scores texts on two backends and compares the HAP probabilities.
+
+    Returns:
+    - dict with max_delta and mean_delta (absolute probability differences) over `texts`.
+    """
+    reference = score_guardian_hap(device, texts, reference_model, tokenizer, batch_size=batch_size)
+    candidate = score_guardian_hap(device, texts, candidate_model, tokenizer, batch_size=batch_size)
+    deltas = [abs(a - b) for a, b in zip(reference, candidate)]
+    return {"items": len(texts), "max_delta": max(deltas, default=0.0), "mean_delta": sum(deltas) / max(len(deltas), 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a HAP classifier to ONNX and validate it against PyTorch.")
+    parser.add_argument("--model_id", type=str, default="ibm-granite/granite-guardian-hap-38m", help="HAP model id or local checkpoint.")
+    parser.add_argument("--output_dir", type=str, required=True, help="Directory for model.onnx, config and tokenizer.")
+    parser.add_argument("--no_optimize", action="store_true", help="Skip offline graph optimization.")
+    parser.add_argument("--quantize", action="store_true", help="Also write a dynamically int8-quantized model.int8.onnx.")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset version.")
+    parser.add_argument("--prompts_file", type=str, default="prompts.json", help="Prompts used to validate the export.")
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="Maximum fp32 probability delta accepted.")
+    args = parser.parse_args()
+
+    model, tokenizer = load_hap_backend(args.model_id, "torch")
+    paths = export_onnx(model, tokenizer, args.output_dir, optimize=not args.no_optimize, quantize=args.quantize,
+                        opset=args.opset)
+    texts = [prompt for prompt_list in load_prompts(args.prompts_file).values() for prompt in prompt_list]
+    report = {name: validate(texts, model, OnnxSequenceClassifier(path), tokenizer) for name, path in paths.items()}
+    print(json.dumps({"paths": paths, "validation": report}, indent=2))
+    if report["fp32"]["max_delta"] > args.tolerance:
+        raise SystemExit(f"ONNX export drifted by {report['fp32']['max_delta']:.2e} (> {args.tolerance:.0e}).")
+
+if __name__ == "__main__":
+    main()
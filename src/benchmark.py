@@ -0,0 +1,247 @@
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+from functools import lru_cache
+from contextlib import nullcontext
+
+import torch
+import transformers
+
+import backends
+import instrumentation
+from loadtest import percentile
+from tiny_models import GUARDIAN_CONFIGS, HAP_CONFIGS, TOKENIZER_CORPUS, build_guardian_model, build_hap_model, build_tokenizer
+from utils import score_guardian_hap, score_guardian_xl
+from utils2b import get_risk_token_ids, test_risk, test_risk_batch
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+WORKLOADS = ["hap", "hap_onnx", "xl", "risk"]
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def make_prompts(tokenizer, count, seq_len):
+    """
+    Builds `count` distinct prompts of `seq_len` tokens (give or take re-tokenization) from the tokenizer corpus.
+
+    Parameters:
+    - tokenizer: Tokenizer the lengths are measured with.
+    - count: int, number of prompts.
+    - seq_len: int, tokens per prompt.
+
+    Returns:
+    - List of prompt strings.
+    """
+    words = " ".join(TOKENIZER_CORPUS[2:]).split()
+    prompts = []
+    for i in range(count):
+        # Rotate the word order so prompts differ and no cache could short-circuit them.
+        rotated = words[i % len(words):] + words[:i % len(words)]
+        text = " ".join(rotated * (seq_len // len(rotated) + 1))
+        ids = tokenizer(text, add_special_tokens=False)["input_ids"][:seq_len]
+        prompts.append(tokenizer.decode(ids))
+    return prompts
+
+def run_case(workload, models, device, batch_size, seq_len, threads, iterations=10, warmup=2):
+    """
+    Times one workload configuration.
+
+    Each iteration scores `batch_size` prompts in one call, as a caller batching its
+    own traffic would; latency is measured per call.
+
+    Parameters:
+    - workload: "hap" (score_guardian_hap), "hap_onnx" (score_guardian_hap on ONNX Runtime),
+      "xl" (score_guardian_xl) or "risk" (test_risk / test_risk_batch).
+    - models: dict with "tokenizer", "hap" and "guardian" entries, and for "hap_onnx" a
+      "hap_onnx" function mapping a thread count to an ONNX session.
+    - device: torch.device
+    - batch_size: int, prompts per call.
+    - seq_len: int, tokens per prompt (before the chat template for "risk").
+    - threads: int, intra-op threads for torch.
+    - iterations: int, timed calls.
+    - warmup: int, untimed calls before timing.
+
+    Returns:
+    - dict with the configuration, items/sec, tokens/sec, latency percentiles (ms) and peak RSS (MiB).
+    """
+    tokenizer = models["tokenizer"]
+    prompts = make_prompts(tokenizer, batch_size * (iterations + warmup), seq_len)
+    batches = [prompts[i * batch_size:(i + 1) * batch_size] for i in range(iterations + warmup)]
+
+    if workload in ("hap", "hap_onnx"):
+        model = models["hap"] if workload == "hap" else models["hap_onnx"](threads)
+        score = lambda batch: score_guardian_hap(device, batch, model, tokenizer, batch_size=batch_size)
+        count_tokens = lambda batch: sum(len(ids) for ids in tokenizer(batch, max_length=512, truncation=True)["input_ids"])
+    elif workload == "xl":
+        score = lambda batch: score_guardian_xl(device, batch, models["guardian"], tokenizer, batch_size=batch_size)
+        count_tokens = lambda batch: sum(len(ids) for ids in tokenizer(batch, max_length=512, truncation=True)["input_ids"])
+    elif workload == "risk":
+        def score(batch):
+            messages_list = [[{"role": "user", "content": prompt}] for prompt in batch]
+            if batch_size == 1:
+                return [test_risk(messages_list[0], models["guardian"], tokenizer, device, mode="verdict")]
+            return test_risk_batch(messages_list, models["guardian"], tokenizer, device, batch_size=batch_size, mode="verdict")
+        count_tokens = lambda batch: sum(
+            len(tokenizer.apply_chat_template([{"role": "user", "content": prompt}], add_generation_prompt=True))
+            for prompt in batch
+        )
+    else:
+        raise ValueError(f"Unknown workload {workload!r}; expected one of {WORKLOADS}.")
+
+    previous_threads = torch.get_num_threads()
+    torch.set_num_threads(threads)
+    try:
+        for batch in batches[:warmup]:
+            score(batch)
+        latencies, tokens = [], 0
+        for batch in batches[warmup:]:
+            tokens += count_tokens(batch)
+            start = time.perf_counter()
+            score(batch)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        torch.set_num_threads(previous_threads)
+
+    elapsed = sum(latencies)
+    return {
+        "workload": workload,
+        "batch_size": batch_size,
+        "seq_len": seq_len,
+        "threads": threads,
+        "items_per_sec": round(batch_size * iterations / elapsed, 3),
+        "tokens_per_sec": round(tokens / elapsed, 3),
+        "latency_ms": {q: round(percentile(latencies, int(q[1:])) * 1000, 3) for q in ("p50", "p95", "p99")},
+        "peak_rss_mb": round(peak_rss_mb(), 1) if resource is not None else None,
+    }
+
+def case_key(result):
+    return (result["workload"], result["batch_size"], result["seq_len"], result["threads"])
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Compares benchmark results against a saved baseline run.
+
+    A configuration regresses when its items/sec drops, or its p95 latency rises, by
+    more than `tolerance` (a fraction) relative to the baseline.
+
+    Parameters:
+    - results: List of result dicts from `run_case`.
+    - baseline: A report previously written by this module (its "results" are used).
+    - tolerance: float, allowed relative slowdown.
+
+    Returns:
+    - List of dicts with the configuration, throughput and p95 ratios and a "regression" flag,
+      for every configuration present in both runs.
+    """
+    previous = {case_key(result): result for result in baseline["results"]}
+    comparison = []
+    for result in results:
+        base = previous.get(case_key(result))
+        if base is None:
+            continue
+        throughput_ratio = result["items_per_sec"] / base["items_per_sec"]
+        p95_ratio = result["latency_ms"]["p95"] / base["latency_ms"]["p95"]
+        comparison.append({
+            "workload": result["workload"],
+            "batch_size": result["batch_size"],
+            "seq_len": result["seq_len"],
+            "threads": result["threads"],
+            "throughput_ratio": round(throughput_ratio, 3),
+            "p95_ratio": round(p95_ratio, 3),
+            "regression": throughput_ratio < 1 - tolerance or p95_ratio > 1 + tolerance,
+        })
+    return comparison
+
+def build_models(size="bench", onnx_dir=None):
+    """
+    Builds the offline tokenizer, HAP and guardian models from the local configs.
+
+    With `onnx_dir`, the HAP model is also exported there and "hap_onnx" maps a thread
+    count to an ONNX Runtime session over it (ONNX Runtime fixes threads per session).
+    """
+    tokenizer = build_tokenizer()
+    get_risk_token_ids(tokenizer)
+    models = {
+        "tokenizer": tokenizer,
+        "hap": build_hap_model(tokenizer, size=size),
+        "guardian": build_guardian_model(tokenizer, size=size),
+    }
+    if onnx_dir is not None:
+        path = backends.export_onnx(models["hap"], tokenizer, onnx_dir)["fp32"]
+        models["hap_onnx"] = lru_cache(maxsize=None)(lambda threads: backends.OnnxSequenceClassifier(path, threads=threads))
+    return models
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline CPU benchmark of the scoring functions on random local models.")
+    default_workloads = [workload for workload in WORKLOADS if workload != "hap_onnx" or backends.onnxruntime is not None]
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=default_workloads, help="Scoring functions to time.")
+    parser.add_argument("--batch_sizes", nargs="+", type=int, default=[1, 8, 32], help="Prompts per call.")
+    parser.add_argument("--seq_lens", nargs="+", type=int, default=[32, 128, 512], help="Tokens per prompt.")
+    parser.add_argument("--threads", nargs="+", type=int, default=[torch.get_num_threads()], help="Torch intra-op thread counts.")
+    parser.add_argument("--iterations", type=int, default=10, help="Timed calls per configuration.")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed calls per configuration.")
+    parser.add_argument("--size", choices=sorted(GUARDIAN_CONFIGS), default="bench", help="Local model config to build.")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report here (default: stdout).")
+    parser.add_argument("--baseline", type=str, default=None, help="Saved report to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown tolerated before flagging a regression.")
+    parser.add_argument("--profile", type=str, default=None, help="Write a torch profiler (Chrome) trace of the whole run here.")
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    onnx_dir = tempfile.TemporaryDirectory() if "hap_onnx" in args.workloads else None
+    models = build_models(args.size, onnx_dir=onnx_dir.name if onnx_dir else None)
+    results = []
+    with instrumentation.profile(args.profile) if args.profile else nullcontext():
+        for workload in args.workloads:
+            for threads in args.threads:
+                for seq_len in args.seq_lens:
+                    for batch_size in args.batch_sizes:
+                        result = run_case(workload, models, device, batch_size, seq_len, threads,
+                                          iterations=args.iterations, warmup=args.warmup)
+                        print(f"{workload} bs={batch_size} len={seq_len} threads={threads}: "
+                              f"{result['items_per_sec']:.1f} items/s, p95 {result['latency_ms']['p95']:.1f} ms",
+                              file=sys.stderr)
+                        results.append(result)
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "size": args.size,
+            "guardian_config": GUARDIAN_CONFIGS[args.size],
+            "hap_config": HAP_CONFIGS[args.size],
+        },
+        "results": results,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            report["comparison"] = compare(results, json.load(f), tolerance=args.tolerance)
+        regressions = [entry for entry in report["comparison"] if entry["regression"]]
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if regressions:
+        print(f"{len(regressions)} configuration(s) regressed beyond {args.tolerance:.0%}.", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import time
+
+import numpy as np
+
+from utils import score_guardian_hap
+from utils2b import test_risk_batch
+
+def cascade_score(device, data, hap_model, hap_tokenizer, guardian_model, guardian_tokenizer, low=0.2, high=0.8,
+                  guardian_config=None, batch_size=8, stats=None, semantic_cache=None):
+    """
+    Screens prompts with a small HAP model and escalates uncertain ones to the 2B guardian.
+
+    Every prompt is scored by the HAP classifier. Prompts scoring below `low` are
+    Safe and those at or above `high` are Unsafe; the ones in between are batched
+    through `test_risk_batch` in verdict mode. If the guardian fails to give a
+    Yes/No verdict, the HAP score decides at the midpoint of the window (tier "hap_fallback").
+
+    With a `semantic_cache`, escalated prompts close enough to a prompt the guardian
+    already judged confidently reuse that verdict instead, and the new confident
+    verdicts are added to the cache.
+
+    Parameters:
+    - device: torch.device
+    - data: List of prompts
+    - hap_model, hap_tokenizer: Sequence classification model and tokenizer (tier 1)
+    - guardian_model, guardian_tokenizer: Granite Guardian causal LM and tokenizer (tier 2)
+    - low: Lower bound of the uncertainty window on the HAP score
+    - high: Upper bound of the uncertainty window on the HAP score
+    - guardian_config: Optional configuration for the guardian model
+    - batch_size: Batch size for the guardian model
+    - stats: Optional dict, filled with per-tier counts and seconds, the escalation rate and, under
+      "latency", each deciding tier's mean/p50/p95 seconds from the call until an item's verdict
+    - semantic_cache: Optional `semantic_cache.SemanticCache` for this guardian model and config
+
+    Returns:
+    - List of dicts with "label" (1 Unsafe, 0 Safe), "score" (probability of risk from
+      the deciding tier) and "tier" ("hap", "semantic_cache", "guardian" or "hap_fallback"), in input order
+    """
+    start = time.perf_counter()
+    embeddings = [] if semantic_cache is not None else None
+    hap_scores = score_guardian_hap(device, data, hap_model, hap_tokenizer, embeddings=embeddings)
+    hap_seconds = time.perf_counter() - start
+    # Seconds from the start of the call until each item's verdict was known.
+    latencies = [hap_seconds] * len(data)
+
+    results = [{"label": 1 if score >= high else 0, "score": score, "tier": "hap"} for score in hap_scores]
+    escalated = [i for i, score in enumerate(hap_scores) if low <= score < high]
+
+    cache_start = time.perf_counter()
+    cache_hits = 0
+    if semantic_cache is not None and escalated:
+        remaining = []
+        for i, hit in zip(escalated, semantic_cache.lookup([embeddings[i] for i in escalated])):
+            if hit is None:
+                remaining.append(i)
+                continue
+            (label, prob), similarity = hit
+            results[i] = {"label": 1 if label == "Yes" else 0, "score": prob, "tier": "semantic_cache",
+                          "similarity": similarity}
+            latencies[i] = time.perf_counter() - start
+            cache_hits += 1
+        escalated = remaining
+    cache_seconds = time.perf_counter() - cache_start
+
+    # Batch by batch, as test_risk_batch would run them, so each item's latency ends with its batch.
+    guardian_start = time.perf_counter()
+    verdicts = []
+    for b in range(0, len(escalated), batch_size):
+        batch = escalated[b:b + batch_size]
+        verdicts.extend(test_risk_batch(
+            [[{"role": "user", "content": data[i]}] for i in batch],
+            guardian_model, guardian_tokenizer, device,
+            guardian_configs=guardian_config, batch_size=batch_size, mode="verdict",
+        ))
+        done = time.perf_counter() - start
+        for i in batch:
+            latencies[i] = done
+    guardian_seconds = time.perf_counter() - guardian_start
+    if semantic_cache is not None:
+        semantic_cache.add([embeddings[i] for i in escalated], verdicts)
+
+    failed = 0
+    for i, (label, prob) in zip(escalated, verdicts):
+        if label == "Failed":
+            # The guardian gave no verdict: the HAP score decides at the midpoint of the window.
+            failed += 1
+            results[i] = {"label": 1 if hap_scores[i] >= (low + high) / 2 else 0, "score": hap_scores[i],
+                          "tier": "hap_fallback"}
+            continue
+        results[i] = {"label": 1 if label == "Yes" else 0, "score": prob or 0.0, "tier": "guardian"}
+
+    if stats is not None:
+        stats.update({
+            "items": len(data),
+            "escalated": len(escalated) + cache_hits,
+            "hap": {"count": len(data), "seconds": hap_seconds},
+            "guardian": {"count": len(escalated) - failed, "seconds": guardian_seconds, "failed": failed},
+            "escalation_rate": (len(escalated) + cache_hits) / len(data) if data else 0.0,
+        })
+        if semantic_cache is not None:
+            stats["semantic_cache"] = {"count": cache_hits, "seconds": cache_seconds}
+        stats["latency"] = latency_summary(results, latencies)
+    return results
+
+def latency_summary(results, latencies):
+    """
+    Per-tier distribution of the seconds each item waited for its verdict.
+
+    Returns:
+    - dict mapping each deciding tier to its count and mean/p50/p95 latency in seconds.
+    """
+    by_tier = {}
+    for result, latency in zip(results, latencies):
+        by_tier.setdefault(result["tier"], []).append(latency)
+    return {
+        tier: {"count": len(values), "mean": float(np.mean(values)),
+               "p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95))}
+        for tier, values in by_tier.items()
+    }
@@ -0,0 +1,88 @@
+import re
+from itertools import islice
+
+from utils import score_guardian_hap, aggregate_score
+
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+(?:[.!?]+|\n|$)")
+
+def iter_chunks(text, tokenizer, mode="window", window=510, stride=384):
+    """
+    Lazily splits a document into chunks the HAP models can score.
+
+    Parameters:
+    - text: str, the document to split.
+    - tokenizer: Tokenizer for the model (must be a fast tokenizer, for its offset mapping).
+    - mode: "window" for overlapping token windows, "sentence" for one chunk per sentence;
+      sentences longer than `window` tokens are split into windows so none is truncated.
+    - window: Tokens per window, leaving room for the model's special tokens.
+    - stride: Tokens between the starts of consecutive windows (0 < stride <= window).
+
+    Yields:
+    - (start, end): Character offsets of each chunk in `text`.
+    """
+    if mode not in ("window", "sentence"):
+        raise ValueError(f"Unknown chunking mode: {mode!r}. Expected 'window' or 'sentence'.")
+    if not 0 < stride <= window:
+        raise ValueError(f"stride must satisfy 0 < stride <= window, got stride={stride}, window={window}.")
+    if mode == "window":
+        yield from _token_windows(text, 0, len(text), tokenizer, window, stride)
+        return
+    for match in SENTENCE_PATTERN.finditer(text):
+        if match.group().strip():
+            yield from _token_windows(text, match.start(), match.end(), tokenizer, window, stride)
+
+def _token_windows(text, start, end, tokenizer, window, stride):
+    """Windows over text[start:end]: the whole span when it fits in one window."""
+    offsets = tokenizer(text[start:end], add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    if len(offsets) <= window:
+        if offsets:
+            yield start, end
+        return
+    first = 0
+    while first < len(offsets):
+        last = min(first + window, len(offsets)) - 1
+        yield start + offsets[first][0], start + offsets[last][1]
+        if last == len(offsets) - 1:
+            return
+        first += stride
+
+def score_document(device, text, model, tokenizer, threshold=0.75, mode="window", window=510, stride=384,
+                   batch_size=32):
+    """
+    Scores a long document chunk by chunk, stopping at the first unsafe chunk.
+
+    Chunks are scored in batches of `batch_size`; as soon as a batch contains a chunk
+    at or above `threshold` the remaining text is skipped. Clean documents are scored
+    in full.
+
+    Parameters:
+    - device: torch.device
+    - text: str, the document to score.
+    - model: Sequence classification model
+    - tokenizer: Tokenizer for the model
+    - threshold: Decision threshold for classification
+    - mode, window, stride: Chunking parameters, see `iter_chunks`
+    - batch_size: Number of chunks scored per batch
+
+    Returns:
+    - label: 1 if any scored chunk is at or above threshold (Unsafe), else 0 (Safe)
+    - max_score: Maximum probability score across the scored chunks
+    - span: (start, end) character offsets of the highest scoring chunk, or None for empty text
+    """
+    chunks = iter_chunks(text, tokenizer, mode=mode, window=window, stride=stride)
+    hap_scores, spans = [], []
+    while True:
+        batch = list(islice(chunks, batch_size))
+        if not batch:
+            break
+        batch_scores = score_guardian_hap(device, [text[start:end] for start, end in batch], model, tokenizer,
+                                          batch_size=batch_size)
+        hap_scores.extend(batch_scores)
+        spans.extend(batch)
+        if max(batch_scores) >= threshold:
+            break
+
+    if not hap_scores:
+        return 0, 0.0, None
+    label, max_score = aggregate_score(hap_scores, threshold=threshold)
+    return label, max_score, spans[hap_scores.index(max_score)]
@@ -1,28 +1,21 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+import registry  # Imported first: the time-to-first-verdict clock starts here
 from utils import load_prompts
-from utils2b import test_risk
+from utils2b import test_risk_batch
 
 # Model configuration
 model_path_name = "ibm-granite/granite-guardian-3.0-2b"
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+device = None  # None picks CUDA when available, else CPU
+batch_size = 8  # Number of conversations scored together per forward pass
+mode = "verdict"  # Single forward pass; use "generate" to validate against full decoding
+precision = "fp32"  # "bf16", or "int8" on CPU; check the drift against fp32 with precision.py first
 
-# Load model and tokenizer
-tokenizer = AutoTokenizer.from_pretrained(model_path_name)
-model = AutoModelForCausalLM.from_pretrained(model_path_name).to(device).eval()
-
-# Load prompts
-prompts = load_prompts("prompts.json")
-
-# Testing prompts
-results = {category: [] for category in prompts.keys()}
-
-for category, prompt_list in prompts.items():
-    print(f"\nTesting {category.upper()} prompts:")
-    for prompt in prompt_list:
-        messages = [{"role": "user", "content": prompt}]
-        label, prob = test_risk(messages, model, tokenizer, device)
-        results[category].append({
+def score_category(prompt_list, model, tokenizer, device):
+    """Scores one category of prompts and returns a result dict per prompt."""
+    messages_list = [[{"role": "user", "content": prompt}] for prompt in prompt_list]
+    verdicts = test_risk_batch(messages_list, model, tokenizer, device, batch_size=batch_size, mode=mode)
+    results = []
+    for prompt, (label, prob) in zip(prompt_list, verdicts):
+        results.append({
             "prompt": prompt,
             "label": label,
             "probability": f"{prob:.3f}" if prob else "N/A"
@@ -30,13 +23,37 @@ for category, prompt_list in prompts.items():
         print(f"- Prompt: {prompt}")
         print(f"  Risk detected: {label}")
         print(f"  Probability of risk: {prob:.3f}" if prob else "  Probability of risk: N/A")
+    return results
+
+def main():
+    # Load model and tokenizer once per process (the loader also scans the vocabulary for Yes/No variants up front)
+    model, tokenizer = registry.get_model(model_path_name, "guardian", device, precision=precision)
+    run_device = registry.default_device() if device is None else device
+
+    # Load prompts
+    prompts = load_prompts("prompts.json")
+
+    # Time to first verdict: one prompt on its own, before the categories are batched
+    first_prompt = next(prompt for prompt_list in prompts.values() for prompt in prompt_list)
+    test_risk_batch([[{"role": "user", "content": first_prompt}]], model, tokenizer, run_device, mode=mode)
+    load = registry.loaded(model_path_name)[0]
+    print(f"Time to first verdict: {registry.elapsed():.2f}s "
+          f"(load {load['load_seconds']:.2f}s, warm-up {load['warmup_seconds'] or 0:.2f}s)")
+
+    # Testing prompts
+    results = {}
+    for category, prompt_list in prompts.items():
+        print(f"\nTesting {category.upper()} prompts:")
+        results[category] = score_category(prompt_list, model, tokenizer, run_device)
 
-# Display Results
-print("\nSummary of Results:")
-for category, test_results in results.items():
-    print(f"\nCategory: {category.upper()}")
-    for res in test_results:
-        print(f"Prompt: {res['prompt']}")
-        print(f"Risk Detected: {res['label']}")
-        print(f"Probability of Risk: {res['probability']}")
+    # Display Results
+    print("\nSummary of Results:")
+    for category, test_results in results.items():
+        print(f"\nCategory: {category.upper()}")
+        for res in test_results:
+            print(f"Prompt: {res['prompt']}")
+            print(f"Risk Detected: {res['label']}")
+            print(f"Probability of Risk: {res['probability']}")
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import registry  # Imported first: the time-to-first-verdict clock starts here
+from utils import load_prompts
+from cascade import cascade_score
+
+# Model configuration
+hap_model_id = "ibm-granite/granite-guardian-hap-38m"  # Tier 1: screens every prompt
+guardian_model_id = "ibm-granite/granite-guardian-3.0-2b"  # Tier 2: uncertain prompts only
+device = None  # None picks CUDA when available, else CPU
+
+# HAP scores inside [low, high) are escalated to the 2B model
+low, high = 0.2, 0.8
+batch_size = 8  # Batch size for the 2B model
+
+def main():
+    # Load models and tokenizers once per process (shared with anything else using the registry)
+    hap_model, hap_tokenizer = registry.get_model(hap_model_id, "hap", device)
+    guardian_model, guardian_tokenizer = registry.get_model(guardian_model_id, "guardian", device)
+    run_device = registry.default_device() if device is None else device
+
+    # Load prompts
+    prompts = load_prompts("prompts.json")
+
+    # Time to first verdict: one prompt on its own, before the categories are batched
+    first_prompt = next(prompt for prompt_list in prompts.values() for prompt in prompt_list)
+    cascade_score(run_device, [first_prompt], hap_model, hap_tokenizer, guardian_model, guardian_tokenizer,
+                  low=low, high=high, batch_size=batch_size)
+    print(f"Time to first verdict: {registry.elapsed():.2f}s")
+
+    # Score each category through the cascade
+    totals = {"items": 0, "escalated": 0, "hap_seconds": 0.0, "guardian_seconds": 0.0}
+    for category, prompt_list in prompts.items():
+        stats = {}
+        results = cascade_score(run_device, prompt_list, hap_model, hap_tokenizer, guardian_model, guardian_tokenizer,
+                                low=low, high=high, batch_size=batch_size, stats=stats)
+        print(f"\nCategory: {category.upper()}")
+        for prompt, res in zip(prompt_list, results):
+            print(f"Prompt: {prompt}")
+            print(f"Label: {'Unsafe' if res['label'] == 1 else 'Safe'} (tier: {res['tier']}, score: {res['score']:.3f})")
+        print(f"Escalation rate: {stats['escalation_rate']:.1%}, "
+              f"HAP: {stats['hap']['count']} in {stats['hap']['seconds']:.3f}s, "
+              f"2B: {stats['guardian']['count']} in {stats['guardian']['seconds']:.3f}s")
+        for tier, latency in stats["latency"].items():
+            print(f"  {tier}: {latency['count']} verdicts, latency mean {latency['mean'] * 1000:.1f} ms, "
+                  f"p50 {latency['p50'] * 1000:.1f} ms, p95 {latency['p95'] * 1000:.1f} ms")
+
+        totals["items"] += stats["items"]
+        totals["escalated"] += stats["escalated"]
+        totals["hap_seconds"] += stats["hap"]["seconds"]
+        totals["guardian_seconds"] += stats["guardian"]["seconds"]
+
+    # Display tier summary
+    print("\nCascade Summary:")
+    print(f"Items: {totals['items']}, escalated to 2B: {totals['escalated']} "
+          f"({totals['escalated'] / max(totals['items'], 1):.1%})")
+    print(f"HAP time: {totals['hap_seconds']:.3f}s, 2B time: {totals['guardian_seconds']:.3f}s")
+    for load in registry.loaded():
+        print(f"{load['model_id']}: load {load['load_seconds']:.2f}s, warm-up {load['warmup_seconds']:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,73 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+import registry  # Imported first: the time-to-first-verdict clock starts here
+from metrics import summarize, sweep
 from utils import load_prompts, score_guardian_hap, aggregate_score
 
 # Model configuration
 model_id = "ibm-granite/granite-guardian-hap-38m"  # HAP small model
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
-# Load model and tokenizer
-tokenizer = AutoTokenizer.from_pretrained(model_id)
-model = AutoModelForSequenceClassification.from_pretrained(model_id).to(device).eval()
-
-# Load prompts
-prompts = load_prompts("prompts.json")
+device = None  # None picks CUDA when available, else CPU
+precision = "fp32"  # "bf16", or "int8" on CPU; check the drift against fp32 with precision.py first
+backend = "torch"  # "onnx" runs ONNX Runtime on a directory written by `python backends.py --output_dir ...`
 
 # Set the threshold for classification
 threshold = 0.75  # Default threshold for small HAP models
 
-# Process and score prompts
-results = {}
-for category, prompt_list in prompts.items():
-    results[category] = []
-    for prompt in prompt_list:
-        # Score the prompt using the HAP model
-        hap_scores = score_guardian_hap(device, [prompt], model, tokenizer)
+# Padded-token budget per batch; prompts are bucketed by length to minimise padding
+max_tokens = 32768
+
+def score_category(category, prompt_list, model, tokenizer, device):
+    """Scores one category of prompts and returns a result dict per prompt."""
+    # Score all prompts of the category using the HAP model
+    batch_stats = {}
+    hap_scores = score_guardian_hap(device, prompt_list, model, tokenizer, max_tokens=max_tokens, stats=batch_stats)
+    print(f"{category}: {batch_stats['batches']} batch(es), padding efficiency {batch_stats['padding_efficiency']:.1%}")
+    results = []
+    for prompt, hap_score in zip(prompt_list, hap_scores):
         # Aggregate the score
-        label, max_score = aggregate_score(hap_scores, threshold=threshold)
+        label, max_score = aggregate_score([hap_score], threshold=threshold)
         # Store the results
-        results[category].append({
+        results.append({
             "prompt": prompt,
             "hap_label": "Unsafe" if label == 1 else "Safe",
             "max_hap_score": max_score
         })
+    return results
+
+def main():
+    # Load model and tokenizer once per process (shared with anything else using the registry)
+    model, tokenizer = registry.get_model(model_id, "hap", device, precision=precision, backend=backend)
+    run_device = registry.default_device() if device is None else device
+
+    # Load prompts
+    prompts = load_prompts("prompts.json")
+
+    # Time to first verdict: one prompt on its own, before the categories are batched
+    first_prompt = next(prompt for prompt_list in prompts.values() for prompt in prompt_list)
+    score_guardian_hap(run_device, [first_prompt], model, tokenizer)
+    load = registry.loaded(model_id)[0]
+    print(f"Time to first verdict: {registry.elapsed():.2f}s "
+          f"(load {load['load_seconds']:.2f}s, warm-up {load['warmup_seconds'] or 0:.2f}s)")
+
+    # Process and score prompts
+    results = {}
+    for category, prompt_list in prompts.items():
+        results[category] = score_category(category, prompt_list, model, tokenizer, run_device)
+
+    # Print results
+    for category, test_results in results.items():
+        print(f"\nCategory: {category.upper()}")
+        for res in test_results:
+            print(f"Prompt: {res['prompt']}")
+            print(f"HAP Label: {res['hap_label']}")
+            print(f"Max HAP Score: {res['max_hap_score']:.3f}")
 
-# Print results
-for category, test_results in results.items():
-    print(f"\nCategory: {category.upper()}")
-    for res in test_results:
-        print(f"Prompt: {res['prompt']}")
-        print(f"HAP Label: {res['hap_label']}")
-        print(f"Max HAP Score: {res['max_hap_score']:.3f}")
+    # Accuracy on the categories with a known answer (ambiguous prompts have none)
+    labeled = [(res["max_hap_score"], 1 if category == "unsafe" else 0)
+               for category in ("safe", "unsafe") for res in results.get(category, [])]
+    if labeled:
+        scores, labels = zip(*labeled)
+        report = summarize(sweep(scores, labels, thresholds=[threshold]), threshold=threshold)["all"]
+        print(f"\nSafe vs unsafe at {threshold}: accuracy {report['accuracy']}, precision {report['precision']}, "
+              f"recall {report['recall']}, F1 {report['f1']}")
 
+if __name__ == "__main__":
+    main()
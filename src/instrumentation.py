@@ -0,0 +1,219 @@
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+
+import torch
+
+# Sinks receiving finished events; empty means instrumentation is off.
+_sinks = []
+_synchronize = False
+_profiling = False
+_local = threading.local()
+# Reused by every `stage` call while disabled, so the off path allocates nothing.
+_NULL_STAGE = nullcontext()
+
+def enable(*sinks, synchronize=False):
+    """
+    Turns instrumentation on.
+
+    Parameters:
+    - sinks: Callables receiving one event dict per batch (e.g. LogSink(), PrometheusSink(), list.append).
+    - synchronize: Whether to wait for queued CUDA kernels at the end of each stage, so
+      asynchronous GPU work is charged to the stage that launched it.
+    """
+    global _synchronize
+    _sinks[:] = sinks
+    _synchronize = synchronize and torch.cuda.is_available()
+
+def disable():
+    """Turns instrumentation off."""
+    _sinks.clear()
+    _local.event = None
+
+def enabled():
+    return bool(_sinks)
+
+@contextmanager
+def instrumented(*sinks, synchronize=False):
+    """Enables instrumentation with `sinks` for the duration of a `with` block."""
+    enable(*sinks, synchronize=synchronize)
+    try:
+        yield
+    finally:
+        disable()
+
+def begin(function, event="batch", lengths=None, **fields):
+    """
+    Starts recording an event (normally one batch) for the calling thread.
+
+    An event still open from an earlier `begin` is emitted first.
+
+    Parameters:
+    - function: str, name of the scoring function.
+    - event: str, kind of event ("batch", or "tokenize" for whole-call tokenization).
+    - lengths: Optional iterable of the batch's real token counts, expanded with `batch_fields`
+      only when instrumentation is on (pass a generator to keep the off path free).
+    - fields: Other metadata recorded with the event.
+    """
+    if not _sinks:
+        return
+    end()
+    if lengths is not None:
+        fields.update(batch_fields(list(lengths)))
+    _local.event = {"function": function, "event": event, **fields, "stages": {}, "start": time.perf_counter()}
+
+def stage(name):
+    """
+    Context manager timing one stage of the current event.
+
+    Stage names used by the scorers: "tokenize", "pad", "to_device", "forward", "postprocess".
+    Time spent in a stage entered twice within one event is summed.
+    """
+    if not _profiling and (not _sinks or getattr(_local, "event", None) is None):
+        return _NULL_STAGE
+    return _timed_stage(name)
+
+@contextmanager
+def _timed_stage(name):
+    start = time.perf_counter()
+    try:
+        if _profiling:
+            with torch.profiler.record_function(name):
+                yield
+        else:
+            yield
+    finally:
+        if _synchronize:
+            torch.cuda.synchronize()
+        event = getattr(_local, "event", None)
+        if event is not None:
+            event["stages"][name] = event["stages"].get(name, 0.0) + time.perf_counter() - start
+
+def end(lengths=None, **fields):
+    """Finishes the current event, adds `fields` (and `lengths`, as in `begin`) to it and sends it to every sink."""
+    if not _sinks:
+        return
+    event = getattr(_local, "event", None)
+    if event is None:
+        return
+    _local.event = None
+    if lengths is not None:
+        fields.update(batch_fields(list(lengths)))
+    event.update(fields)
+    event["seconds"] = time.perf_counter() - event.pop("start")
+    for sink in _sinks:
+        sink(event)
+
+def batch_fields(lengths, padded_len=None):
+    """
+    Describes the shape of one padded batch.
+
+    Parameters:
+    - lengths: List of real (unpadded) token counts of the batch items.
+    - padded_len: Padded sequence length (defaults to the longest item).
+
+    Returns:
+    - dict with batch_size, seq_len, tokens (real tokens processed), padded_tokens and
+      padding_ratio (fraction of the padded batch that is padding).
+    """
+    padded_len = padded_len if padded_len is not None else max(lengths, default=0)
+    padded_tokens = padded_len * len(lengths)
+    tokens = sum(lengths)
+    return {
+        "batch_size": len(lengths),
+        "seq_len": padded_len,
+        "tokens": tokens,
+        "padded_tokens": padded_tokens,
+        "padding_ratio": (padded_tokens - tokens) / padded_tokens if padded_tokens else 0.0,
+    }
+
+class LogSink:
+    """
+    Logs each event as one JSON line.
+
+    Parameters:
+    - logger: logging.Logger to write to (defaults to the "guardian.instrumentation" logger).
+    - level: Logging level of the records.
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("guardian.instrumentation")
+        self.level = level
+
+    def __call__(self, event):
+        self.logger.log(self.level, json.dumps(event, sort_keys=True))
+
+class PrometheusSink:
+    """
+    Aggregates events into counters and renders them in the Prometheus text exposition format.
+
+    Exposes, per scoring function: events, items and real/padded tokens, and per stage the
+    total seconds spent. Rates and mean stage latencies follow from these counters in PromQL.
+
+    Parameters:
+    - prefix: str, metric name prefix.
+    """
+
+    def __init__(self, prefix="guardian"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def __call__(self, event):
+        function, kind = event["function"], event["event"]
+        with self.lock:
+            self._add("events_total", {"function": function, "event": kind}, 1)
+            self._add("items_total", {"function": function, "event": kind}, event.get("batch_size", event.get("items", 0)))
+            self._add("tokens_total", {"function": function, "event": kind}, event.get("tokens", 0))
+            self._add("padded_tokens_total", {"function": function, "event": kind}, event.get("padded_tokens", 0))
+            for stage_name, seconds in event["stages"].items():
+                self._add("stage_seconds_total", {"function": function, "stage": stage_name}, seconds)
+                self._add("stage_calls_total", {"function": function, "stage": stage_name}, 1)
+
+    def render(self):
+        """Returns all counters as Prometheus exposition text."""
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {self.prefix}_{name} counter")
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+                        lines.append(f"{self.prefix}_{name}{{{label_text}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Writes the exposition text to `path` (e.g. for node_exporter's textfile collector)."""
+        with open(path, "w") as f:
+            f.write(self.render())
+
+    def _add(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+@contextmanager
+def profile(path, record_shapes=True, with_stack=False):
+    """
+    Records a torch profiler trace of the enclosed block for one-off deep dives.
+
+    The trace is written in Chrome trace format (open it in chrome://tracing or Perfetto).
+    Stages timed by `stage` show up as labelled ranges in the trace.
+
+    Parameters:
+    - path: str, output file for the trace.
+    - record_shapes: Whether to record operator input shapes.
+    - with_stack: Whether to record Python stacks (slower).
+    """
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    global _profiling
+    _profiling = True
+    try:
+        with torch.profiler.profile(activities=activities, record_shapes=record_shapes, with_stack=with_stack) as prof:
+            yield prof
+    finally:
+        _profiling = False
+    prof.export_chrome_trace(path)
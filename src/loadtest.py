@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+
+from utils import load_prompts
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+async def run_load(url, payloads, total_requests, concurrency, unix_socket=None):
+    """
+    Sends `total_requests` requests with `concurrency` in flight and times each one.
+
+    Parameters:
+    - url: Endpoint to POST to (e.g. http://127.0.0.1:8080/v1/hap).
+    - payloads: List of JSON bodies, cycled through.
+    - total_requests: Number of requests to send.
+    - concurrency: Number of requests in flight at once.
+    - unix_socket: Optional Unix socket path the server listens on.
+
+    Returns:
+    - dict with throughput, latency percentiles (ms) and status counts.
+    """
+    latencies, statuses = [], {}
+    counter = iter(range(total_requests))
+    connector = aiohttp.UnixConnector(path=unix_socket) if unix_socket else aiohttp.TCPConnector(limit=concurrency)
+
+    async def worker(session):
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                async with session.post(url, json=payloads[i % len(payloads)]) as response:
+                    await response.read()
+                    status = response.status
+            except aiohttp.ClientError as e:
+                status = type(e).__name__
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {"p50": percentile(latencies, 50), "p99": percentile(latencies, 99), "max": max(latencies, default=None)},
+        "statuses": {str(status): count for status, count in statuses.items()},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the guardian inference server.")
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:8080/v1/hap", help="Endpoint to load (/v1/hap or /v1/risk).")
+    parser.add_argument("--unix_socket", type=str, default=None, help="Unix socket the server listens on.")
+    parser.add_argument("--prompts_file", type=str, default="prompts.json", help="Prompts to send, cycled.")
+    parser.add_argument("--requests", type=int, default=1000, help="Total number of requests.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at once.")
+    args = parser.parse_args()
+
+    prompts = [prompt for prompt_list in load_prompts(args.prompts_file).values() for prompt in prompt_list]
+    if args.url.rstrip("/").endswith("/v1/risk"):
+        payloads = [{"messages": [{"role": "user", "content": prompt}]} for prompt in prompts]
+    else:
+        payloads = [{"text": prompt} for prompt in prompts]
+
+    report = asyncio.run(run_load(args.url, payloads, args.requests, args.concurrency, args.unix_socket))
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
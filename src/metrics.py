@@ -0,0 +1,233 @@
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+METRICS = ["precision", "recall", "f1", "fpr", "accuracy"]
+
+def load_scored(paths, score_field="hap_score", label=None, label_field=None, group_fields=("category",), stats=None):
+    """
+    Reads scored JSONL files (e.g. written by score_jsonl.py) into arrays.
+
+    Records whose score is null (e.g. `prob_of_risk` of a Failed guardian verdict) have
+    no prediction to evaluate and are skipped.
+
+    Parameters:
+    - paths: List of JSONL files.
+    - score_field: Record field holding the probability of unsafe content.
+    - label: 1 or 0 to label every record of these files (e.g. harmful vs benign sets).
+    - label_field: Record field holding the 0/1 label, when `label` is not given.
+    - group_fields: Record fields to break the metrics down by; missing values become "unknown".
+    - stats: Optional dict, updated with the "rows" read and the "null_scores" skipped.
+
+    Returns:
+    - (scores, labels, groups): float64 and int8 arrays and a dict of object arrays per group field.
+    """
+    scores, labels, groups = [], [], {field: [] for field in group_fields}
+    rows = null_scores = 0
+    for path in paths:
+        with open(path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                rows += 1
+                if record.get(score_field) is None:
+                    null_scores += 1
+                    continue
+                scores.append(record[score_field])
+                labels.append(label if label is not None else int(record[label_field]))
+                for field in group_fields:
+                    groups[field].append(str(record.get(field, "unknown")))
+    if stats is not None:
+        stats["rows"] = stats.get("rows", 0) + rows
+        stats["null_scores"] = stats.get("null_scores", 0) + null_scores
+    return (np.asarray(scores, dtype=np.float64), np.asarray(labels, dtype=np.int8),
+            {field: np.asarray(values, dtype=object) for field, values in groups.items()})
+
+def sweep(scores, labels, groups=None, thresholds=1001):
+    """
+    Confusion counts of every group at every threshold in one vectorized pass.
+
+    Each score is binned once against the sorted thresholds; a single bincount over
+    (group, label, bin) and a reverse cumulative sum then give, for all groups and
+    thresholds at once, how many items of each label score at or above each threshold.
+
+    Parameters:
+    - scores: 1-D array of probabilities of unsafe content.
+    - labels: 1-D array of 0/1 labels (1 = unsafe).
+    - groups: Optional 1-D array with the group of each item (None scores everything as one group).
+    - thresholds: Number of evenly spaced thresholds in [0, 1], or an increasing array of thresholds.
+
+    Returns:
+    - dict with "groups" (names), "thresholds", and "tp", "fp", "fn", "tn" arrays of shape
+      (groups, thresholds); an item is predicted unsafe when its score >= the threshold.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if np.isnan(scores).any():
+        # NaN sorts past every threshold and would count as unsafe everywhere.
+        raise ValueError(f"{int(np.isnan(scores).sum())} score(s) are NaN; drop unscored items before sweeping.")
+    labels = np.asarray(labels).astype(np.int64)
+    thresholds = np.linspace(0.0, 1.0, thresholds) if np.isscalar(thresholds) else np.asarray(thresholds, dtype=np.float64)
+    if groups is None:
+        names, codes = np.array(["all"], dtype=object), np.zeros(len(scores), dtype=np.int64)
+    else:
+        names, codes = np.unique(np.asarray(groups, dtype=object).astype(str), return_inverse=True)
+
+    # bins[i] = number of thresholds <= scores[i]: the item is predicted unsafe at thresholds[:bins[i]].
+    bins = np.searchsorted(thresholds, scores, side="right")
+    num_bins = len(thresholds) + 1
+    counts = np.bincount((codes * 2 + labels) * num_bins + bins, minlength=len(names) * 2 * num_bins)
+    counts = counts.reshape(len(names), 2, num_bins)
+    # at_or_above[..., j] = items whose bin is > j, i.e. predicted unsafe at thresholds[j].
+    at_or_above = np.cumsum(counts[:, :, ::-1], axis=2)[:, :, ::-1][:, :, 1:]
+    totals = counts.sum(axis=2, keepdims=True)
+    return {
+        "groups": names.tolist(),
+        "thresholds": thresholds,
+        "tp": at_or_above[:, 1],
+        "fp": at_or_above[:, 0],
+        "fn": totals[:, 1] - at_or_above[:, 1],
+        "tn": totals[:, 0] - at_or_above[:, 0],
+    }
+
+def rates(counts):
+    """
+    Derives precision, recall (TPR), F1, FPR and accuracy from `sweep` counts.
+
+    Undefined ratios (no predicted or no actual positives/negatives) are NaN.
+
+    Returns:
+    - dict of arrays shaped like the counts.
+    """
+    tp, fp, fn, tn = (counts[key].astype(np.float64) for key in ("tp", "fp", "fn", "tn"))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = tp / (tp + fp)
+        recall = tp / (tp + fn)
+        return {
+            "precision": precision,
+            "recall": recall,
+            "f1": 2 * tp / (2 * tp + fp + fn),
+            "fpr": fp / (fp + tn),
+            "accuracy": (tp + tn) / (tp + fp + fn + tn),
+        }
+
+def roc_auc(counts):
+    """
+    Area under the ROC curve per group, from the swept (FPR, TPR) points by the trapezoidal rule.
+
+    The thresholds span [0, 1], so the curve runs from (1, 1) at threshold 0 towards (0, 0);
+    the end points are added so partial grids still close the curve.
+    """
+    curves = rates(counts)
+    ones, zeros = np.ones((len(counts["groups"]), 1)), np.zeros((len(counts["groups"]), 1))
+    fpr = np.concatenate([ones, curves["fpr"], zeros], axis=1)
+    tpr = np.concatenate([ones, curves["recall"], zeros], axis=1)
+    # FPR falls as the threshold rises, so the integral comes out negative.
+    return -np.trapezoid(tpr, fpr, axis=1)
+
+def average_precision(counts):
+    """Area under the precision-recall curve per group (step-wise, as average precision)."""
+    curves = rates(counts)
+    recall = np.nan_to_num(curves["recall"])
+    precision = np.nan_to_num(curves["precision"], nan=1.0)
+    # Thresholds increase left to right, so recall only falls; each recall gained by lowering
+    # the threshold one step is weighted by the precision at the lower threshold.
+    gains = recall[:, :-1] - recall[:, 1:]
+    return (gains * precision[:, :-1]).sum(axis=1) + recall[:, -1] * precision[:, -1]
+
+def summarize(counts, threshold=0.5, metric="f1"):
+    """
+    Per-group report at a fixed threshold plus the threshold maximizing `metric`.
+
+    Parameters:
+    - counts: Output of `sweep`.
+    - threshold: Operating threshold to report the confusion matrix at (nearest swept one is used).
+    - metric: One of METRICS used to pick the best threshold ("fpr" is minimized).
+
+    Returns:
+    - dict per group with items, positives, the confusion matrix and metrics at `threshold`,
+      roc_auc, average_precision, and best {threshold, metric value, precision, recall}.
+    """
+    curves = rates(counts)
+    at = int(np.abs(counts["thresholds"] - threshold).argmin())
+    values = curves[metric]
+    if metric == "fpr":
+        best = np.where(np.isnan(values), np.inf, values).argmin(axis=1)
+    else:
+        best = np.where(np.isnan(values), -np.inf, values).argmax(axis=1)
+    aucs, aps = roc_auc(counts), average_precision(counts)
+    report = {}
+    for g, name in enumerate(counts["groups"]):
+        confusion = {key: int(counts[key][g, at]) for key in ("tp", "fp", "fn", "tn")}
+        report[name] = {
+            "items": sum(confusion.values()),
+            "positives": confusion["tp"] + confusion["fn"],
+            "threshold": float(counts["thresholds"][at]),
+            "confusion": confusion,
+            **{key: _number(curves[key][g, at]) for key in METRICS},
+            "roc_auc": _number(aucs[g]),
+            "average_precision": _number(aps[g]),
+            "best": {
+                "threshold": float(counts["thresholds"][best[g]]),
+                metric: _number(values[g, best[g]]),
+                "precision": _number(curves["precision"][g, best[g]]),
+                "recall": _number(curves["recall"][g, best[g]]),
+            },
+        }
+    return report
+
+def _number(value):
+    return None if np.isnan(value) else round(float(value), 6)
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-category confusion matrices, P/R/F1, ROC/PR and threshold sweeps for scored JSONL.")
+    parser.add_argument("--positive", nargs="*", default=[], help="Scored JSONL files whose records are all unsafe (label 1).")
+    parser.add_argument("--negative", nargs="*", default=[], help="Scored JSONL files whose records are all safe (label 0).")
+    parser.add_argument("--labeled", nargs="*", default=[], help="Scored JSONL files carrying their own --label_field.")
+    parser.add_argument("--label_field", type=str, default="label", help="0/1 label field of --labeled records.")
+    parser.add_argument("--score_field", type=str, default="hap_score", help="Probability field (e.g. hap_score, prob_of_risk).")
+    parser.add_argument("--group_fields", nargs="*", default=["category", "sub_category", "leaf_topic"],
+                        help="Record fields to break the metrics down by.")
+    parser.add_argument("--thresholds", type=int, default=1001, help="Number of thresholds swept over [0, 1].")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Operating threshold for the confusion matrices.")
+    parser.add_argument("--metric", choices=METRICS, default="f1", help="Metric the best threshold maximizes.")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report here (default: stdout).")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    load_stats = {}
+    parts = [load_scored(args.positive, args.score_field, label=1, group_fields=args.group_fields, stats=load_stats),
+             load_scored(args.negative, args.score_field, label=0, group_fields=args.group_fields, stats=load_stats),
+             load_scored(args.labeled, args.score_field, label_field=args.label_field, group_fields=args.group_fields,
+                         stats=load_stats)]
+    scores = np.concatenate([part[0] for part in parts])
+    labels = np.concatenate([part[1] for part in parts])
+    loaded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    report = {"skipped_null_scores": load_stats["null_scores"], "overall": summarize(sweep(scores, labels, thresholds=args.thresholds), args.threshold, args.metric)["all"]}
+    for field in args.group_fields:
+        groups = np.concatenate([part[2][field] for part in parts])
+        report[field] = summarize(sweep(scores, labels, groups, thresholds=args.thresholds), args.threshold, args.metric)
+    computed = time.perf_counter() - start
+
+    if load_stats["null_scores"]:
+        print(f"Skipped {load_stats['null_scores']} of {load_stats['rows']} rows with a null {args.score_field}",
+              file=sys.stderr)
+    print(f"{len(scores)} rows: loaded in {loaded:.2f}s, {args.thresholds} thresholds x "
+          f"{1 + len(args.group_fields)} breakdown(s) in {computed:.2f}s", file=sys.stderr)
+    overall = report["overall"]
+    print(f"Overall at {overall['threshold']:.3f}: precision {overall['precision']}, recall {overall['recall']}, "
+          f"F1 {overall['f1']}, ROC AUC {overall['roc_auc']}; best {args.metric} {overall['best'][args.metric]} "
+          f"at {overall['best']['threshold']:.3f}", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
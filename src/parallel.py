@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import multiprocessing
+from functools import partial
+
+import torch
+from transformers import AutoTokenizer
+
+from precision import PRECISIONS, load_model, load_reference_texts
+from token_cache import TokenizedCorpus, open_token_arrays, write_token_arrays
+from utils import padding_stats, plan_batches
+
+# State of a worker process: its rank, model, tokenizer and the token arrays it has open.
+_worker = {}
+
+def cpu_slots(rank, threads):
+    """
+    CPUs a worker is pinned to: consecutive blocks of `threads` available CPUs, one per rank.
+
+    Returns:
+    - List of CPU ids, or None where affinity cannot be set.
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    cpus = sorted(os.sched_getaffinity(0))
+    start = rank * threads
+    return [cpus[(start + i) % len(cpus)] for i in range(min(threads, len(cpus)))]
+
+def _init_worker(loader, threads, pin, counter):
+    with counter.get_lock():
+        rank = counter.value
+        counter.value += 1
+    cpus = cpu_slots(rank, threads) if pin else None
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:  # Already fixed once inter-op work has run
+        pass
+    model, tokenizer = loader()
+    _worker.update({"rank": rank, "model": model.eval(), "tokenizer": tokenizer, "directory": None})
+
+def _score_batch(task):
+    directory, indices = task
+    if _worker["directory"] != directory:
+        _worker["ids"], _worker["offsets"] = open_token_arrays(directory)
+        _worker["directory"] = directory
+    ids, offsets = _worker["ids"], _worker["offsets"]
+    features = [{"input_ids": ids[offsets[i]:offsets[i + 1]].tolist()} for i in indices]
+    inputs = _worker["tokenizer"].pad(features, padding=True, return_tensors="pt")
+    with torch.no_grad():
+        logits = _worker["model"](**inputs).logits
+    # HAP score = softmax logits, [1] = probability of "harmful"
+    return indices, torch.softmax(logits.float(), dim=1)[:, 1].tolist()
+
+class ScoringPool:
+    """
+    Data-parallel HAP scoring across worker processes on CPU.
+
+    Each worker loads the model once, pinned to its own block of `threads` CPUs with a fixed
+    torch thread count, so N small workers replace one process whose intra-op threading has
+    stopped scaling. Inputs are tokenized once in the parent and handed to the workers as
+    memory-mapped token arrays; only batch indices are pickled.
+
+    Parameters:
+    - loader: Picklable function returning (model, tokenizer) in a worker, e.g.
+      `functools.partial(precision.load_model, model_id, "hap", torch.device("cpu"))`.
+    - tokenizer: The same tokenizer, used in the parent process.
+    - workers: int, number of worker processes.
+    - threads: int, torch intra-op threads per worker.
+    - pin: Whether to pin each worker to its own CPUs (Linux only).
+    """
+
+    def __init__(self, loader, tokenizer, workers=2, threads=1, pin=True):
+        self.tokenizer = tokenizer
+        self.workers = workers
+        self.threads = threads
+        # Spawned workers start without the parent's OpenMP state and work on every platform.
+        context = multiprocessing.get_context("spawn")
+        self.pool = context.Pool(workers, initializer=_init_worker,
+                                 initargs=(loader, threads, pin, context.Value("i", 0)))
+
+    def score(self, data, batch_size=128, max_tokens=32768, max_length=512, stats=None):
+        """
+        Scores prompts with the workers, like `score_guardian_hap`.
+
+        Parameters:
+        - data: List of prompts, or a `token_cache.TokenizedCorpus` stored on disk
+        - batch_size, max_tokens, max_length: Batching as in `utils.iter_batches`
+        - stats: Optional dict, filled with the padding statistics of the run
+
+        Returns:
+        - List of HAP scores (probabilities of unsafe content), in input order
+        """
+        if not len(data):
+            return []
+        if isinstance(data, TokenizedCorpus) and data.directory is not None:
+            return self.score_token_arrays(data.directory, data.lengths, batch_size, max_tokens, stats)
+        if isinstance(data, TokenizedCorpus):
+            data = [data[i] for i in range(len(data))]  # In-memory corpus: written out below
+        # /dev/shm keeps the arrays in memory where it exists.
+        with tempfile.TemporaryDirectory(dir="/dev/shm" if os.path.isdir("/dev/shm") else None) as directory:
+            input_ids = data if not isinstance(data[0], str) else self.tokenizer(
+                data, max_length=max_length, truncation=True)["input_ids"]
+            lengths = write_token_arrays(input_ids, directory)
+            return self.score_token_arrays(directory, lengths, batch_size, max_tokens, stats)
+
+    def score_token_arrays(self, directory, lengths, batch_size=128, max_tokens=32768, stats=None):
+        """
+        Scores inputs already stored with `write_token_arrays`.
+
+        Batches are length-bucketed as in `utils.plan_batches` and dispatched most expensive
+        first, so no worker is left with a long batch at the end of the run.
+
+        Returns:
+        - List of HAP scores, in the order of `lengths`
+        """
+        batches = plan_batches(lengths, max_tokens=max_tokens, batch_size=batch_size)
+        if stats is not None:
+            stats.update(padding_stats(lengths, batches))
+        batches.sort(key=lambda batch: max(lengths[i] for i in batch) * len(batch), reverse=True)
+        scores = [None] * len(lengths)
+        for indices, batch_scores in self.pool.imap_unordered(_score_batch, [(directory, batch) for batch in batches]):
+            for index, score in zip(indices, batch_scores):
+                scores[index] = score
+        return scores
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def scaling_report(data, loader, tokenizer, worker_counts, threads=1, batch_size=32, max_tokens=32768, pin=True):
+    """
+    Measures throughput with each number of workers and the scaling efficiency relative to the first.
+
+    Pool start-up and model loading are excluded: every pool scores a warm-up slice first.
+
+    Parameters:
+    - data: List of prompts to score.
+    - loader, tokenizer, threads, pin: As for `ScoringPool`.
+    - worker_counts: Worker counts to measure, smallest (normally 1) first.
+    - batch_size, max_tokens: Batching as for `ScoringPool.score`.
+
+    Returns:
+    - List of dicts with workers, threads, seconds, items_per_sec, speedup and efficiency
+      (speedup divided by the relative increase in workers).
+    """
+    report = []
+    for workers in worker_counts:
+        with ScoringPool(loader, tokenizer, workers=workers, threads=threads, pin=pin) as pool:
+            pool.score(data[:batch_size * workers], batch_size=batch_size, max_tokens=max_tokens)  # Warm-up
+            start = time.perf_counter()
+            pool.score(data, batch_size=batch_size, max_tokens=max_tokens)
+            elapsed = time.perf_counter() - start
+        row = {"workers": workers, "threads": threads, "seconds": round(elapsed, 3),
+               "items_per_sec": round(len(data) / elapsed, 3)}
+        base = report[0] if report else row
+        row["speedup"] = round(row["items_per_sec"] / base["items_per_sec"], 3)
+        row["efficiency"] = round(row["speedup"] * base["workers"] / workers, 3)
+        report.append(row)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Report how HAP scoring throughput scales with worker processes.")
+    parser.add_argument("--model_id", type=str, default="ibm-granite/granite-guardian-hap-38m", help="HAP model to load.")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4, 8], help="Worker counts to measure.")
+    parser.add_argument("--threads", type=int, default=1, help="Torch intra-op threads per worker.")
+    parser.add_argument("--no_pin", action="store_true", help="Do not pin workers to CPUs.")
+    parser.add_argument("--prompts_file", type=str, default="prompts.json", help="Prompts to score ('' to skip).")
+    parser.add_argument("--jsonl", nargs="*", default=[], help="Additional JSONL files to score.")
+    parser.add_argument("--text_field", type=str, default="user", help="JSONL field holding the text.")
+    parser.add_argument("--repeat", type=int, default=1, help="Score the texts this many times per measurement.")
+    parser.add_argument("--batch_size", type=int, default=32, help="Maximum items per batch.")
+    parser.add_argument("--max_tokens", type=int, default=32768, help="Maximum padded tokens per batch.")
+    parser.add_argument("--precision", choices=PRECISIONS, default="fp32", help="Model precision in the workers.")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report here as well.")
+    args = parser.parse_args()
+
+    texts = load_reference_texts(args.prompts_file, args.jsonl, args.text_field) * args.repeat
+    tokenizer = AutoTokenizer.from_pretrained(args.model_id)
+    loader = partial(load_model, args.model_id, "hap", torch.device("cpu"), args.precision)
+    report = scaling_report(texts, loader, tokenizer, args.workers, threads=args.threads, batch_size=args.batch_size,
+                            max_tokens=args.max_tokens, pin=not args.no_pin)
+    print(f"{len(texts)} texts, {args.model_id}, {args.threads} thread(s) per worker, {os.cpu_count()} CPUs",
+          file=sys.stderr)
+    for row in report:
+        print(f"{row['workers']:>3} worker(s): {row['items_per_sec']:.1f} items/s, "
+              f"speedup {row['speedup']:.2f}x, efficiency {row['efficiency']:.0%}", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"model_id": args.model_id, "texts": len(texts), "report": report}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
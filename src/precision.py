@@ -0,0 +1,165 @@
+import gc
+import json
+import time
+import argparse
+
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification, AutoModelForCausalLM
+from transformers.utils import is_accelerate_available
+
+from utils import iter_jsonl, load_prompts, score_guardian_hap, strip_wrappers
+from utils2b import get_risk_token_ids, test_risk_batch
+
+PRECISIONS = ["fp32", "bf16", "int8"]
+
+def apply_precision(model, precision, device):
+    """
+    Converts a loaded fp32 model to the requested precision.
+
+    Parameters:
+    - model: Loaded model in fp32.
+    - precision: "fp32", "bf16" (bfloat16 weights and activations) or "int8" (dynamic int8
+      quantization of every nn.Linear; weights are quantized once, activations per batch).
+    - device: torch.device the model runs on; int8 is CPU-only.
+
+    Returns:
+    - The converted model in eval mode (int8 returns a new module).
+    """
+    if precision == "fp32":
+        model = model.float().eval()
+    elif precision == "bf16":
+        model = model.to(torch.bfloat16).eval()
+    elif precision == "int8":
+        if device.type != "cpu":
+            raise ValueError("Dynamic int8 quantization only runs on CPU.")
+        model = torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        raise ValueError(f"Unknown precision {precision!r}; expected one of {PRECISIONS}.")
+    # Part of `VerdictCache.make_key`: int8 keeps fp32 parameters outside the quantized Linears.
+    model.guardian_precision = precision
+    return model
+
+def load_model(model_id, kind, device, precision="fp32"):
+    """
+    Loads a Granite Guardian model and tokenizer at the requested precision.
+
+    Parameters:
+    - model_id: Hub id or local path of the model.
+    - kind: "hap" for the sequence classifiers, "guardian" for the causal Guardian models.
+    - device: torch.device
+    - precision: "fp32", "bf16" or "int8" (see `apply_precision`).
+
+    Returns:
+    - (model, tokenizer)
+    """
+    model_class = AutoModelForSequenceClassification if kind == "hap" else AutoModelForCausalLM
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    # bf16 weights are loaded directly so the fp32 copy never has to fit in memory.
+    dtype = torch.bfloat16 if precision == "bf16" else torch.float32
+    # from_pretrained prefers model.safetensors, which it memory-maps; low_cpu_mem_usage (needs
+    # accelerate) then skips the random initialisation and the second copy of the weights.
+    model = model_class.from_pretrained(model_id, torch_dtype=dtype, low_cpu_mem_usage=is_accelerate_available())
+    model = apply_precision(model, precision, device).to(device)
+    if kind == "guardian":
+        get_risk_token_ids(tokenizer)
+    return model, tokenizer
+
+def score_texts(texts, kind, model, tokenizer, device, batch_size=32, threshold=0.75):
+    """
+    Scores texts with either model kind.
+
+    Returns:
+    - (probabilities, labels): Probability of unsafe content and a 0/1 label per text. HAP
+      labels apply `threshold`; guardian labels are the model's Yes/No verdict.
+    """
+    if kind == "hap":
+        probs = score_guardian_hap(device, texts, model, tokenizer, batch_size=batch_size)
+        return probs, [1 if prob >= threshold else 0 for prob in probs]
+    verdicts = test_risk_batch([[{"role": "user", "content": text}] for text in texts], model, tokenizer, device,
+                               batch_size=batch_size, mode="verdict")
+    return [prob for _, prob in verdicts], [1 if label == "Yes" else 0 for label, _ in verdicts]
+
+def drift_report(texts, kind, get_model, tokenizer, device, precisions=PRECISIONS, batch_size=32, threshold=0.75):
+    """
+    Scores a reference set in every precision and compares each against fp32.
+
+    Parameters:
+    - texts: List of reference texts.
+    - kind: "hap" or "guardian".
+    - get_model: Function mapping a precision to a model loaded in it; models are
+      built one at a time and released before the next.
+    - tokenizer: Tokenizer shared by all precisions.
+    - device: torch.device
+    - precisions: Precisions to report; fp32 is always scored as the reference.
+    - batch_size, threshold: As for `score_texts`.
+
+    Returns:
+    - dict per precision with items, items_per_sec, max_delta and mean_delta (absolute
+      probability difference to fp32), label_flips and flip_rate.
+    """
+    precisions = ["fp32"] + [precision for precision in precisions if precision != "fp32"]
+    reference, report = None, {}
+    for precision in precisions:
+        model = get_model(precision)
+        score_texts(texts[:batch_size], kind, model, tokenizer, device, batch_size=batch_size, threshold=threshold)  # Warm-up
+        start = time.perf_counter()
+        probs, labels = score_texts(texts, kind, model, tokenizer, device, batch_size=batch_size, threshold=threshold)
+        elapsed = time.perf_counter() - start
+        del model
+        gc.collect()
+
+        if reference is None:
+            reference = (probs, labels)
+        deltas = [abs(prob - ref) for prob, ref in zip(probs, reference[0])]
+        flips = sum(label != ref for label, ref in zip(labels, reference[1]))
+        report[precision] = {
+            "items": len(texts),
+            "items_per_sec": len(texts) / elapsed if elapsed else None,
+            "max_delta": max(deltas, default=0.0),
+            "mean_delta": sum(deltas) / len(deltas) if deltas else 0.0,
+            "label_flips": flips,
+            "flip_rate": flips / len(texts) if texts else 0.0,
+        }
+    return report
+
+def load_reference_texts(prompts_file="prompts.json", jsonl_files=(), text_field="user"):
+    """Collects the reference set: every prompt in `prompts_file` plus the `text_field` of each JSONL record."""
+    texts = [prompt for prompt_list in load_prompts(prompts_file).values() for prompt in prompt_list] if prompts_file else []
+    for path in jsonl_files:
+        texts.extend(strip_wrappers(record[text_field]) for _, record in iter_jsonl(path))
+    return texts
+
+def main():
+    parser = argparse.ArgumentParser(description="Report probability drift and label flips of reduced-precision modes against fp32.")
+    parser.add_argument("--kind", choices=["hap", "guardian"], default="hap", help="Model type to check.")
+    parser.add_argument("--model_id", type=str, default=None, help="Model to load (defaults to hap-38m or guardian-3.0-2b).")
+    parser.add_argument("--precisions", nargs="+", choices=PRECISIONS, default=PRECISIONS, help="Precisions to compare.")
+    parser.add_argument("--prompts_file", type=str, default="prompts.json", help="Reference prompts ('' to skip).")
+    parser.add_argument("--jsonl", nargs="*", default=[], help="Additional JSONL reference files.")
+    parser.add_argument("--text_field", type=str, default="user", help="JSONL field holding the text.")
+    parser.add_argument("--batch_size", type=int, default=32, help="Batch size for inference.")
+    parser.add_argument("--threshold", type=float, default=0.75, help="Decision threshold for HAP scores.")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report here as well.")
+    args = parser.parse_args()
+
+    model_id = args.model_id or {
+        "hap": "ibm-granite/granite-guardian-hap-38m",
+        "guardian": "ibm-granite/granite-guardian-3.0-2b",
+    }[args.kind]
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    precisions = [precision for precision in args.precisions if device.type == "cpu" or precision != "int8"]
+    texts = load_reference_texts(args.prompts_file, args.jsonl, args.text_field)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+
+    report = drift_report(texts, args.kind, lambda precision: load_model(model_id, args.kind, device, precision)[0],
+                          tokenizer, device, precisions=precisions, batch_size=args.batch_size, threshold=args.threshold)
+    print(f"{len(texts)} reference texts, {model_id} on {device}")
+    for precision, row in report.items():
+        print(f"{precision:>5}: {row['items_per_sec']:.1f} items/s, max delta {row['max_delta']:.4f}, "
+              f"mean delta {row['mean_delta']:.4f}, {row['label_flips']} label flip(s) ({row['flip_rate']:.1%})")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"model_id": model_id, "device": str(device), "report": report}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
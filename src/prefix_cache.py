@@ -0,0 +1,206 @@
+import json
+from collections import OrderedDict
+
+import torch
+from transformers import DynamicCache
+
+from utils2b import parse_batch_verdict
+
+# Stand-in message content used to locate where the conversation starts in the template.
+CONTENT_SENTINEL = "[[GUARDIAN_CONTENT_SENTINEL]]"
+
+def score_suffixes(model, past_key_values, prefix_len, suffixes, pad_token_id, device):
+    """
+    Runs a batch of token suffixes on top of a shared, already-encoded prefix.
+
+    The prefix key/values are broadcast across the batch and the suffixes are
+    right-padded, so every real token keeps its position after the prefix.
+
+    Parameters:
+    - model: Pretrained model (causal LM).
+    - past_key_values: Legacy (key, value) tuples for the prefix, batch size 1.
+    - prefix_len: Number of tokens in the prefix.
+    - suffixes: List of token id lists, one per batch row (each non-empty).
+    - pad_token_id: Token id used to pad the suffixes.
+    - device: Device to run the model on (CPU/GPU).
+
+    Returns:
+    - Next-token logits after the last token of each suffix, shape (batch, vocab).
+    """
+    batch, max_len = len(suffixes), max(len(ids) for ids in suffixes)
+    input_ids = torch.full((batch, max_len), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((batch, prefix_len + max_len), dtype=torch.long)
+    attention_mask[:, :prefix_len] = 1
+    for row, ids in enumerate(suffixes):
+        input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, prefix_len:prefix_len + len(ids)] = 1
+    position_ids = torch.arange(prefix_len, prefix_len + max_len).expand(batch, max_len)
+
+    past = None
+    if prefix_len:
+        past = DynamicCache.from_legacy_cache(tuple(
+            (key.expand(batch, *key.shape[1:]), value.expand(batch, *value.shape[1:]))
+            for key, value in past_key_values
+        ))
+    with torch.no_grad():
+        logits = model(
+            input_ids.to(device),
+            attention_mask=attention_mask.to(device),
+            position_ids=position_ids.to(device),
+            past_key_values=past,
+            use_cache=past is not None,
+        ).logits
+    last = torch.tensor([len(ids) - 1 for ids in suffixes], device=logits.device)
+    return logits[torch.arange(batch, device=logits.device), last]
+
+def encode_prefix(model, prefix_ids, device):
+    """
+    Encodes a token prefix once and returns its key/values as legacy tuples.
+
+    Parameters:
+    - model: Pretrained model (causal LM).
+    - prefix_ids: List of token ids.
+    - device: Device to run the model on (CPU/GPU).
+
+    Returns:
+    - Tuple of (key, value) tensors per layer, batch size 1.
+    """
+    with torch.no_grad():
+        output = model(torch.tensor([prefix_ids], dtype=torch.long, device=device), use_cache=True)
+    past = output.past_key_values
+    return past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else past
+
+class PrefixCache:
+    """
+    Bounded LRU of encoded chat-template prefixes for verdict-mode risk scoring.
+
+    The template text that precedes the first message depends only on the
+    `guardian_config` and the first message's role, so its key/values are computed
+    once and each request only runs the model over its own suffix. With the Granite
+    Guardian 3.0 template the risk definition follows the conversation, so the shared
+    prefix is the instruction preamble; `test_risks` covers the per-risk suffixes.
+
+    Parameters:
+    - model: Pretrained model (causal LM).
+    - tokenizer: Tokenizer for the model.
+    - device: Device to run the model on (CPU/GPU).
+    - max_entries: Maximum number of encoded prefixes kept in memory.
+    """
+
+    def __init__(self, model, tokenizer, device, max_entries=16):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.prefix_ids = {}
+        self.stats = {"hits": 0, "misses": 0, "prefix_tokens_saved": 0}
+
+    def template_prefix(self, messages, guardian_config=None):
+        """Token ids of the template text that comes before the first message's content."""
+        key = (json.dumps(guardian_config, sort_keys=True), messages[0]["role"])
+        if key not in self.prefix_ids:
+            placeholder = [{"role": messages[0]["role"], "content": CONTENT_SENTINEL}]
+            text = self.tokenizer.apply_chat_template(
+                placeholder, guardian_config=guardian_config, add_generation_prompt=True, tokenize=False
+            )
+            ids = self.tokenizer(text.split(CONTENT_SENTINEL)[0], add_special_tokens=False)["input_ids"]
+            # The last prefix token may merge differently with the content; leave it in the suffix.
+            self.prefix_ids[key] = ids[:-1]
+        return self.prefix_ids[key]
+
+    def get(self, prefix_ids):
+        """Returns the encoded key/values for a prefix, computing and caching them on a miss."""
+        key = tuple(prefix_ids)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return self.entries[key]
+        self.stats["misses"] += 1
+        past_key_values = encode_prefix(self.model, prefix_ids, self.device)
+        self.entries[key] = past_key_values
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return past_key_values
+
+    def score_batch(self, messages_list, guardian_configs=None, batch_size=8):
+        """
+        Verdict-mode risk scoring that reuses the cached template prefixes.
+
+        Parameters:
+        - messages_list: List of message lists (one conversation per item).
+        - guardian_configs: Optional configuration shared by all items, or a list with one per item.
+        - batch_size: Number of conversations run per forward pass.
+
+        Returns:
+        - List of (label, prob_of_risk) tuples in the order of `messages_list`.
+        """
+        if guardian_configs is None or isinstance(guardian_configs, dict):
+            guardian_configs = [guardian_configs] * len(messages_list)
+        pad_token_id = self.tokenizer.pad_token_id
+        if pad_token_id is None:
+            pad_token_id = self.tokenizer.eos_token_id
+
+        groups = OrderedDict()
+        for index, (messages, config) in enumerate(zip(messages_list, guardian_configs)):
+            input_ids = self.tokenizer.apply_chat_template(messages, guardian_config=config, add_generation_prompt=True)
+            prefix_ids = self.template_prefix(messages, config)
+            if input_ids[:len(prefix_ids)] != prefix_ids:
+                prefix_ids = []
+            groups.setdefault(tuple(prefix_ids), []).append((index, input_ids[len(prefix_ids):]))
+
+        results = [None] * len(messages_list)
+        for prefix_ids, items in groups.items():
+            past_key_values = self.get(prefix_ids) if prefix_ids else None
+            for i in range(0, len(items), batch_size):
+                batch = items[i:i + batch_size]
+                logits = score_suffixes(
+                    self.model, past_key_values, len(prefix_ids), [ids for _, ids in batch], pad_token_id, self.device
+                )
+                for (index, _), verdict in zip(batch, parse_batch_verdict(logits, self.tokenizer)):
+                    results[index] = verdict
+                self.stats["prefix_tokens_saved"] += len(prefix_ids) * len(batch)
+        return results
+
+def test_risks(messages, risk_names, model, tokenizer, device):
+    """
+    Evaluates one conversation against several risk definitions in a single pass.
+
+    The per-risk prompts share every token up to where the templates diverge (for
+    Granite Guardian 3.0, the whole conversation). That common prefix is encoded once
+    and the risk-specific suffixes are run together as one batch.
+
+    Parameters:
+    - messages: List of messages (prompt) to evaluate.
+    - risk_names: List of risk names (e.g. "harm", "jailbreak"), or guardian_config dicts with a "risk_name".
+    - model: Pretrained model (causal LM).
+    - tokenizer: Tokenizer for the model.
+    - device: Device to run the model on (CPU/GPU).
+
+    Returns:
+    - dict mapping each risk name to its (label, prob_of_risk) verdict ({} for no risks).
+    """
+    configs = [{"risk_name": risk} if isinstance(risk, str) else risk for risk in risk_names]
+    if not configs:
+        return {}
+    for config in configs:
+        if not isinstance(config, dict) or "risk_name" not in config:
+            raise ValueError(f"Each risk must be a name or a guardian_config dict with a 'risk_name'; got {config!r}.")
+    encoded = [
+        tokenizer.apply_chat_template(messages, guardian_config=config, add_generation_prompt=True)
+        for config in configs
+    ]
+
+    # Longest common token prefix, keeping at least one token in every suffix.
+    prefix_len = min(len(ids) for ids in encoded) - 1
+    for position in range(prefix_len):
+        if any(ids[position] != encoded[0][position] for ids in encoded[1:]):
+            prefix_len = position
+            break
+
+    past_key_values = encode_prefix(model, encoded[0][:prefix_len], device) if prefix_len else None
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    logits = score_suffixes(
+        model, past_key_values, prefix_len, [ids[prefix_len:] for ids in encoded], pad_token_id, device
+    )
+    return dict(zip([config["risk_name"] for config in configs], parse_batch_verdict(logits, tokenizer)))
@@ -0,0 +1,145 @@
+import gc
+import sys
+import json
+import time
+import argparse
+import threading
+
+# Taken when the registry is first imported; runners import it before anything heavy, so
+# `elapsed()` counts the torch/transformers imports as part of the cold start.
+_started = time.perf_counter()
+
+# Loaded models, keyed by everything that changes the loaded weights. torch, transformers
+# and the scoring modules are imported on first use, so importing the registry is free.
+_models = {}
+_lock = threading.Lock()
+
+WARMUP_TEXTS = [
+    "A short warm-up prompt.",
+    "A somewhat longer warm-up prompt, so the first real batch is not the first padded one either.",
+]
+
+def elapsed():
+    """Seconds since the registry was imported (normally process start)."""
+    return time.perf_counter() - _started
+
+def default_device():
+    import torch
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+def get_model(model_id, kind, device=None, precision="fp32", backend="torch", warmup=True):
+    """
+    Returns the (model, tokenizer) pair for a model, loading it on first use.
+
+    Every later call in the process with the same settings gets the same objects, so
+    runners, the cascade and the server share one copy. Weights load through
+    `precision.load_model` (memory-mapped safetensors with low-memory loading) or, for
+    `backend="onnx"`, `backends.load_hap_backend`.
+
+    Parameters:
+    - model_id: Hub id or local path of the model.
+    - kind: "hap" for the sequence classifiers, "guardian" for the causal Guardian models.
+    - device: torch.device (defaults to CUDA when available, else CPU).
+    - precision: "fp32", "bf16" or "int8".
+    - backend: "torch" or "onnx" (HAP only).
+    - warmup: Whether to score one small batch before returning, the first time.
+
+    Returns:
+    - (model, tokenizer)
+    """
+    device = device if device is not None else default_device()
+    key = (model_id, kind, str(device), precision, backend)
+    # One lock for all models: concurrent first calls load once instead of racing.
+    with _lock:
+        entry = _models.get(key)
+        if entry is None:
+            start = time.perf_counter()
+            if backend == "onnx":
+                from backends import load_hap_backend
+                model, tokenizer = load_hap_backend(model_id, "onnx")
+            else:
+                from precision import load_model
+                model, tokenizer = load_model(model_id, kind, device, precision=precision)
+            entry = _models[key] = {
+                "model": model,
+                "tokenizer": tokenizer,
+                "info": {"model_id": model_id, "kind": kind, "device": str(device), "precision": precision,
+                         "backend": backend, "load_seconds": time.perf_counter() - start, "warmup_seconds": None},
+            }
+        if warmup and entry["info"]["warmup_seconds"] is None:
+            start = time.perf_counter()
+            warm_up(entry["model"], entry["tokenizer"], kind, device)
+            entry["info"]["warmup_seconds"] = time.perf_counter() - start
+    return entry["model"], entry["tokenizer"]
+
+def warm_up(model, tokenizer, kind, device):
+    """
+    Scores one small batch so one-off costs (kernel selection, allocator growth, lazy
+    initialisation in the libraries) are paid before the first real request.
+    """
+    if kind == "hap":
+        from utils import score_guardian_hap
+        score_guardian_hap(device, WARMUP_TEXTS, model, tokenizer)
+    else:
+        from utils2b import test_risk_batch
+        test_risk_batch([[{"role": "user", "content": text}] for text in WARMUP_TEXTS], model, tokenizer, device,
+                        mode="verdict")
+
+def loaded(model_id=None):
+    """Settings and load/warm-up timings of every model held by the registry (or every copy of `model_id`)."""
+    with _lock:
+        return [dict(entry["info"]) for key, entry in _models.items() if model_id is None or key[0] == model_id]
+
+def release(model_id=None):
+    """Drops every model (or every copy of `model_id`) from the registry so its memory can be freed."""
+    with _lock:
+        for key in [key for key in _models if model_id is None or key[0] == model_id]:
+            del _models[key]
+    gc.collect()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the time to first verdict of a cold process.")
+    parser.add_argument("--model_id", type=str, default="ibm-granite/granite-guardian-hap-38m", help="Model to load.")
+    parser.add_argument("--kind", choices=["hap", "guardian"], default="hap", help="Model type.")
+    parser.add_argument("--precision", type=str, default="fp32", help="Model precision.")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch", help="HAP inference backend.")
+    parser.add_argument("--no_warmup", action="store_true", help="Skip the warm-up batch.")
+    parser.add_argument("--prompt", type=str, default="How can I hide my location online for privacy reasons?",
+                        help="Prompt scored for the first verdict.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    # Timed on their own: importing the libraries is part of every cold start.
+    import torch
+    import transformers
+    import_seconds = time.perf_counter() - start
+    device = default_device()
+    model, tokenizer = get_model(args.model_id, args.kind, device, precision=args.precision, backend=args.backend,
+                                 warmup=not args.no_warmup)
+
+    def verdict():
+        begin = time.perf_counter()
+        if args.kind == "hap":
+            from utils import score_guardian_hap
+            score_guardian_hap(device, [args.prompt], model, tokenizer)
+        else:
+            from utils2b import test_risk
+            test_risk([{"role": "user", "content": args.prompt}], model, tokenizer, device, mode="verdict")
+        return time.perf_counter() - begin
+
+    first_verdict_seconds = verdict()
+    report = {
+        **loaded(args.model_id)[0],
+        "import_seconds": import_seconds,
+        "first_verdict_seconds": first_verdict_seconds,
+        "time_to_first_verdict": elapsed(),
+        "warm_verdict_seconds": verdict(),
+    }
+    print(json.dumps({key: round(value, 4) if isinstance(value, float) else value for key, value in report.items()},
+                     indent=2))
+    print(f"Time to first verdict: {report['time_to_first_verdict']:.2f}s (imports {import_seconds:.2f}s, "
+          f"load {report['load_seconds']:.2f}s, warm-up {report['warmup_seconds'] or 0:.2f}s, "
+          f"verdict {first_verdict_seconds * 1000:.1f} ms)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
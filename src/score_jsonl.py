@@ -0,0 +1,137 @@
+import os
+import json
+import argparse
+from functools import partial
+
+import torch
+from transformers import AutoTokenizer
+
+from parallel import ScoringPool
+from precision import PRECISIONS, load_model
+from utils import iter_jsonl, score_guardian_hap, strip_wrappers
+from utils2b import test_risk_batch
+
+def load_checkpoint(path):
+    """Returns the saved checkpoint dict, or a fresh one if none exists."""
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {"input_offset": 0, "output_offset": 0, "records": 0}
+
+def save_checkpoint(path, checkpoint):
+    """Writes the checkpoint atomically so a crash never leaves it half-written."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def score_records(records, kind, device, model, tokenizer, threshold=0.75, include_assistant=False, batch_size=32,
+                  pool=None):
+    """
+    Scores one batch of generated records and returns them with the verdict fields added.
+
+    Parameters:
+    - records: List of dicts with "user" (and optionally "assistant") fields.
+    - kind: "hap" for a sequence classifier, "guardian" for a Granite Guardian causal LM.
+    - device, model, tokenizer: Loaded model to score with.
+    - threshold: Decision threshold for HAP scores.
+    - include_assistant: Whether the guardian also sees the assistant turn.
+    - batch_size: Batch size for inference.
+    - pool: Optional `parallel.ScoringPool` scoring HAP batches in worker processes instead of `model`.
+
+    Returns:
+    - List of output records.
+    """
+    users = [strip_wrappers(record["user"]) for record in records]
+    if kind == "hap":
+        if pool is not None:
+            scores = pool.score(users, batch_size=batch_size)
+        else:
+            scores = score_guardian_hap(device, users, model, tokenizer, batch_size=batch_size)
+        return [{**record, "hap_score": score, "hap_label": 1 if score >= threshold else 0}
+                for record, score in zip(records, scores)]
+
+    messages_list = []
+    for record, user in zip(records, users):
+        messages = [{"role": "user", "content": user}]
+        if include_assistant and record.get("assistant"):
+            messages.append({"role": "assistant", "content": strip_wrappers(record["assistant"])})
+        messages_list.append(messages)
+    verdicts = test_risk_batch(messages_list, model, tokenizer, device, batch_size=batch_size, mode="verdict")
+    return [{**record, "risk_label": label, "prob_of_risk": prob} for record, (label, prob) in zip(records, verdicts)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a generated JSONL corpus in batches, resumably.")
+    parser.add_argument("--input_file", type=str, required=True, help="JSONL corpus with 'user'/'assistant' fields.")
+    parser.add_argument("--output_file", type=str, required=True, help="JSONL file the scored records are appended to.")
+    parser.add_argument("--kind", choices=["hap", "guardian"], default="hap", help="Model type to score with.")
+    parser.add_argument("--model_id", type=str, default=None, help="Model to load (defaults to hap-38m or guardian-3.0-2b).")
+    parser.add_argument("--batch_size", type=int, default=32, help="Records scored and written per batch (per worker with --workers).")
+    parser.add_argument("--threshold", type=float, default=0.75, help="Decision threshold for HAP scores.")
+    parser.add_argument("--include_assistant", action="store_true", help="Let the guardian see the assistant turn too.")
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint instead of starting over.")
+    parser.add_argument("--precision", choices=PRECISIONS, default="fp32", help="Model precision (int8 is CPU-only).")
+    parser.add_argument("--workers", type=int, default=1, help="HAP scoring processes on CPU (1 scores in-process).")
+    parser.add_argument("--threads", type=int, default=1, help="Torch threads per worker with --workers.")
+    args = parser.parse_args()
+    if args.workers > 1 and args.kind != "hap":
+        parser.error("--workers only applies to --kind hap")
+
+    checkpoint_path = f"{args.output_file}.checkpoint.json"
+    if not args.resume and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)  # Start over: the output file is truncated below
+    checkpoint = load_checkpoint(checkpoint_path)
+    if args.resume:
+        print(f"Resuming after {checkpoint['records']} records (input byte {checkpoint['input_offset']})")
+
+    model_id = args.model_id or {
+        "hap": "ibm-granite/granite-guardian-hap-38m",
+        "guardian": "ibm-granite/granite-guardian-3.0-2b",
+    }[args.kind]
+    pool = None
+    if args.workers > 1:
+        device, model = torch.device("cpu"), None
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        pool = ScoringPool(partial(load_model, model_id, "hap", device, args.precision), tokenizer,
+                           workers=args.workers, threads=args.threads)
+    else:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        model, tokenizer = load_model(model_id, args.kind, device, precision=args.precision)
+    # Each flush gives every worker about one batch.
+    flush_size = args.batch_size * args.workers
+
+    with open(args.output_file, "ab") as output:
+        # Drop anything written after the last checkpoint (a partially flushed batch).
+        output.truncate(checkpoint["output_offset"])
+        batch, batch_end = [], checkpoint["input_offset"]
+
+        def flush():
+            scored = score_records(batch, args.kind, device, model, tokenizer, threshold=args.threshold,
+                                   include_assistant=args.include_assistant, batch_size=args.batch_size, pool=pool)
+            output.write("".join(json.dumps(record) + "\n" for record in scored).encode("utf-8"))
+            output.flush()
+            os.fsync(output.fileno())
+            checkpoint.update({
+                "input_offset": batch_end,
+                "output_offset": output.tell(),
+                "records": checkpoint["records"] + len(batch),
+            })
+            save_checkpoint(checkpoint_path, checkpoint)
+            print(f"Scored {checkpoint['records']} records")
+
+        for batch_end, record in iter_jsonl(args.input_file, checkpoint["input_offset"]):
+            batch.append(record)
+            if len(batch) == flush_size:
+                flush()
+                batch = []
+        if batch:
+            flush()
+    if pool is not None:
+        pool.close()
+
+    print(f"Results written to {args.output_file}")
+
+if __name__ == "__main__":
+    main()
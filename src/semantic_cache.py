@@ -0,0 +1,211 @@
+import sys
+import json
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+
+class SemanticCache:
+    """
+    Bounded approximate cache of 2B verdicts, looked up by HAP embedding similarity.
+
+    Embeddings are the L2-normalised pooled states `score_guardian_hap` returns with
+    `embeddings=[]`, so a lookup costs no extra model call. They are indexed with
+    random-hyperplane LSH: each of `num_tables` tables hashes a vector to the signs of
+    `num_bits` random projections, and vectors with a high cosine similarity share a
+    bucket in at least one table with high probability. A lookup takes the exact cosine
+    similarity to the candidates from its buckets and hits only when the nearest one is
+    at least `threshold` similar. Only confident verdicts are stored, and the least
+    recently used entry is evicted at `max_entries`.
+
+    Keep one cache per guardian model and guardian_config: entries do not record them.
+
+    Parameters:
+    - dim: int, embedding size (the HAP model's hidden size).
+    - threshold: Minimum cosine similarity for a hit.
+    - num_tables: Number of LSH tables (more tables find more near neighbours).
+    - num_bits: Hyperplanes per table (more bits give smaller, more similar buckets).
+    - max_entries: Maximum number of cached verdicts.
+    - min_confidence: Minimum probability of the verdict's own label for it to be stored.
+    - seed: int, seed of the random hyperplanes.
+    """
+
+    def __init__(self, dim, threshold=0.97, num_tables=8, num_bits=12, max_entries=100000, min_confidence=0.9, seed=0):
+        self.dim = dim
+        self.threshold = threshold
+        self.num_tables = num_tables
+        self.num_bits = num_bits
+        self.max_entries = max_entries
+        self.min_confidence = min_confidence
+        self.planes = np.random.default_rng(seed).standard_normal((dim, num_tables * num_bits)).astype(np.float32)
+        self.bit_weights = 1 << np.arange(num_bits, dtype=np.int64)
+        self.vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self.verdicts = [None] * max_entries
+        self.slot_keys = [None] * max_entries
+        self.tables = [{} for _ in range(num_tables)]
+        # Slots in least- to most-recently used order; freed slots are reused first.
+        self.lru = OrderedDict()
+        self.free = list(range(max_entries - 1, -1, -1))
+        self.stats = {"lookups": 0, "hits": 0, "inserts": 0, "skipped": 0, "evictions": 0}
+
+    def __len__(self):
+        return len(self.lru)
+
+    def bucket_keys(self, embeddings):
+        """LSH bucket of each embedding in every table, shape (items, num_tables)."""
+        bits = (embeddings @ self.planes) > 0
+        return bits.reshape(len(bits), self.num_tables, self.num_bits) @ self.bit_weights
+
+    def lookup(self, embeddings):
+        """
+        Finds cached verdicts for a batch of embeddings.
+
+        Returns:
+        - List with, per embedding, (verdict, similarity) of the nearest cached neighbour if it
+          is at least `threshold` similar, else None.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        results = []
+        for vector, keys in zip(embeddings, self.bucket_keys(embeddings)):
+            self.stats["lookups"] += 1
+            candidates = set()
+            for table, key in zip(self.tables, keys):
+                candidates.update(table.get(int(key), ()))
+            if not candidates:
+                results.append(None)
+                continue
+            slots = np.fromiter(candidates, dtype=np.int64)
+            similarities = self.vectors[slots] @ vector
+            best = int(similarities.argmax())
+            if similarities[best] < self.threshold:
+                results.append(None)
+                continue
+            slot = int(slots[best])
+            self.lru.move_to_end(slot)
+            self.stats["hits"] += 1
+            results.append((self.verdicts[slot], float(similarities[best])))
+        return results
+
+    def add(self, embeddings, verdicts):
+        """
+        Stores (label, prob_of_risk) verdicts from the 2B model under their prompts' embeddings.
+
+        Verdicts that failed or whose label has less than `min_confidence` probability are skipped.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        for vector, keys, verdict in zip(embeddings, self.bucket_keys(embeddings), verdicts):
+            if not self.confident(verdict):
+                self.stats["skipped"] += 1
+                continue
+            if not self.free:
+                self._evict(next(iter(self.lru)))
+            slot = self.free.pop()
+            self.vectors[slot] = vector
+            self.verdicts[slot] = tuple(verdict)
+            self.slot_keys[slot] = [int(key) for key in keys]
+            for table, key in zip(self.tables, self.slot_keys[slot]):
+                table.setdefault(key, set()).add(slot)
+            self.lru[slot] = None
+            self.stats["inserts"] += 1
+
+    def confident(self, verdict):
+        label, prob_of_risk = verdict
+        if label not in ("Yes", "No") or prob_of_risk is None:
+            return False
+        return (prob_of_risk if label == "Yes" else 1 - prob_of_risk) >= self.min_confidence
+
+    def hit_rate(self):
+        """Fraction of lookups answered from the cache."""
+        return self.stats["hits"] / self.stats["lookups"] if self.stats["lookups"] else 0.0
+
+    def _evict(self, slot):
+        for table, key in zip(self.tables, self.slot_keys[slot]):
+            bucket = table[key]
+            bucket.discard(slot)
+            if not bucket:
+                del table[key]
+        del self.lru[slot]
+        self.verdicts[slot] = self.slot_keys[slot] = None
+        self.free.append(slot)
+        self.stats["evictions"] += 1
+
+def holdout_report(embeddings, verdicts, thresholds=(0.9, 0.95, 0.97, 0.99), holdout_fraction=0.2, seed=0,
+                   **cache_kwargs):
+    """
+    Measures hit and disagreement rates of the cache on a held-out set.
+
+    The verdicts of a random (1 - holdout_fraction) share fill the cache; every held-out
+    item is then looked up, and a hit disagrees when the cached label differs from the
+    held-out item's own 2B verdict.
+
+    Parameters:
+    - embeddings: Array of HAP embeddings, one per prompt.
+    - verdicts: The 2B model's (label, prob_of_risk) verdict for each prompt.
+    - thresholds: Similarity cut-offs to report.
+    - holdout_fraction: Share of the prompts held out.
+    - seed: int, seed of the split.
+    - cache_kwargs: Other `SemanticCache` settings.
+
+    Returns:
+    - List of dicts with threshold, cached, held_out, hits, hit_rate, disagreements and
+      disagreement_rate (disagreements / hits).
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    order = np.random.default_rng(seed).permutation(len(embeddings))
+    split = len(order) - max(1, int(len(order) * holdout_fraction))
+    cached, held_out = order[:split], order[split:]
+    report = []
+    for threshold in thresholds:
+        cache = SemanticCache(embeddings.shape[1], threshold=threshold, **cache_kwargs)
+        cache.add(embeddings[cached], [verdicts[i] for i in cached])
+        hits = [(i, hit) for i, hit in zip(held_out, cache.lookup(embeddings[held_out])) if hit is not None]
+        disagreements = sum(hit[0][0] != verdicts[i][0] for i, hit in hits)
+        report.append({
+            "threshold": threshold,
+            "cached": len(cache),
+            "held_out": len(held_out),
+            "hits": len(hits),
+            "hit_rate": len(hits) / len(held_out),
+            "disagreements": disagreements,
+            "disagreement_rate": disagreements / len(hits) if hits else 0.0,
+        })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure semantic cache hit and disagreement rates on a held-out split.")
+    parser.add_argument("--hap_model", type=str, default="ibm-granite/granite-guardian-hap-38m", help="HAP model providing embeddings.")
+    parser.add_argument("--guardian_model", type=str, default="ibm-granite/granite-guardian-3.0-2b", help="2B model providing verdicts.")
+    parser.add_argument("--prompts_file", type=str, default="prompts.json", help="Prompts to use ('' to skip).")
+    parser.add_argument("--jsonl", nargs="*", default=[], help="Additional JSONL files (e.g. generated data with paraphrases).")
+    parser.add_argument("--text_field", type=str, default="user", help="JSONL field holding the text.")
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[0.9, 0.95, 0.97, 0.99], help="Similarity cut-offs.")
+    parser.add_argument("--holdout_fraction", type=float, default=0.2, help="Share of prompts held out.")
+    parser.add_argument("--min_confidence", type=float, default=0.9, help="Minimum verdict confidence to cache.")
+    parser.add_argument("--batch_size", type=int, default=8, help="Batch size for the 2B model.")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report here as well.")
+    args = parser.parse_args()
+
+    import registry
+    from precision import load_reference_texts
+    from utils import score_guardian_hap
+    from utils2b import test_risk_batch
+
+    texts = load_reference_texts(args.prompts_file, args.jsonl, args.text_field)
+    device = registry.default_device()
+    hap_model, hap_tokenizer = registry.get_model(args.hap_model, "hap", device)
+    guardian_model, guardian_tokenizer = registry.get_model(args.guardian_model, "guardian", device)
+    embeddings = []
+    score_guardian_hap(device, texts, hap_model, hap_tokenizer, embeddings=embeddings)
+    verdicts = test_risk_batch([[{"role": "user", "content": text}] for text in texts], guardian_model,
+                               guardian_tokenizer, device, batch_size=args.batch_size, mode="verdict")
+    report = holdout_report(embeddings, verdicts, args.thresholds, args.holdout_fraction,
+                            min_confidence=args.min_confidence)
+    for row in report:
+        print(f"similarity >= {row['threshold']}: hit rate {row['hit_rate']:.1%} ({row['hits']}/{row['held_out']}), "
+              f"disagreement rate {row['disagreement_rate']:.1%}", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import json
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from aiohttp import web
+
+import registry
+from precision import PRECISIONS
+from utils import score_guardian_hap
+from utils2b import test_risk_batch
+
+class QueueFullError(Exception):
+    """Raised when a batcher's queue is at its depth limit."""
+
+class BatcherStoppedError(Exception):
+    """Raised for requests submitted to, or still pending in, a stopped batcher."""
+
+class MicroBatcher:
+    """
+    Collects concurrent requests into micro-batches for one scoring function.
+
+    A batch is dispatched once it holds `max_batch_size` items or `max_wait_ms` has
+    passed since its first item arrived. Scoring runs on `executor`, so the event loop
+    keeps accepting requests while the model is busy.
+
+    Parameters:
+    - score_fn: Function mapping a list of items to a list of results, in order.
+    - executor: Executor running `score_fn` (a single inference thread).
+    - max_batch_size: Maximum items per dispatched batch.
+    - max_wait_ms: Maximum time the first item of a batch waits for company.
+    - max_queue: Maximum queued items before new requests are rejected.
+    """
+
+    def __init__(self, score_fn, executor, max_batch_size=32, max_wait_ms=5, max_queue=1024):
+        self.score_fn = score_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.stats = {"requests": 0, "rejected": 0, "batches": 0, "items": 0, "split_batches": 0}
+        self.task = None
+        self.in_flight = []
+        self.stopped = False
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        """Stops dispatching and fails every queued and in-flight request with BatcherStoppedError."""
+        self.stopped = True
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        pending = self.in_flight
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(BatcherStoppedError("The server is shutting down."))
+        self.in_flight = []
+
+    async def submit(self, item):
+        """Queues one item and waits for its result; raises QueueFullError under backpressure."""
+        if self.stopped:
+            raise BatcherStoppedError("The server is shutting down.")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise QueueFullError(f"Queue is full ({self.queue.maxsize} pending requests).")
+        self.stats["requests"] += 1
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Held on the batcher so `stop` can fail the batch if it is cancelled mid-flight.
+            self.in_flight = batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while True:
+                while not self.queue.empty() and len(batch) < self.max_batch_size:
+                    batch.append(self.queue.get_nowait())
+                remaining = deadline - loop.time()
+                if len(batch) >= self.max_batch_size or remaining <= 0:
+                    break
+                # Poll rather than cancel a pending get(), which can drop an item on timeout.
+                await asyncio.sleep(min(remaining, 0.0005))
+
+            await self.dispatch(batch)
+            self.in_flight = []
+
+    async def dispatch(self, batch):
+        """
+        Scores one batch and resolves its futures.
+
+        If the batched call raises, the items are scored one at a time so that only the
+        ones that fail on their own get the exception.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.score_fn, [item for item, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(e)
+                return
+            self.stats["split_batches"] += 1
+            for entry in batch:
+                await self.dispatch([entry])
+            return
+        self.stats["batches"] += 1
+        self.stats["items"] += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+def create_app(hap_batcher=None, risk_batcher=None, threshold=0.75):
+    """
+    Builds the aiohttp application serving the resident models.
+
+    Endpoints:
+    - POST /v1/hap with {"text": str} -> {"score": float, "label": 0|1}
+    - POST /v1/risk with {"messages": [...], "guardian_config": {...}} -> {"label": str, "prob_of_risk": float}
+    - GET /health -> queue depths and batching counters
+
+    Bodies that are not a JSON object, or do not have the fields above, get 400, full queues 429 and requests still
+    pending at shutdown 503.
+
+    Parameters:
+    - hap_batcher: MicroBatcher over HAP scoring, or None if no HAP model is loaded.
+    - risk_batcher: MicroBatcher over 2B risk scoring, or None if no 2B model is loaded.
+    - threshold: Decision threshold applied to HAP scores.
+
+    Returns:
+    - aiohttp.web.Application
+    """
+    batchers = {name: batcher for name, batcher in (("hap", hap_batcher), ("risk", risk_batcher)) if batcher}
+
+    async def submit(name, item):
+        if name not in batchers:
+            raise web.HTTPNotFound(text=f"No {name} model loaded.")
+        try:
+            return await batchers[name].submit(item)
+        except QueueFullError as e:
+            raise web.HTTPTooManyRequests(text=str(e), headers={"Retry-After": "1"})
+        except BatcherStoppedError as e:
+            raise web.HTTPServiceUnavailable(text=str(e))
+
+    async def read_body(request):
+        try:
+            body = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise web.HTTPBadRequest(text="Request body is not valid UTF-8 JSON.")
+        if not isinstance(body, dict):
+            raise web.HTTPBadRequest(text="Expected a JSON object.")
+        return body
+
+    async def hap(request):
+        body = await read_body(request)
+        if not isinstance(body.get("text"), str):
+            raise web.HTTPBadRequest(text="Expected a JSON body with a 'text' string.")
+        score = await submit("hap", body["text"])
+        return web.json_response({"score": score, "label": 1 if score >= threshold else 0})
+
+    async def risk(request):
+        body = await read_body(request)
+        messages, config = body.get("messages"), body.get("guardian_config")
+        if not isinstance(messages, list) or not messages or not all(
+            isinstance(message, dict) and isinstance(message.get("role"), str)
+            and isinstance(message.get("content"), str) for message in messages
+        ):
+            raise web.HTTPBadRequest(
+                text="Expected a JSON body with a non-empty 'messages' list of {\"role\": str, \"content\": str}.")
+        if config is not None and not isinstance(config, dict):
+            raise web.HTTPBadRequest(text="'guardian_config' must be an object or null.")
+        label, prob = await submit("risk", (body["messages"], body.get("guardian_config")))
+        return web.json_response({"label": label, "prob_of_risk": prob})
+
+    async def health(request):
+        return web.json_response({
+            name: {"queue_depth": batcher.queue.qsize(), **batcher.stats} for name, batcher in batchers.items()
+        })
+
+    async def on_startup(app):
+        for batcher in batchers.values():
+            batcher.start()
+
+    async def on_cleanup(app):
+        for batcher in batchers.values():
+            await batcher.stop()
+
+    app = web.Application()
+    app.add_routes([web.post("/v1/hap", hap), web.post("/v1/risk", risk), web.get("/health", health)])
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Granite Guardian models with micro-batched inference.")
+    parser.add_argument("--hap_model", type=str, default="ibm-granite/granite-guardian-hap-38m", help="HAP model id ('' to disable).")
+    parser.add_argument("--guardian_model", type=str, default="", help="Granite Guardian causal model id ('' to disable).")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Host to bind.")
+    parser.add_argument("--port", type=int, default=8080, help="Port to bind.")
+    parser.add_argument("--unix_socket", type=str, default=None, help="Serve on a Unix socket instead of TCP.")
+    parser.add_argument("--threshold", type=float, default=0.75, help="Decision threshold for HAP scores.")
+    parser.add_argument("--max_batch_size", type=int, default=32, help="Maximum requests per micro-batch.")
+    parser.add_argument("--max_wait_ms", type=float, default=5, help="Maximum time a request waits for a batch to fill.")
+    parser.add_argument("--max_queue", type=int, default=1024, help="Maximum queued requests per model before returning 429.")
+    parser.add_argument("--precision", choices=PRECISIONS, default="fp32", help="Model precision (int8 is CPU-only).")
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    # A single inference thread serialises model calls and keeps the event loop free.
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+    batcher_args = {"max_batch_size": args.max_batch_size, "max_wait_ms": args.max_wait_ms, "max_queue": args.max_queue}
+
+    hap_batcher = None
+    if args.hap_model:
+        hap_model, hap_tokenizer = registry.get_model(args.hap_model, "hap", device, precision=args.precision)
+        hap_batcher = MicroBatcher(
+            lambda texts: score_guardian_hap(device, texts, hap_model, hap_tokenizer, batch_size=args.max_batch_size),
+            executor, **batcher_args,
+        )
+
+    risk_batcher = None
+    if args.guardian_model:
+        guardian_model, guardian_tokenizer = registry.get_model(args.guardian_model, "guardian", device,
+                                                                precision=args.precision)
+        risk_batcher = MicroBatcher(
+            lambda items: test_risk_batch(
+                [messages for messages, _ in items], guardian_model, guardian_tokenizer, device,
+                guardian_configs=[config for _, config in items], batch_size=args.max_batch_size, mode="verdict",
+            ),
+            executor, **batcher_args,
+        )
+
+    if hap_batcher is None and risk_batcher is None:
+        parser.error("At least one of --hap_model and --guardian_model is required.")
+
+    app = create_app(hap_batcher, risk_batcher, threshold=args.threshold)
+    print(f"Serving on {args.unix_socket or f'http://{args.host}:{args.port}'}")
+    if args.unix_socket:
+        web.run_app(app, path=args.unix_socket, print=None)
+    else:
+        web.run_app(app, host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import torch
+from transformers import DynamicCache
+
+from utils2b import parse_verdict
+
+# Stand-in assistant content used to split the template around the streamed response.
+RESPONSE_SENTINEL = "[[GUARDIAN_RESPONSE_SENTINEL]]"
+
+# Trailing tokens of a word held back from the cache, since they may still merge with what follows.
+HOLDBACK_TOKENS = 2
+
+class StreamingModerator:
+    """
+    Incremental verdict-mode risk scoring of an assistant response while it streams.
+
+    The chat template is rendered once around a placeholder response. Everything before
+    the response (preamble and conversation so far) is encoded once into a KV cache, and
+    streamed text is appended to that cache as it arrives, so earlier tokens are never
+    run again. At each checkpoint the template text after the response (risk definition
+    and question) is run as a branch on top of the cache, the verdict is read from its
+    last position and the cache is cropped back to the response.
+
+    A checkpoint therefore costs the new tokens plus the template tail, instead of the
+    whole conversation. Text up to the last space is committed to the cache, because a
+    word still being streamed can tokenize differently once it is complete; with
+    byte-level BPE tokenizers (the Granite ones) each verdict then matches `test_risk` on
+    the same text. A word that grows past `check_every` tokens (code, URLs, text without
+    spaces) is committed up to its last `HOLDBACK_TOKENS` tokens instead, so the cost per
+    checkpoint stays bounded; verdicts on such words can differ slightly from `test_risk`.
+
+    Parameters:
+    - model: Pretrained model (causal LM).
+    - tokenizer: Tokenizer for the model.
+    - device: Device to run the model on (CPU/GPU).
+    - messages: Conversation before the streamed assistant response.
+    - guardian_config: Optional configuration for the model.
+    - check_every: Number of new response tokens between checkpoints.
+    - threshold: Probability of risk at which the response is flagged and checks stop.
+    """
+
+    def __init__(self, model, tokenizer, device, messages, guardian_config=None, check_every=16, threshold=0.5):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.check_every = check_every
+        self.threshold = threshold
+        placeholder = messages + [{"role": "assistant", "content": RESPONSE_SENTINEL}]
+        rendered = tokenizer.apply_chat_template(
+            placeholder, guardian_config=guardian_config, add_generation_prompt=True, tokenize=False
+        )
+        head, self.tail = rendered.split(RESPONSE_SENTINEL)
+        # Uncommitted text: the head's last word may still merge with the response.
+        boundary = head.rfind(" ")
+        boundary = boundary if boundary > 0 else len(head)
+        self.pending = head[boundary:]
+        self.new_tokens = 0
+        self.cache = DynamicCache()
+        self.cached_len = 0
+        self.unsafe = False
+        self.verdicts = []
+        self.stats = {"checks": 0, "tokens_run": 0}
+        self._run(self._encode(head[:boundary]))
+
+    def feed(self, text):
+        """
+        Appends streamed response text and runs a checkpoint every `check_every` new tokens.
+
+        Returns:
+        - The (label, prob_of_risk) verdict if a checkpoint ran, else None. Once the response
+          is flagged (`unsafe`), further text is ignored.
+        """
+        if self.unsafe:
+            return None
+        self.pending += text
+        # Counted per chunk so `pending` is not re-tokenized each time (merges across chunks are ignored).
+        self.new_tokens += len(self._encode(text))
+        if self.new_tokens < self.check_every:
+            return None
+        return self.check()
+
+    def check(self):
+        """
+        Scores the response streamed so far.
+
+        Returns:
+        - (label, prob_of_risk), as `test_risk` returns for the conversation ending in the
+          response so far.
+        """
+        committed, self.pending = self._split_pending()
+        branch = self._encode(self.pending + self.tail)
+        # One forward pass appends the committed tokens and runs the branch on top of them.
+        logits = self._run(committed + branch)
+        self.cache.crop(self.cached_len - len(branch))
+        self.cached_len -= len(branch)
+        self.new_tokens = 0
+
+        label, prob_of_risk = parse_verdict(logits, self.tokenizer)
+        self.stats["checks"] += 1
+        self.verdicts.append({"cached_tokens": self.cached_len, "label": label, "prob_of_risk": prob_of_risk})
+        if prob_of_risk is not None and prob_of_risk >= self.threshold:
+            self.unsafe = True
+        return label, prob_of_risk
+
+    def finish(self):
+        """Final verdict once the stream has ended (the last one if the response was already flagged)."""
+        if self.unsafe:
+            return self.verdicts[-1]["label"], self.verdicts[-1]["prob_of_risk"]
+        return self.check()
+
+    def _split_pending(self):
+        """Splits the pending text into token ids safe to commit and the text kept back."""
+        boundary = self.pending.rfind(" ")
+        word = self.pending[max(boundary, 0):]
+        encoded = self.tokenizer(word, add_special_tokens=False, return_offsets_mapping=True)
+        if len(encoded["input_ids"]) < self.check_every:
+            if boundary <= 0:
+                return [], self.pending
+            return self._encode(self.pending[:boundary]), word
+        # An over-long word: commit its tokens in context, all but the last few. Byte-level
+        # tokens can split a character, so the cut moves back to a character boundary.
+        offsets = encoded["offset_mapping"]
+        keep = len(offsets) - HOLDBACK_TOKENS
+        while keep > 0 and offsets[keep - 1][1] > offsets[keep][0]:
+            keep -= 1
+        committed = self._encode(self.pending[:boundary]) if boundary > 0 else []
+        return committed + encoded["input_ids"][:keep], word[offsets[keep][0]:]
+
+    def _encode(self, text):
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"] if text else []
+
+    def _run(self, ids):
+        if not ids:
+            return None
+        with torch.no_grad():
+            output = self.model(
+                torch.tensor([ids], dtype=torch.long, device=self.device), past_key_values=self.cache, use_cache=True
+            )
+        self.cache = output.past_key_values
+        self.cached_len += len(ids)
+        self.stats["tokens_run"] += len(ids)
+        return output.logits[:, -1, :]
+
+def moderate_stream(chunks, moderator):
+    """
+    Passes streamed chunks through while the moderator finds them safe.
+
+    A chunk is yielded only after it has been fed, so the stream stops before the chunk
+    that crossed the threshold at a checkpoint. Call `moderator.finish()` afterwards for
+    the verdict on the complete response.
+
+    Parameters:
+    - chunks: Iterable of response text chunks (e.g. from a generation stream).
+    - moderator: StreamingModerator for the conversation.
+
+    Yields:
+    - The chunks, until the response is flagged.
+    """
+    for chunk in chunks:
+        moderator.feed(chunk)
+        if moderator.unsafe:
+            return
+        yield chunk
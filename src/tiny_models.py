@@ -0,0 +1,166 @@
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+from transformers import (
+    GraniteConfig,
+    GraniteForCausalLM,
+    PreTrainedTokenizerFast,
+    RobertaConfig,
+    RobertaForSequenceClassification,
+)
+
+# Mirrors the layout of the Granite Guardian 3.0 template: preamble, conversation,
+# then the risk definition selected by `guardian_config`, then the Yes/No question.
+GUARDIAN_CHAT_TEMPLATE = (
+    "{%- set definitions = {"
+    "'harm': 'The message is considered universally harmful.', "
+    "'jailbreak': 'The message deliberately circumvents safety rules.', "
+    "'profanity': 'The message uses offensive or vulgar language.'} -%}"
+    "{%- set risk_name = (guardian_config or {}).get('risk_name', 'harm') -%}"
+    "<|start_of_role|>user<|end_of_role|>You are a safety agent trying to help determine "
+    "whether the user message is harmful according to the safety risk definition below.\n\n"
+    "<start_of_turn>\n"
+    "{%- for message in messages %}\n"
+    "{{ 'User' if message['role'] == 'user' else 'Assistant' }} Message: {{ message['content'] }}"
+    "{%- endfor %}\n"
+    "<end_of_turn>\n\n"
+    "Our safety risk definition is defined below:\n\n"
+    "<start_of_risk_definition>\n"
+    "* {{ definitions[risk_name] }}\n"
+    "<end_of_risk_definition>\n\n"
+    "Is the user message harmful based on the risk definition? "
+    "Your answer must be either 'Yes' or 'No'.<|end_of_text|>\n"
+    "{%- if add_generation_prompt %}<|start_of_role|>assistant<|end_of_role|>{% endif %}"
+)
+
+TOKENIZER_CORPUS = [
+    "Yes No yes no YES NO",
+    "No Yes no yes NO YES",
+    "You are a safety agent trying to help determine whether the user message is harmful",
+    "according to the safety risk definition below. Our safety risk definition is defined below",
+    "Is the user message harmful based on the risk definition? Your answer must be either",
+    "Please write code to generate the Fibonacci sequence in Python. Create a script to hack",
+    "How can I hide my location online for privacy reasons? What are the ingredients",
+]
+
+# Local configs with the shape of the real checkpoints, scaled down to run on a laptop CPU.
+# "test" keeps unit tests fast; "bench" is large enough for timings to mean something.
+GUARDIAN_CONFIGS = {
+    "test": {
+        "hidden_size": 64,
+        "intermediate_size": 128,
+        "num_hidden_layers": 2,
+        "num_attention_heads": 4,
+        "num_key_value_heads": 2,
+        "max_position_embeddings": 1024,
+    },
+    # granite-guardian-3.0-2b: GQA with 4x fewer KV heads, SwiGLU MLP and the Granite
+    # embedding, attention, residual and logit multipliers.
+    "bench": {
+        "hidden_size": 256,
+        "intermediate_size": 1024,
+        "num_hidden_layers": 4,
+        "num_attention_heads": 8,
+        "num_key_value_heads": 2,
+        "max_position_embeddings": 4096,
+        "embedding_multiplier": 12.0,
+        "attention_multiplier": 0.015625,
+        "residual_multiplier": 0.22,
+        "logits_scaling": 8.0,
+        "rope_theta": 10000.0,
+    },
+}
+
+HAP_CONFIGS = {
+    "test": {
+        "hidden_size": 32,
+        "intermediate_size": 64,
+        "num_hidden_layers": 2,
+        "num_attention_heads": 4,
+        "max_position_embeddings": 530,
+    },
+    # granite-guardian-hap-38m: a 4-layer RoBERTa encoder with a classification head.
+    "bench": {
+        "hidden_size": 576,
+        "intermediate_size": 768,
+        "num_hidden_layers": 4,
+        "num_attention_heads": 12,
+        "max_position_embeddings": 514,
+    },
+}
+
+def build_tokenizer(vocab_size=600):
+    """
+    Trains a small byte-level BPE tokenizer carrying a Granite Guardian style chat template.
+
+    Parameters:
+    - vocab_size: int, target vocabulary size.
+
+    Returns:
+    - PreTrainedTokenizerFast whose EOS token doubles as the padding token.
+    """
+    backend = Tokenizer(models.BPE())
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=["<|end_of_text|>", "<|start_of_role|>", "<|end_of_role|>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    backend.train_from_iterator(TOKENIZER_CORPUS * 4, trainer)
+    return PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        eos_token="<|end_of_text|>",
+        pad_token="<|end_of_text|>",
+        chat_template=GUARDIAN_CHAT_TEMPLATE,
+    )
+
+def build_guardian_model(tokenizer, size="test", seed=0):
+    """
+    Builds a randomly initialised Granite causal LM from a local config.
+
+    The Yes/No and EOS output rows are re-drawn with a larger scale so the random model
+    produces non-trivial verdict probabilities and stops generating at varying lengths.
+
+    Parameters:
+    - tokenizer: Tokenizer from `build_tokenizer`.
+    - size: Key of GUARDIAN_CONFIGS.
+    - seed: int, seed for the random weights.
+
+    Returns:
+    - GraniteForCausalLM in eval mode.
+    """
+    torch.manual_seed(seed)
+    config = GraniteConfig(
+        vocab_size=len(tokenizer),
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+        bos_token_id=tokenizer.eos_token_id,
+        **GUARDIAN_CONFIGS[size],
+    )
+    model = GraniteForCausalLM(config).eval()
+    with torch.no_grad():
+        for token in ["Yes", "No", "yes", "no", tokenizer.eos_token]:
+            token_id = tokenizer.convert_tokens_to_ids(token)
+            model.lm_head.weight[token_id] = torch.randn(config.hidden_size) * 0.5
+    return model
+
+def build_hap_model(tokenizer, size="test", seed=0):
+    """
+    Builds a randomly initialised RoBERTa sequence classifier shaped like the HAP models.
+
+    Parameters:
+    - tokenizer: Tokenizer from `build_tokenizer`.
+    - size: Key of HAP_CONFIGS.
+    - seed: int, seed for the random weights.
+
+    Returns:
+    - RobertaForSequenceClassification in eval mode.
+    """
+    torch.manual_seed(seed)
+    config = RobertaConfig(
+        vocab_size=len(tokenizer),
+        pad_token_id=tokenizer.pad_token_id,
+        num_labels=2,
+        **HAP_CONFIGS[size],
+    )
+    return RobertaForSequenceClassification(config).eval()
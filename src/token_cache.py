@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+
+# Token ids are written in chunks of this many tokens, so corpora never sit in memory twice.
+WRITE_CHUNK_TOKENS = 1 << 20
+
+class TokenizedCorpus:
+    """
+    Pre-tokenized inputs held as two flat arrays: item i is ids[offsets[i]:offsets[i + 1]].
+
+    `utils.score_guardian_hap` / `score_guardian_xl`, `utils2b.test_risk_batch` and
+    `parallel.ScoringPool.score` accept a corpus in place of their strings or message lists
+    and pad batches straight from the (memory-mapped) arrays without tokenizing again.
+
+    Parameters:
+    - ids: 1-D int32 array of all token ids.
+    - offsets: 1-D int64 array of len(items) + 1 start offsets into `ids`.
+    - directory: Optional directory the arrays were memory-mapped from.
+    - key: Optional cache key the corpus is stored under.
+    """
+
+    def __init__(self, ids, offsets, directory=None, key=None):
+        self.ids = ids
+        self.offsets = offsets
+        self.directory = directory
+        self.key = key
+        self.lengths = np.diff(offsets).tolist()
+        self.from_cache = False
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, index):
+        return self.ids[self.offsets[index]:self.offsets[index + 1]]
+
+    def pad(self, indices, pad_token_id, padding_side="right"):
+        """
+        Pads the given items into model inputs.
+
+        Returns:
+        - (input_ids, attention_mask): LongTensors of shape (len(indices), longest item).
+        """
+        max_len = max((self.lengths[i] for i in indices), default=0)
+        input_ids = np.full((len(indices), max_len), pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(indices), max_len), dtype=np.int64)
+        for row, index in enumerate(indices):
+            length = self.lengths[index]
+            columns = slice(max_len - length, max_len) if padding_side == "left" else slice(0, length)
+            input_ids[row, columns] = self[index]
+            attention_mask[row, columns] = 1
+        return torch.from_numpy(input_ids), torch.from_numpy(attention_mask)
+
+def write_token_arrays(input_ids, directory):
+    """
+    Stores tokenized inputs as the flat ids.bin and offsets.npy arrays read by `open_token_arrays`.
+
+    Parameters:
+    - input_ids: Iterable of token id sequences (a generator keeps large corpora streaming).
+    - directory: str, existing directory to write to.
+
+    Returns:
+    - List of the input lengths.
+    """
+    lengths, buffer = [], []
+    with open(os.path.join(directory, "ids.bin"), "wb") as f:
+        for sequence in input_ids:
+            lengths.append(len(sequence))
+            buffer.extend(sequence)
+            if len(buffer) >= WRITE_CHUNK_TOKENS:
+                np.asarray(buffer, dtype="<i4").tofile(f)
+                buffer = []
+        np.asarray(buffer, dtype="<i4").tofile(f)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(directory, "offsets.npy"), offsets)
+    return lengths
+
+def open_token_arrays(directory):
+    """Memory-maps the (ids, offsets) arrays written by `write_token_arrays`."""
+    offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+    # np.memmap cannot map an empty file.
+    ids = np.memmap(os.path.join(directory, "ids.bin"), dtype="<i4", mode="r") if offsets[-1] else np.zeros(0, "<i4")
+    return ids, offsets
+
+def tokenizer_fingerprint(tokenizer):
+    """Hashes everything about a tokenizer that changes the ids it produces, including its chat template."""
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        state = json.loads(backend.to_str())
+        # Padding and truncation are per-call settings the last encode left behind.
+        state.pop("padding", None)
+        state.pop("truncation", None)
+    else:
+        state = sorted(tokenizer.get_vocab().items())
+    payload = json.dumps({
+        "class": type(tokenizer).__name__,
+        "state": state,
+        "special_tokens": tokenizer.special_tokens_map,
+        "truncation_side": tokenizer.truncation_side,
+        "chat_template": tokenizer.chat_template,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def corpus_key(items, tokenizer, max_length=512, chat=False, guardian_configs=None):
+    """
+    Hashes a corpus together with the tokenizer and settings used to tokenize it.
+
+    Parameters:
+    - items: List of prompts, or of message lists with `chat`.
+    - tokenizer: Tokenizer the corpus is encoded with.
+    - max_length: Truncation length of plain prompts.
+    - chat: Whether items are rendered with the chat template, as `test_risk_batch` does.
+    - guardian_configs: With `chat`, an optional list with one guardian_config per item.
+
+    Returns:
+    - str: Hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    settings = {"tokenizer": tokenizer_fingerprint(tokenizer), "chat": chat, "max_length": None if chat else max_length}
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    for i, item in enumerate(items):
+        config = guardian_configs[i] if chat and guardian_configs is not None else None
+        digest.update(json.dumps([item, config], sort_keys=True).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+def _encode(items, tokenizer, max_length, chat, guardian_configs, chunk_size=1024):
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+        if chat:
+            configs = guardian_configs[start:start + chunk_size] if guardian_configs is not None else [None] * len(chunk)
+            yield from (tokenizer.apply_chat_template(messages, guardian_config=config, add_generation_prompt=True)
+                        for messages, config in zip(chunk, configs))
+        else:
+            yield from tokenizer(chunk, max_length=max_length, truncation=True)["input_ids"]
+
+def pretokenize(items, tokenizer, cache_dir=".token_cache", max_length=512, chat=False, guardian_configs=None):
+    """
+    Returns the tokenized corpus from `cache_dir`, tokenizing and storing it on the first run.
+
+    Plain prompts are encoded the way `utils.iter_batches` encodes them; with `chat`,
+    conversations are rendered the way `utils2b.test_risk_batch` renders them.
+
+    Parameters:
+    - items: List of prompts, or of message lists with `chat`.
+    - tokenizer: Tokenizer to encode with.
+    - cache_dir: str, directory holding one subdirectory per corpus key (None keeps
+      the arrays in memory and caches nothing).
+    - max_length, chat, guardian_configs: As for `corpus_key`.
+
+    Returns:
+    - TokenizedCorpus, memory-mapped from the cache (`from_cache` tells whether it was
+      already there).
+    """
+    if cache_dir is None:
+        input_ids = list(_encode(items, tokenizer, max_length, chat, guardian_configs))
+        offsets = np.zeros(len(input_ids) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in input_ids], out=offsets[1:])
+        ids = np.fromiter((token for ids in input_ids for token in ids), dtype="<i4", count=int(offsets[-1]))
+        return TokenizedCorpus(ids, offsets)
+
+    key = corpus_key(items, tokenizer, max_length=max_length, chat=chat, guardian_configs=guardian_configs)
+    directory = os.path.join(cache_dir, key)
+    from_cache = os.path.isdir(directory)
+    if not from_cache:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written to a temporary directory and renamed, so readers never see a partial corpus.
+        tmp_dir = tempfile.mkdtemp(dir=cache_dir, prefix=f".{key}.")
+        try:
+            lengths = write_token_arrays(_encode(items, tokenizer, max_length, chat, guardian_configs), tmp_dir)
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump({"tokenizer": tokenizer.name_or_path, "chat": chat, "max_length": max_length,
+                           "items": len(lengths), "tokens": sum(lengths)}, f)
+            os.rename(tmp_dir, directory)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.isdir(directory):  # Not a concurrent writer finishing first
+                raise
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+    corpus = TokenizedCorpus(*open_token_arrays(directory), directory=directory, key=key)
+    corpus.from_cache = from_cache
+    return corpus
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-tokenize a corpus into the memory-mapped token cache.")
+    parser.add_argument("--model_id", type=str, default="ibm-granite/granite-guardian-hap-38m", help="Tokenizer to encode with.")
+    parser.add_argument("--cache_dir", type=str, default=".token_cache", help="Token cache directory.")
+    parser.add_argument("--prompts_file", type=str, default="prompts.json", help="Prompts to encode ('' to skip).")
+    parser.add_argument("--jsonl", nargs="*", default=[], help="JSONL files to encode.")
+    parser.add_argument("--text_field", type=str, default="user", help="JSONL field holding the text.")
+    parser.add_argument("--chat", action="store_true", help="Render each text as a user turn with the chat template.")
+    parser.add_argument("--max_length", type=int, default=512, help="Truncation length of plain prompts.")
+    args = parser.parse_args()
+
+    from precision import load_reference_texts  # precision imports utils, which imports this module
+
+    texts = load_reference_texts(args.prompts_file, args.jsonl, args.text_field)
+    items = [[{"role": "user", "content": text}] for text in texts] if args.chat else texts
+    tokenizer = AutoTokenizer.from_pretrained(args.model_id)
+    start = time.perf_counter()
+    corpus = pretokenize(items, tokenizer, args.cache_dir, max_length=args.max_length, chat=args.chat)
+    elapsed = time.perf_counter() - start
+    print(f"{'Found' if corpus.from_cache else 'Wrote'} {len(corpus)} items, {sum(corpus.lengths)} tokens "
+          f"in {corpus.directory} ({elapsed:.2f}s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
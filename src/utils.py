@@ -1,70 +1,237 @@
+import re
 import json
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from transformers import AutoTokenizer, AutoModelForSequenceClassification, BatchEncoding
+
+import instrumentation
+from token_cache import TokenizedCorpus
+
+ROLE_TAGS = re.compile(r"^\s*<(user|assistant)>\s*|\s*</(user|assistant)>\s*$")
 
 def load_prompts(file_path):
     """Load prompts from a JSON file."""
     with open(file_path, 'r') as f:
         return json.load(f)
 
-def score_guardian_hap(device, data, model, tokenizer, batch_size=128):
+def strip_wrappers(text):
+    """Removes the <user>/<assistant> tags the data generation scripts wrap around each turn."""
+    return ROLE_TAGS.sub("", text).strip()
+
+def iter_jsonl(path, offset=0):
+    """
+    Lazily reads a JSONL file starting at a byte offset.
+
+    Parameters:
+    - path: str, the JSONL file.
+    - offset: int, byte offset to start reading from.
+
+    Yields:
+    - (next_offset, record): Byte offset just past the line, and the parsed record.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in iter(f.readline, b""):
+            offset += len(line)
+            if line.strip():
+                yield offset, json.loads(line)
+
+def plan_batches(lengths, max_tokens=32768, batch_size=128):
+    """
+    Groups inputs into length-sorted batches capped by a padded-token budget.
+
+    Inputs are sorted by tokenized length so each batch holds similarly sized items,
+    and a batch is closed once its padded size (items x longest item) would exceed
+    `max_tokens` or it reaches `batch_size` items.
+
+    Parameters:
+    - lengths: List of tokenized input lengths
+    - max_tokens: Maximum padded tokens per batch (None to disable the budget)
+    - batch_size: Maximum number of items per batch
+
+    Returns:
+    - List of batches, each a list of indices into `lengths`
+    """
+    batches, current, longest = [], [], 0
+    for index in sorted(range(len(lengths)), key=lengths.__getitem__):
+        padded_len = max(longest, lengths[index])
+        over_budget = max_tokens is not None and padded_len * (len(current) + 1) > max_tokens
+        if current and (over_budget or len(current) >= batch_size):
+            batches.append(current)
+            current, padded_len = [], lengths[index]
+        current.append(index)
+        longest = padded_len
+    if current:
+        batches.append(current)
+    return batches
+
+def padding_stats(lengths, batches):
+    """
+    Summarizes how much of the scheduled compute is spent on padding.
+
+    Parameters:
+    - lengths: List of tokenized input lengths
+    - batches: Batches of indices as returned by `plan_batches`
+
+    Returns:
+    - dict with the number of batches, real and padded token counts, and
+      padding_efficiency (real / padded tokens, 1.0 means no padding)
+    """
+    real_tokens = sum(lengths)
+    padded_tokens = sum(max(lengths[i] for i in batch) * len(batch) for batch in batches)
+    return {
+        "batches": len(batches),
+        "real_tokens": real_tokens,
+        "padded_tokens": padded_tokens,
+        "padding_efficiency": real_tokens / padded_tokens if padded_tokens else 1.0,
+    }
+
+def iter_batches(device, data, tokenizer, batch_size=128, max_tokens=32768, max_length=512, stats=None,
+                 name="iter_batches"):
+    """
+    Tokenizes `data` once and yields padded, length-bucketed batches.
+
+    Parameters:
+    - device: torch.device
+    - data: List of prompts, or a `token_cache.TokenizedCorpus` encoded with `tokenizer`
+      (padded straight from its arrays; `max_length` was applied when it was built)
+    - tokenizer: Tokenizer for the model
+    - batch_size: Maximum number of items per batch
+    - max_tokens: Maximum padded tokens per batch (None to batch by item count only)
+    - max_length: Maximum tokenized length of a single prompt
+    - stats: Optional dict, updated with `padding_stats` for the schedule
+    - name: Scoring function name the instrumentation events are recorded under
+
+    Yields:
+    - (indices, inputs): Positions of the batch items in `data` and the model inputs
+    """
+    if not len(data):
+        return
+    corpus = data if isinstance(data, TokenizedCorpus) else None
+    if corpus is not None:
+        lengths = corpus.lengths
+    else:
+        instrumentation.begin(name, event="tokenize", items=len(data))
+        with instrumentation.stage("tokenize"):
+            encodings = tokenizer(data, max_length=max_length, truncation=True)
+        lengths = [len(ids) for ids in encodings["input_ids"]]
+        instrumentation.end(tokens=sum(lengths))
+    batches = plan_batches(lengths, max_tokens=max_tokens, batch_size=batch_size)
+    if stats is not None:
+        stats.update(padding_stats(lengths, batches))
+    for batch in batches:
+        # The caller times its own stages and closes the event with `instrumentation.end()`.
+        instrumentation.begin(name, lengths=(lengths[i] for i in batch))
+        with instrumentation.stage("pad"):
+            if corpus is not None:
+                input_ids, attention_mask = corpus.pad(batch, tokenizer.pad_token_id, tokenizer.padding_side)
+                inputs = BatchEncoding({"input_ids": input_ids, "attention_mask": attention_mask})
+            else:
+                features = [{key: values[i] for key, values in encodings.items()} for i in batch]
+                inputs = tokenizer.pad(features, padding=True, return_tensors="pt")
+        with instrumentation.stage("to_device"):
+            inputs = inputs.to(device)
+        yield batch, inputs
+
+def score_guardian_hap(device, data, model, tokenizer, batch_size=128, max_tokens=32768, stats=None, cache=None,
+                       embeddings=None):
     """
     Scores input data for HAP using sequence classification models.
 
     Parameters:
     - device: torch.device
-    - data: List of prompts
+    - data: List of prompts, or a `token_cache.TokenizedCorpus` encoded with `tokenizer`
     - model: Sequence classification model
     - tokenizer: Tokenizer for the model
-    - batch_size: Batch size for inference
+    - batch_size: Maximum batch size for inference
+    - max_tokens: Maximum padded tokens per batch (None to batch by item count only)
+    - stats: Optional dict, filled with the padding statistics of the run
+    - cache: Optional `verdict_cache.VerdictCache` (prompt lists only); only uncached prompts are run through the model
+    - embeddings: Optional list, extended with each prompt's L2-normalised pooled (<s> token) last hidden
+      state as a float32 NumPy vector, in input order; taken from the same forward pass (PyTorch models only)
 
     Returns:
-    - List of HAP scores (probabilities of unsafe content)
+    - List of HAP scores (probabilities of unsafe content), in input order
     """
-    hap_scores = []
+    if cache is not None and isinstance(data, TokenizedCorpus):
+        raise ValueError("VerdictCache keys on prompt text; score a TokenizedCorpus without `cache`.")
+    if cache is not None and embeddings is not None:
+        raise ValueError("Embeddings come from the forward pass, which `cache` skips for cached prompts.")
+    if cache is not None:
+        return cache.map(model, "score_guardian_hap", data, lambda misses: score_guardian_hap(
+            device, misses, model, tokenizer, batch_size=batch_size, max_tokens=max_tokens, stats=stats))
+    hap_scores = [None] * len(data)
+    pooled = [None] * len(data) if embeddings is not None else None
     with torch.no_grad():
-        for i in range(0, len(data), batch_size):
-            batch = data[i:i + batch_size]
-            inputs = tokenizer(batch, max_length=512, padding=True, truncation=True, return_tensors="pt").to(device)
-            logits = model(**inputs).logits
-            # HAP score = softmax logits, [1] = probability of "harmful"
-            hap_scores.extend(torch.softmax(logits, dim=1)[:, 1].detach().cpu().numpy().tolist())
+        for indices, inputs in iter_batches(device, data, tokenizer, batch_size, max_tokens, stats=stats,
+                                            name="score_guardian_hap"):
+            with instrumentation.stage("forward"):
+                if pooled is not None:
+                    output = model(**inputs, output_hidden_states=True)
+                    if output.hidden_states is None:
+                        raise ValueError("Embeddings need a model that returns hidden states (the PyTorch backend).")
+                else:
+                    output = model(**inputs)
+                logits = output.logits
+            with instrumentation.stage("postprocess"):
+                # HAP score = softmax logits, [1] = probability of "harmful"
+                batch_scores = torch.softmax(logits.float(), dim=1)[:, 1].detach().cpu().numpy().tolist()
+                for index, score in zip(indices, batch_scores):
+                    hap_scores[index] = score
+                if pooled is not None:
+                    # The classification head reads the <s> token, so its state summarises the prompt.
+                    vectors = torch.nn.functional.normalize(output.hidden_states[-1][:, 0].float(), dim=-1)
+                    for index, vector in zip(indices, vectors.cpu().numpy()):
+                        pooled[index] = vector
+            instrumentation.end()
+    if pooled is not None:
+        embeddings.extend(pooled)
     return hap_scores
 
-def score_guardian_xl(device, data, model, tokenizer, batch_size=128):
+def score_guardian_xl(device, data, model, tokenizer, batch_size=128, max_tokens=32768, stats=None, cache=None):
     """
     Scores input data for HAP using causal language models.
     
     Parameters:
     - device: torch.device
-    - data: List of prompts
+    - data: List of prompts, or a `token_cache.TokenizedCorpus` encoded with `tokenizer`
     - model: Causal language model
     - tokenizer: Tokenizer for the model
-    - batch_size: Batch size for inference
+    - batch_size: Maximum batch size for inference
+    - max_tokens: Maximum padded tokens per batch (None to batch by item count only)
+    - stats: Optional dict, filled with the padding statistics of the run
+    - cache: Optional `verdict_cache.VerdictCache` (prompt lists only); only uncached prompts are run through the model
 
     Returns:
-    - List of HAP scores (probabilities of unsafe content)
+    - List of HAP scores (probabilities of unsafe content), in input order
     """
-    hap_scores = []
+    if cache is not None and isinstance(data, TokenizedCorpus):
+        raise ValueError("VerdictCache keys on prompt text; score a TokenizedCorpus without `cache`.")
+    if cache is not None:
+        return cache.map(model, "score_guardian_xl", data, lambda misses: score_guardian_xl(
+            device, misses, model, tokenizer, batch_size=batch_size, max_tokens=max_tokens, stats=stats))
+    hap_scores = [None] * len(data)
+    yes_id = tokenizer.convert_tokens_to_ids("Yes")
     with torch.no_grad():
-        for i in range(0, len(data), batch_size):
-            batch = data[i:i + batch_size]
-            inputs = tokenizer(batch, max_length=512, padding=True, truncation=True, return_tensors="pt").to(device)
-            
-            # Generate logits for the next token
-            output = model.generate(
-                inputs["input_ids"], 
-                max_new_tokens=1,  # Generate only the next token
-                return_dict_in_generate=True,
-                output_scores=True
-            )
-            # Get logits for the last generated token
-            logits = output.scores[-1]
-            
-            # Extract probabilities for "Yes" (unsafe) and "No" (safe)
-            yes_id = tokenizer.convert_tokens_to_ids("Yes")
-            yes_prob = torch.softmax(logits, dim=-1)[:, yes_id]
-            hap_scores.extend(yes_prob.detach().cpu().numpy().tolist())
+        for indices, inputs in iter_batches(device, data, tokenizer, batch_size, max_tokens, stats=stats,
+                                            name="score_guardian_xl"):
+            with instrumentation.stage("forward"):
+                # Generate logits for the next token
+                output = model.generate(
+                    inputs["input_ids"],
+                    attention_mask=inputs["attention_mask"],
+                    max_new_tokens=1,  # Generate only the next token
+                    return_dict_in_generate=True,
+                    output_scores=True
+                )
+            with instrumentation.stage("postprocess"):
+                # Get logits for the last generated token
+                logits = output.scores[-1]
+
+                # Extract probabilities for "Yes" (unsafe) and "No" (safe)
+                yes_prob = torch.softmax(logits.float(), dim=-1)[:, yes_id]
+                for index, score in zip(indices, yes_prob.detach().cpu().numpy().tolist()):
+                    hap_scores[index] = score
+            instrumentation.end()
     return hap_scores
 
 def aggregate_score(hap_scores, threshold=0.6):
@@ -73,7 +240,7 @@ def aggregate_score(hap_scores, threshold=0.6):
     
     Parameters:
     - hap_scores: List of probabilities for unsafe content
-    - threshold: Decision threshold for classification (default=0.75)
+    - threshold: Decision threshold for classification (default=0.6; the runners pass 0.75 for the small HAP models)
     
     Returns:
     - label: 1 if max score >= threshold (Unsafe), else 0 (Safe)
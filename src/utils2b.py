@@ -1,13 +1,48 @@
 import torch
 import math
+import weakref
 from torch.nn.functional import softmax
 from transformers import AutoTokenizer, AutoModelForCausalLM
 
-import torch
-import math
-from torch.nn.functional import softmax
+import instrumentation
+from token_cache import TokenizedCorpus
 
-def parse_output(output, input_len, tokenizer, safe_token="No", unsafe_token="Yes", nlogprobs=20):
+# Leading-space markers used by byte-level BPE ("Ġ") and SentencePiece ("▁") vocabularies.
+SPACE_MARKERS = "Ġ▁"
+
+_risk_token_ids = weakref.WeakKeyDictionary()
+
+def get_risk_token_ids(tokenizer, safe_token="No", unsafe_token="Yes"):
+    """
+    Finds every vocabulary id that spells the safe or unsafe token.
+
+    The vocabulary is scanned once per tokenizer and token pair; later calls return the
+    cached ids. Variants differing in case or carrying a leading-space marker all count.
+
+    Parameters:
+    - tokenizer: Tokenizer whose vocabulary is scanned.
+    - safe_token: Token representing "safe" content.
+    - unsafe_token: Token representing "unsafe" content.
+
+    Returns:
+    - safe_ids: LongTensor of ids for the safe token variants.
+    - unsafe_ids: LongTensor of ids for the unsafe token variants.
+    """
+    cached = _risk_token_ids.setdefault(tokenizer, {})
+    key = (safe_token.lower(), unsafe_token.lower())
+    if key not in cached:
+        safe_ids, unsafe_ids = [], []
+        for token, index in tokenizer.get_vocab().items():
+            normalized = token.strip().lstrip(SPACE_MARKERS).strip().lower()
+            if normalized == key[0]:
+                safe_ids.append(index)
+            elif normalized == key[1]:
+                unsafe_ids.append(index)
+        cached[key] = (torch.tensor(sorted(safe_ids), dtype=torch.long),
+                       torch.tensor(sorted(unsafe_ids), dtype=torch.long))
+    return cached[key]
+
+def parse_output(output, input_len, tokenizer, safe_token="No", unsafe_token="Yes", nlogprobs=20, index=0):
     """
     Parses the model's output to determine the risk label and probability.
 
@@ -18,30 +53,110 @@ def parse_output(output, input_len, tokenizer, safe_token="No", unsafe_token="Ye
     - safe_token: Token representing "safe" content.
     - unsafe_token: Token representing "unsafe" content.
     - nlogprobs: Number of top probabilities to consider.
+    - index: Row of a batched `generate` output to parse.
 
     Returns:
     - label: "Yes", "No", or "Failed" based on the generated token.
     - prob_of_risk: Probability of risk (unsafe content).
     """
-    label, prob_of_risk = None, None
-    if nlogprobs > 0:
+    return parse_batch_output(output, input_len, tokenizer, safe_token, unsafe_token, nlogprobs)[index]
+
+def parse_batch_output(output, input_len, tokenizer, safe_token="No", unsafe_token="Yes", nlogprobs=20):
+    """
+    Parses every row of a batched `generate` output.
+
+    Parameters:
+    - output: Model output from the `generate` function.
+    - input_len: Length of the (padded) input token sequence.
+    - tokenizer: Tokenizer used for decoding.
+    - safe_token: Token representing "safe" content.
+    - unsafe_token: Token representing "unsafe" content.
+    - nlogprobs: Number of top probabilities to consider.
+
+    Returns:
+    - List of (label, prob_of_risk) tuples, one per row.
+    """
+    generated = output.sequences[:, input_len:]
+    # In a batch, rows that hit EOS early keep producing padding until the longest row
+    # finishes; only the steps up to a row's own EOS match a single-item generate call.
+    num_steps = [min(_generated_length(row, tokenizer), len(output.scores)) for row in generated]
+
+    probs_of_risk = [None] * len(generated)
+    if nlogprobs > 0 and len(output.scores) > 1:
         logprobs = [
             torch.topk(token, k=nlogprobs, largest=True, sorted=True)
             for token in output.scores[:-1]
         ]
-        if logprobs:
-            prob = get_probabilities(logprobs, tokenizer, safe_token, unsafe_token)
-            prob_of_risk = prob[1]
+        probs = get_batch_probabilities(
+            logprobs, tokenizer, safe_token, unsafe_token, num_steps=[steps - 1 for steps in num_steps]
+        )
+        probs_of_risk = [prob[1] if steps > 1 else None for prob, steps in zip(probs, num_steps)]
+
+    results = []
+    for row, steps, prob_of_risk in zip(generated, num_steps, probs_of_risk):
+        generated_text = tokenizer.decode(row[:steps], skip_special_tokens=True).strip()
+        results.append((_label(generated_text, safe_token, unsafe_token), prob_of_risk.item() if prob_of_risk else None))
+    return results
+
+def parse_verdict(logits, tokenizer, safe_token="No", unsafe_token="Yes", nlogprobs=20, index=0):
+    """
+    Determines the risk label and probability from next-token logits alone.
+
+    This is the first step of the greedy generation `parse_output` inspects, so the
+    label and probability follow the same contract without generating any tokens.
 
-    generated_text = tokenizer.decode(output.sequences[:, input_len:][0], skip_special_tokens=True).strip()
-    if unsafe_token.lower() == generated_text.lower():
-        label = unsafe_token
-    elif safe_token.lower() == generated_text.lower():
-        label = safe_token
-    else:
-        label = "Failed"
+    Parameters:
+    - logits: Next-token logits at the final prompt position, shape (batch, vocab).
+    - tokenizer: Tokenizer used for decoding.
+    - safe_token: Token representing "safe" content.
+    - unsafe_token: Token representing "unsafe" content.
+    - nlogprobs: Number of top probabilities to consider.
+    - index: Row of the batch to parse.
 
-    return label, prob_of_risk.item() if prob_of_risk else None
+    Returns:
+    - label: "Yes", "No", or "Failed" based on the most likely next token.
+    - prob_of_risk: Probability of risk (unsafe content).
+    """
+    return parse_batch_verdict(logits[index:index + 1], tokenizer, safe_token, unsafe_token, nlogprobs)[0]
+
+def parse_batch_verdict(logits, tokenizer, safe_token="No", unsafe_token="Yes", nlogprobs=20):
+    """
+    Determines the risk label and probability for every row of next-token logits.
+
+    Parameters:
+    - logits: Next-token logits at the final prompt position, shape (batch, vocab).
+    - tokenizer: Tokenizer used for decoding.
+    - safe_token: Token representing "safe" content.
+    - unsafe_token: Token representing "unsafe" content.
+    - nlogprobs: Number of top probabilities to consider.
+
+    Returns:
+    - List of (label, prob_of_risk) tuples, one per row.
+    """
+    probs_of_risk = [None] * len(logits)
+    if nlogprobs > 0:
+        logprobs = [torch.topk(logits, k=nlogprobs, largest=True, sorted=True)]
+        probs_of_risk = get_batch_probabilities(logprobs, tokenizer, safe_token, unsafe_token)[:, 1]
+
+    results = []
+    for token_id, prob_of_risk in zip(logits.argmax(dim=-1), probs_of_risk):
+        predicted_text = tokenizer.decode(token_id, skip_special_tokens=True).strip()
+        results.append((_label(predicted_text, safe_token, unsafe_token), prob_of_risk.item() if prob_of_risk else None))
+    return results
+
+def _label(text, safe_token, unsafe_token):
+    if unsafe_token.lower() == text.lower():
+        return unsafe_token
+    elif safe_token.lower() == text.lower():
+        return safe_token
+    return "Failed"
+
+def _generated_length(generated, tokenizer):
+    """Number of generated tokens up to and including the first EOS token."""
+    eos_positions = (generated == tokenizer.eos_token_id).nonzero()
+    if len(eos_positions) > 0:
+        return eos_positions[0].item() + 1
+    return generated.shape[0]
 
 def get_probabilities(logprobs, tokenizer, safe_token="No", unsafe_token="Yes"):
     """
@@ -56,22 +171,49 @@ def get_probabilities(logprobs, tokenizer, safe_token="No", unsafe_token="Yes"):
     Returns:
     - probabilities: Softmax-normalized probabilities for safe and unsafe tokens.
     """
-    safe_token_prob = 1e-50
-    unsafe_token_prob = 1e-50
-    for token_probs in logprobs:
-        for logprob, index in zip(token_probs.values.tolist()[0], token_probs.indices.tolist()[0]):
-            token = tokenizer.convert_ids_to_tokens(index)
-            if token.strip().lower() == safe_token.lower():
-                safe_token_prob += math.exp(logprob)
-            elif token.strip().lower() == unsafe_token.lower():
-                unsafe_token_prob += math.exp(logprob)
-
-    probabilities = torch.softmax(
-        torch.tensor([math.log(safe_token_prob), math.log(unsafe_token_prob)]), dim=0
+    return get_batch_probabilities(logprobs, tokenizer, safe_token, unsafe_token)[0]
+
+def get_batch_probabilities(logprobs, tokenizer, safe_token="No", unsafe_token="Yes", num_steps=None):
+    """
+    Calculates probabilities for safe and unsafe tokens for every row of a batch.
+
+    The top-k entries of all steps are matched against the cached safe/unsafe ids from
+    `get_risk_token_ids` and reduced with a single logsumexp per row.
+
+    Parameters:
+    - logprobs: List of top probabilities for each token in the sequence, shape (batch, k) per step.
+    - tokenizer: Tokenizer for token ID conversion.
+    - safe_token: Token representing "safe" content.
+    - unsafe_token: Token representing "unsafe" content.
+    - num_steps: Optional number of leading steps to count for each row (default: all).
+
+    Returns:
+    - probabilities: Softmax-normalized probabilities, shape (batch, 2) as [safe, unsafe].
+    """
+    safe_ids, unsafe_ids = get_risk_token_ids(tokenizer, safe_token, unsafe_token)
+    values = torch.stack([token_probs.values for token_probs in logprobs], dim=1).double()
+    indices = torch.stack([token_probs.indices for token_probs in logprobs], dim=1)
+    if num_steps is not None:
+        steps = torch.arange(values.shape[1], device=values.device)
+        counted = steps[None, :] < torch.as_tensor(num_steps, device=values.device)[:, None]
+        values = values.masked_fill(~counted[:, :, None], float("-inf"))
+    values = values.flatten(1)
+    indices = indices.flatten(1)
+
+    # Every probability carries the same 1e-50 floor as the original accumulator.
+    floor = torch.tensor(math.log(1e-50), dtype=values.dtype, device=values.device)
+    safe = torch.logaddexp(
+        torch.logsumexp(values.masked_fill(~torch.isin(indices, safe_ids.to(indices.device)), float("-inf")), dim=-1),
+        floor,
+    )
+    unsafe = torch.logaddexp(
+        torch.logsumexp(values.masked_fill(~torch.isin(indices, unsafe_ids.to(indices.device)), float("-inf")), dim=-1),
+        floor,
     )
-    return probabilities
+    return torch.softmax(torch.stack([safe, unsafe], dim=-1), dim=-1).float().cpu()
 
-def test_risk(messages, model, tokenizer, device, guardian_config=None, max_new_tokens=20):
+def test_risk(messages, model, tokenizer, device, guardian_config=None, max_new_tokens=20, mode="generate",
+              cache=None):
     """
     Runs the model to evaluate risk for a given message.
 
@@ -82,17 +224,36 @@ def test_risk(messages, model, tokenizer, device, guardian_config=None, max_new_
     - device: Device to run the model on (CPU/GPU).
     - guardian_config: Optional configuration for the model.
     - max_new_tokens: Maximum number of tokens to generate.
+    - mode: "generate" to decode up to `max_new_tokens` tokens, or "verdict" to read the
+      label from a single forward pass over the prompt.
+    - cache: Optional `verdict_cache.VerdictCache`; the model only runs on a cache miss.
 
     Returns:
     - label: "Yes", "No", or "Failed" based on the generated token.
     - prob_of_risk: Probability of risk (unsafe content).
     """
-    input_ids = tokenizer.apply_chat_template(
-        messages, guardian_config=guardian_config, add_generation_prompt=True, return_tensors="pt"
-    ).to(device)
+    _check_mode(mode)
+    if cache is not None:
+        return test_risk_batch([messages], model, tokenizer, device, guardian_configs=[guardian_config],
+                               max_new_tokens=max_new_tokens, mode=mode, cache=cache)[0]
+    instrumentation.begin("test_risk")
+    with instrumentation.stage("tokenize"):
+        input_ids = tokenizer.apply_chat_template(
+            messages, guardian_config=guardian_config, add_generation_prompt=True, return_tensors="pt"
+        )
     input_len = input_ids.shape[1]
+    with instrumentation.stage("to_device"):
+        input_ids = input_ids.to(device)
+
+    if mode == "verdict":
+        with instrumentation.stage("forward"), torch.no_grad():
+            logits = model(input_ids, use_cache=False).logits[:, -1, :]
+        with instrumentation.stage("postprocess"):
+            verdict = parse_verdict(logits, tokenizer)
+        instrumentation.end(lengths=(input_len,))
+        return verdict
 
-    with torch.no_grad():
+    with instrumentation.stage("forward"), torch.no_grad():
         output = model.generate(
             input_ids,
             do_sample=False,
@@ -101,5 +262,120 @@ def test_risk(messages, model, tokenizer, device, guardian_config=None, max_new_
             output_scores=True,
         )
 
-    return parse_output(output, input_len, tokenizer)
+    with instrumentation.stage("postprocess"):
+        verdict = parse_output(output, input_len, tokenizer)
+    instrumentation.end(lengths=(input_len,))
+    return verdict
+
+def test_risk_batch(messages_list, model, tokenizer, device, guardian_configs=None, batch_size=8, max_new_tokens=20,
+                    mode="generate", prefix_cache=None, cache=None):
+    """
+    Runs the model to evaluate risk for many conversations at once.
+
+    Each conversation is rendered with its own chat template, left-padded to the
+    longest member of its batch and generated together, so per-item results match
+    `test_risk`.
+
+    Parameters:
+    - messages_list: List of message lists (one conversation per item), or a
+      `token_cache.TokenizedCorpus` built with `chat=True` (its guardian_configs are
+      already rendered, so `guardian_configs`, `prefix_cache` and `cache` do not apply).
+    - model: Pretrained model (causal LM).
+    - tokenizer: Tokenizer for the model.
+    - device: Device to run the model on (CPU/GPU).
+    - guardian_configs: Optional configuration shared by all items, or a list with one per item.
+    - batch_size: Number of conversations generated per forward pass.
+    - max_new_tokens: Maximum number of tokens to generate.
+    - mode: "generate" or "verdict", as for `test_risk`.
+    - prefix_cache: Optional `prefix_cache.PrefixCache` for `model`; in verdict mode the
+      shared template prefix is then encoded once and only the suffixes are run.
+    - cache: Optional `verdict_cache.VerdictCache`; only uncached conversations are run.
+
+    Returns:
+    - List of (label, prob_of_risk) tuples in the order of `messages_list`.
+    """
+    _check_mode(mode)
+    corpus = messages_list if isinstance(messages_list, TokenizedCorpus) else None
+    if corpus is not None and (cache is not None or prefix_cache is not None):
+        raise ValueError("A TokenizedCorpus is scored directly; it cannot be combined with `cache` or `prefix_cache`.")
+    if guardian_configs is None or isinstance(guardian_configs, dict):
+        guardian_configs = [guardian_configs] * len(messages_list)
+    if cache is not None:
+        # Generation length only changes the result in generate mode.
+        scorer = f"test_risk:{mode}" + (f":{max_new_tokens}" if mode == "generate" else "")
+        items = [{"messages": messages, "guardian_config": config}
+                 for messages, config in zip(messages_list, guardian_configs)]
+        verdicts = cache.map(model, scorer, items, lambda misses: test_risk_batch(
+            [item["messages"] for item in misses], model, tokenizer, device,
+            guardian_configs=[item["guardian_config"] for item in misses], batch_size=batch_size,
+            max_new_tokens=max_new_tokens, mode=mode, prefix_cache=prefix_cache,
+        ))
+        return [tuple(verdict) for verdict in verdicts]
+    if mode == "verdict" and prefix_cache is not None:
+        return prefix_cache.score_batch(messages_list, guardian_configs, batch_size=batch_size)
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+    results = []
+    for i in range(0, len(messages_list), batch_size):
+        instrumentation.begin("test_risk_batch")
+        if corpus is not None:
+            indices = range(i, min(i + batch_size, len(corpus)))
+            lengths = [corpus.lengths[index] for index in indices]
+            with instrumentation.stage("pad"):
+                input_ids, attention_mask = corpus.pad(indices, pad_token_id, padding_side="left")
+        else:
+            with instrumentation.stage("tokenize"):
+                encoded = [
+                    tokenizer.apply_chat_template(messages, guardian_config=config, add_generation_prompt=True)
+                    for messages, config in zip(messages_list[i:i + batch_size], guardian_configs[i:i + batch_size])
+                ]
+            lengths = [len(ids) for ids in encoded]
+            with instrumentation.stage("pad"):
+                input_ids, attention_mask = _left_pad(encoded, pad_token_id)
+        with instrumentation.stage("to_device"):
+            input_ids, attention_mask = input_ids.to(device), attention_mask.to(device)
+        input_len = input_ids.shape[1]
+
+        if mode == "verdict":
+            # Left padding shifts real tokens right, so positions come from the mask.
+            position_ids = (attention_mask.cumsum(dim=-1) - 1).clamp(min=0)
+            with instrumentation.stage("forward"), torch.no_grad():
+                logits = model(
+                    input_ids, attention_mask=attention_mask, position_ids=position_ids, use_cache=False
+                ).logits[:, -1, :]
+            with instrumentation.stage("postprocess"):
+                results.extend(parse_batch_verdict(logits, tokenizer))
+            instrumentation.end(lengths=lengths)
+            continue
+
+        with instrumentation.stage("forward"), torch.no_grad():
+            output = model.generate(
+                input_ids,
+                attention_mask=attention_mask,
+                do_sample=False,
+                max_new_tokens=max_new_tokens,
+                return_dict_in_generate=True,
+                output_scores=True,
+                pad_token_id=pad_token_id,
+            )
+
+        with instrumentation.stage("postprocess"):
+            results.extend(parse_batch_output(output, input_len, tokenizer))
+        instrumentation.end(lengths=lengths)
+    return results
+
+def _left_pad(sequences, pad_token_id, device=None):
+    """Left-pads token id lists into `input_ids` and `attention_mask` tensors (on `device` if given)."""
+    max_len = max(len(ids) for ids in sequences)
+    input_ids = torch.full((len(sequences), max_len), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), max_len), dtype=torch.long)
+    for row, ids in enumerate(sequences):
+        input_ids[row, max_len - len(ids):] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, max_len - len(ids):] = 1
+    if device is None:
+        return input_ids, attention_mask
+    return input_ids.to(device), attention_mask.to(device)
 
+def _check_mode(mode):
+    if mode not in ("generate", "verdict"):
+        raise ValueError(f"Unknown risk scoring mode: {mode!r}. Expected 'generate' or 'verdict'.")
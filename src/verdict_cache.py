@@ -0,0 +1,147 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+class VerdictCache:
+    """
+    Content-addressed cache of scorer outputs.
+
+    Entries are keyed by a hash of the model id and revision, the scorer name and
+    settings, the guardian_config and the input itself, so thresholds can change
+    without invalidating anything. An in-memory LRU sits in front of an optional
+    SQLite file that persists across runs.
+
+    Parameters:
+    - path: Optional SQLite file for the persistent store (None keeps the cache in memory only).
+    - max_entries: Maximum number of entries held in the in-memory LRU.
+    """
+
+    def __init__(self, path=None, max_entries=100000):
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0}
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self.db.commit()
+
+    @staticmethod
+    def make_key(model, scorer, item, guardian_config=None):
+        """
+        Hashes everything that determines a scorer's output for one input.
+
+        Parameters:
+        - model: The model producing the score (its config supplies the id and revision; its class,
+          parameter dtype and `precision.apply_precision` int8 mode tell fp32, bf16, int8 and ONNX copies apart).
+        - scorer: str, scorer name plus any settings that change its output.
+        - item: JSON-serializable input (prompt text or message list).
+        - guardian_config: Optional configuration for the guardian model.
+
+        Returns:
+        - str: Hex SHA-256 digest.
+        """
+        config = getattr(model, "config", None)
+        parameters = model.parameters() if hasattr(model, "parameters") else iter(())
+        dtype = next(parameters, None)
+        payload = json.dumps({
+            "model": getattr(config, "_name_or_path", type(model).__name__),
+            "revision": getattr(config, "_commit_hash", None),
+            "class": type(model).__name__,
+            "dtype": str(dtype.dtype) if dtype is not None else None,
+            "quantized": getattr(model, "guardian_precision", None) == "int8",
+            "scorer": scorer,
+            "guardian_config": guardian_config,
+            "input": item,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Returns a dict of the cached values found for `keys`."""
+        found = {}
+        with self.lock:
+            missing = []
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+                    self.stats["memory_hits"] += 1
+                else:
+                    missing.append(key)
+            if self.db is not None and missing:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self.db.execute(
+                        f"SELECT key, value FROM verdicts WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, value in rows:
+                        found[key] = json.loads(value)
+                        self._remember(key, found[key])
+                        self.stats["disk_hits"] += 1
+            self.stats["hits"] += sum(1 for key in keys if key in found)
+            self.stats["misses"] += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items):
+        """Stores (key, value) pairs in memory and, if configured, on disk."""
+        with self.lock:
+            for key, value in items:
+                self._remember(key, value)
+            if self.db is not None:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO verdicts (key, value) VALUES (?, ?)",
+                    [(key, json.dumps(value)) for key, value in items],
+                )
+                self.db.commit()
+
+    def map(self, model, scorer, items, compute, guardian_configs=None):
+        """
+        Returns scorer outputs for `items`, running `compute` only on cache misses.
+
+        Parameters:
+        - model: The model producing the scores.
+        - scorer: str, scorer name plus any settings that change its output.
+        - items: List of JSON-serializable inputs.
+        - compute: Function taking the list of missed inputs and returning their outputs in order.
+        - guardian_configs: Optional list with one guardian_config per item.
+
+        Returns:
+        - List of outputs in the order of `items` (JSON round-tripped, so tuples come back as lists).
+        """
+        if guardian_configs is None:
+            guardian_configs = [None] * len(items)
+        keys = [self.make_key(model, scorer, item, config) for item, config in zip(items, guardian_configs)]
+        found = self.get_many(keys)
+
+        # Repeated inputs within one call are computed once.
+        misses = {}
+        for i, key in enumerate(keys):
+            if key not in found:
+                misses.setdefault(key, i)
+        if misses:
+            computed = compute([items[i] for i in misses.values()])
+            # Normalise through JSON so hits and misses come back in the same shape.
+            computed = [json.loads(json.dumps(value)) for value in computed]
+            self.put_many(list(zip(misses, computed)))
+            found.update(zip(misses, computed))
+        return [found[key] for key in keys]
+
+    def hit_rate(self):
+        """Fraction of lookups served from the cache."""
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
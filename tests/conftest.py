@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+# The runners import the shared utilities as top-level modules (`from utils import ...`),
+# so the tests put `src/` and the data generation scripts on the path the same way
+# running a script from there would.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "data_generation", "scripts"))
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from tiny_models import build_guardian_model, build_hap_model, build_tokenizer
+
+
+@pytest.fixture(scope="session")
+def guardian_tokenizer():
+    """Small byte-level BPE tokenizer carrying a Granite Guardian style chat template."""
+    return build_tokenizer()
+
+
+@pytest.fixture(scope="session")
+def guardian_model(guardian_tokenizer):
+    """Randomly initialised Granite causal LM sized for unit tests."""
+    return build_guardian_model(guardian_tokenizer, size="test")
+
+
+@pytest.fixture(scope="session")
+def hap_model(guardian_tokenizer):
+    """Randomly initialised RoBERTa sequence classifier shaped like the HAP models."""
+    return build_hap_model(guardian_tokenizer, size="test")
+
+
+@pytest.fixture(scope="session")
+def device():
+    return torch.device("cpu")
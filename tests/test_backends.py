@@ -0,0 +1,17 @@
+import pytest
+
+import backends
+import utils
+from tests.test_utils import PROMPTS
+
+pytest.importorskip("onnxruntime")
+
+
+def test_onnx_backend_matches_torch_through_score_guardian_hap(tmp_path, guardian_tokenizer, hap_model, device):
+    paths = backends.export_onnx(hap_model, guardian_tokenizer, str(tmp_path), optimize=True, quantize=True)
+    onnx_model, tokenizer = backends.load_hap_backend(str(tmp_path), "onnx")
+    expected = utils.score_guardian_hap(device, PROMPTS, hap_model, guardian_tokenizer, batch_size=3)
+    assert utils.score_guardian_hap(device, PROMPTS, onnx_model, tokenizer, batch_size=3) == pytest.approx(expected, abs=1e-5)
+
+    report = backends.validate(PROMPTS, hap_model, backends.OnnxSequenceClassifier(paths["int8"]), guardian_tokenizer)
+    assert report["items"] == len(PROMPTS) and report["max_delta"] < 0.05
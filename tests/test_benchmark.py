@@ -0,0 +1,23 @@
+import benchmark
+
+
+def test_run_case_reports_throughput_latency_and_memory(guardian_tokenizer, guardian_model, hap_model, device):
+    models = {"tokenizer": guardian_tokenizer, "hap": hap_model, "guardian": guardian_model}
+    prompts = benchmark.make_prompts(guardian_tokenizer, 3, 16)
+    assert len(set(prompts)) == 3
+    assert all(len(guardian_tokenizer(p, add_special_tokens=False)["input_ids"]) <= 16 for p in prompts)
+    for workload in ("hap", "xl", "risk"):
+        result = benchmark.run_case(workload, models, device, batch_size=2, seq_len=16, threads=1, iterations=2, warmup=1)
+        assert result["items_per_sec"] > 0 and result["tokens_per_sec"] >= result["items_per_sec"] * 8
+        assert result["latency_ms"]["p50"] <= result["latency_ms"]["p95"] <= result["latency_ms"]["p99"]
+        assert result["peak_rss_mb"] is None or result["peak_rss_mb"] > 0
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    def result(items_per_sec, p95, batch_size=8):
+        return {"workload": "hap", "batch_size": batch_size, "seq_len": 128, "threads": 1,
+                "items_per_sec": items_per_sec, "latency_ms": {"p50": p95, "p95": p95, "p99": p95}}
+
+    baseline = {"results": [result(100.0, 10.0), result(100.0, 10.0, batch_size=1)]}
+    comparison = benchmark.compare([result(95.0, 10.5), result(80.0, 10.0, batch_size=1), result(1.0, 1.0, 64)], baseline)
+    assert [entry["regression"] for entry in comparison] == [False, True]
@@ -0,0 +1,61 @@
+import pytest
+
+import cascade
+
+PROMPTS = ["a", "b", "c", "d", "e"]
+HAP_SCORES = {"a": 0.1, "b": 0.2, "c": 0.5, "d": 0.8, "e": 0.79}
+
+
+@pytest.fixture
+def stub_models(monkeypatch):
+    """Replaces both tiers with lookups so routing can be tested without models."""
+    guardian_calls = []
+
+    def score_guardian_hap(device, data, model, tokenizer, embeddings=None):
+        return [HAP_SCORES[text] for text in data]
+
+    def test_risk_batch(messages_list, model, tokenizer, device, guardian_configs=None, batch_size=8, mode="verdict"):
+        texts = [messages[0]["content"] for messages in messages_list]
+        guardian_calls.append(texts)
+        return [("Failed", None) if text == "e" else ("Yes", 0.9) for text in texts]
+
+    monkeypatch.setattr(cascade, "score_guardian_hap", score_guardian_hap)
+    monkeypatch.setattr(cascade, "test_risk_batch", test_risk_batch)
+    return guardian_calls
+
+
+def test_tier_routing_at_the_window_bounds(stub_models):
+    stats = {}
+    results = cascade.cascade_score(None, PROMPTS, None, None, None, None, low=0.2, high=0.8, batch_size=2,
+                                    stats=stats)
+    assert [result["tier"] for result in results] == ["hap", "guardian", "guardian", "hap", "hap_fallback"]
+    assert [result["label"] for result in results] == [0, 1, 1, 1, 1]
+    assert stub_models == [["b", "c"], ["e"]]
+    assert stats["escalated"] == 3 and stats["escalation_rate"] == pytest.approx(0.6)
+
+
+def test_failed_verdicts_fall_back_to_the_hap_score(stub_models):
+    stats = {}
+    results = cascade.cascade_score(None, ["e"], None, None, None, None, low=0.2, high=0.9, stats=stats)
+    assert results == [{"label": 1, "score": 0.79, "tier": "hap_fallback"}]
+    results = cascade.cascade_score(None, ["e"], None, None, None, None, low=0.7, high=0.95)
+    assert results[0]["label"] == 0
+    assert stats["guardian"] == {"count": 0, "seconds": stats["guardian"]["seconds"], "failed": 1}
+
+
+def test_latency_summary_per_tier(stub_models):
+    stats = {}
+    cascade.cascade_score(None, PROMPTS, None, None, None, None, batch_size=1, stats=stats)
+    assert {tier: latency["count"] for tier, latency in stats["latency"].items()} == \
+        {"hap": 2, "guardian": 2, "hap_fallback": 1}
+    guardian = stats["latency"]["guardian"]
+    assert guardian["p50"] <= guardian["p95"]
+    assert stats["latency"]["hap"]["p95"] <= guardian["p50"]
+
+
+def test_cascade_with_models(hap_model, guardian_model, guardian_tokenizer, device):
+    stats = {}
+    results = cascade.cascade_score(device, ["Hello there", "How are you?"], hap_model, guardian_tokenizer,
+                                    guardian_model, guardian_tokenizer, low=0.0, high=1.1, stats=stats)
+    assert stats["escalation_rate"] == 1.0
+    assert all(result["tier"] in ("guardian", "hap_fallback") for result in results)
@@ -0,0 +1,78 @@
+import pytest
+
+import chunking
+
+DOCUMENT = ("The weather is nice today. We walked along the river and fed the ducks!\n"
+            "Later we cooked dinner together? It was a quiet evening.")
+
+
+def token_count(tokenizer, text):
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def test_window_spans_cover_the_document(guardian_tokenizer):
+    spans = list(chunking.iter_chunks(DOCUMENT, guardian_tokenizer, window=8, stride=6))
+    assert spans[0][0] == 0 and spans[-1][1] == len(DOCUMENT)
+    for (start, end), (next_start, _) in zip(spans, spans[1:]):
+        assert next_start <= end  # overlapping or touching, never a gap
+    assert all(token_count(guardian_tokenizer, DOCUMENT[start:end]) <= 8 for start, end in spans)
+
+
+def test_sentence_spans(guardian_tokenizer):
+    spans = list(chunking.iter_chunks(DOCUMENT, guardian_tokenizer, mode="sentence"))
+    assert [DOCUMENT[start:end].strip() for start, end in spans] == [
+        "The weather is nice today.", "We walked along the river and fed the ducks!",
+        "Later we cooked dinner together?", "It was a quiet evening."]
+
+
+def test_long_sentence_is_split_into_windows(guardian_tokenizer):
+    text = "Intro. " + "word " * 2000 + "."
+    spans = list(chunking.iter_chunks(text, guardian_tokenizer, mode="sentence", window=510, stride=384))
+    assert spans[0] == (0, 6)
+    assert len(spans) > 2 and spans[1][0] >= 6 and spans[-1][1] == len(text)
+    assert all(token_count(guardian_tokenizer, text[start:end]) <= 510 for start, end in spans)
+
+
+@pytest.mark.parametrize("stride", [0, -1, 9])
+def test_invalid_stride_is_rejected(guardian_tokenizer, stride):
+    with pytest.raises(ValueError):
+        list(chunking.iter_chunks(DOCUMENT, guardian_tokenizer, window=8, stride=stride))
+
+
+def test_empty_text(hap_model, guardian_tokenizer, device):
+    assert list(chunking.iter_chunks("", guardian_tokenizer)) == []
+    assert chunking.score_document(device, "", hap_model, guardian_tokenizer) == (0, 0.0, None)
+
+
+def fake_scorer(calls, unsafe_word=None):
+    def score(device, texts, model, tokenizer, batch_size=128):
+        calls.append(list(texts))
+        return [0.9 if unsafe_word and unsafe_word in text else 0.1 for text in texts]
+    return score
+
+
+def test_scoring_stops_at_the_first_unsafe_batch(guardian_tokenizer, device, monkeypatch):
+    calls = []
+    monkeypatch.setattr(chunking, "score_guardian_hap", fake_scorer(calls, unsafe_word="river"))
+    label, max_score, span = chunking.score_document(device, DOCUMENT * 4, None, guardian_tokenizer,
+                                                     mode="sentence", batch_size=2)
+    assert (label, max_score) == (1, 0.9)
+    assert len(calls) == 1
+    assert (DOCUMENT * 4)[span[0]:span[1]].strip() == "We walked along the river and fed the ducks!"
+
+
+def test_clean_document_is_scored_in_full(guardian_tokenizer, device, monkeypatch):
+    calls = []
+    monkeypatch.setattr(chunking, "score_guardian_hap", fake_scorer(calls))
+    label, max_score, _ = chunking.score_document(device, DOCUMENT * 4, None, guardian_tokenizer,
+                                                  mode="sentence", batch_size=3)
+    assert (label, max_score) == (0, 0.1)
+    assert sum(len(batch) for batch in calls) == 16
+
+
+def test_real_model_scores_match_direct_scoring(hap_model, guardian_tokenizer, device):
+    import utils
+    label, max_score, span = chunking.score_document(device, DOCUMENT, hap_model, guardian_tokenizer,
+                                                     threshold=1.1, mode="sentence")
+    expected = utils.score_guardian_hap(device, [DOCUMENT[span[0]:span[1]]], hap_model, guardian_tokenizer)
+    assert label == 0 and max_score == pytest.approx(expected[0], abs=1e-5)
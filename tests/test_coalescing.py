@@ -0,0 +1,53 @@
+from coalescing import TOPIC_HEADER, generate_coalesced, split_topics
+from generation_engine import GenerationClient
+from stub_inference_server import StubInferenceServer, default_response
+
+
+def build_prompt(group):
+    sections = [f"Generate diverse requests for each of the {len(group)} topics below."]
+    for index, ((topic,), count) in enumerate(group, start=1):
+        sections.append(f"{TOPIC_HEADER.format(index=index)}\nNumber of requests: {count}\nTopic: {topic}")
+    return "\n\n".join(sections)
+
+
+def parse_section(unit, section):
+    return [{"user": line[len("Request: "):], "topic": unit[0]}
+            for line in section.splitlines() if line.startswith("Request: ")]
+
+
+def test_split_topics_ignores_preamble_and_unknown_topics():
+    text = "Sure!\n### Topic 2\nRequest: b\nTopic 1:\nRequest: a1\nRequest: a2\n### Topic 7\nRequest: x"
+    sections = split_topics(text, 3)
+    assert [len(parse_section(("t",), section)) for section in sections] == [2, 1, 0]
+
+
+def test_coalescing_cuts_calls_and_rerequests_short_topics():
+    calls = []
+
+    def short_first_answer(prompt):
+        # The first call drops every request of topic "b".
+        calls.append(prompt)
+        text = default_response(prompt)
+        if len(calls) == 1:
+            sections = split_topics(text, 3)
+            text = "\n".join(f"{TOPIC_HEADER.format(index=i + 1)}\n{s.strip()}" for i, s in enumerate(sections) if i != 1)
+        return text
+
+    server = StubInferenceServer(response_fn=short_first_answer).start()
+    try:
+        client = GenerationClient(server.url, concurrency=1)
+        stats = {}
+        units = [("a",), ("b",), ("c",), ("d",)]
+        outcomes = list(generate_coalesced(client, units, 3, build_prompt, parse_section, group_size=3, stats=stats))
+        client.close()
+    finally:
+        server.stop()
+
+    records = {unit: records for unit, records, error in outcomes if error is None}
+    assert sorted(records) == units
+    assert all(len(unit_records) == 3 and {r["topic"] for r in unit_records} == set(unit)
+               for unit, unit_records in records.items())
+    assert stats == {"calls": 3, "rounds": 2, "short_units": 1}
+    # The retry only asks for topic "b", and only for what is missing.
+    assert "Topic: b" in calls[-1] and "Number of requests: 3" in calls[-1] and "Topic: a" not in calls[-1]
+    assert client.stats["prompt_tokens"] > 0 and client.stats["completion_tokens"] > 0
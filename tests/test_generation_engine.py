@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from generation_engine import GenerationClient, GenerationError, TokenBucket
+from stub_inference_server import StubInferenceServer
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**kwargs):
+        servers.append(StubInferenceServer(**kwargs).start())
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_retries_transient_errors_and_keeps_results(stub):
+    server = stub(fail_first=3, fail_status=503)
+    client = GenerationClient(server.url, concurrency=4, max_retries=5, backoff_base=0.01)
+    jobs = list(range(6))
+    results = {
+        job: (result, error)
+        for job, result, error in client.run(
+            jobs,
+            lambda job: {"inputs": f"Generate 2 diverse requests about topic {job}"},
+            lambda job, response: response[0]["generated_text"].splitlines(),
+        )
+    }
+    client.close()
+    assert sorted(results) == jobs
+    assert all(error is None and len(result) == 2 for result, error in results.values())
+    assert client.stats["retries"] == 3
+
+
+def test_gives_up_on_non_retryable_status(stub):
+    server = stub(fail_first=100, fail_status=400)
+    client = GenerationClient(server.url, max_retries=3, backoff_base=0.01)
+    with pytest.raises(GenerationError, match="400"):
+        client.post({"inputs": "Generate 1 diverse requests"})
+    assert server.requests_seen == 1
+
+
+def test_requests_run_concurrently(stub):
+    server = stub(latency=0.2)
+    client = GenerationClient(server.url, concurrency=8)
+    start = time.perf_counter()
+    outcomes = list(client.run(range(8), lambda job: {"inputs": "x"}, lambda job, response: response))
+    assert time.perf_counter() - start < 1.0
+    assert all(error is None for _, _, error in outcomes)
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.perf_counter()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.perf_counter() - start >= 0.09
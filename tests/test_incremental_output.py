@@ -0,0 +1,27 @@
+import json
+
+from incremental_output import IncrementalWriter
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_resume_skips_completed_units_and_drops_partial_writes(tmp_path):
+    output_file = str(tmp_path / "out.jsonl")
+    writer = IncrementalWriter(output_file)
+    writer.write_unit(("a",), [{"user": "a1"}, {"user": "a2"}])
+    writer.write_unit(("b",), [{"user": "b1"}])
+    # Simulate a crash half-way through appending the next unit.
+    with open(output_file, "a") as f:
+        f.write('{"user": "c1"}\n{"user": "c')
+
+    writer = IncrementalWriter(output_file, resume=True)
+    assert writer.is_done(("a",)) and writer.is_done(("b",)) and not writer.is_done(("c",))
+    writer.write_unit(("c",), [{"user": "c1"}, {"user": "c2"}])
+    assert [r["user"] for r in read_jsonl(output_file)] == ["a1", "a2", "b1", "c1", "c2"]
+
+    writer = IncrementalWriter(output_file)
+    assert not writer.is_done(("a",))
+    assert read_jsonl(output_file) == []
@@ -0,0 +1,38 @@
+import instrumentation
+import utils
+import utils2b
+from tests.test_utils import PROMPTS
+from tests.test_utils2b import CONFIGS, MESSAGES
+
+
+def test_disabled_instrumentation_records_nothing(guardian_tokenizer, hap_model, device):
+    assert not instrumentation.enabled()
+    assert instrumentation.stage("forward") is instrumentation.stage("pad")
+    utils.score_guardian_hap(device, PROMPTS, hap_model, guardian_tokenizer, batch_size=4)
+
+
+def test_stages_and_batch_shapes_reach_every_sink(guardian_tokenizer, guardian_model, hap_model, device):
+    events, prometheus = [], instrumentation.PrometheusSink()
+    with instrumentation.instrumented(events.append, prometheus):
+        utils.score_guardian_hap(device, PROMPTS, hap_model, guardian_tokenizer, batch_size=4, max_tokens=None)
+        utils2b.test_risk_batch(MESSAGES, guardian_model, guardian_tokenizer, device, guardian_configs=CONFIGS,
+                                batch_size=2, mode="verdict")
+    assert not instrumentation.enabled()
+
+    hap_events = [event for event in events if event["function"] == "score_guardian_hap"]
+    assert hap_events[0]["event"] == "tokenize" and set(hap_events[0]["stages"]) == {"tokenize"}
+    batches = [event for event in hap_events if event["event"] == "batch"]
+    assert sum(event["batch_size"] for event in batches) == len(PROMPTS)
+    assert sum(event["tokens"] for event in batches) == hap_events[0]["tokens"]
+    for event in batches:
+        assert set(event["stages"]) == {"pad", "to_device", "forward", "postprocess"}
+        assert 0 <= event["padding_ratio"] < 1 and event["padded_tokens"] == event["batch_size"] * event["seq_len"]
+
+    risk_events = [event for event in events if event["function"] == "test_risk_batch"]
+    assert [event["batch_size"] for event in risk_events] == [2] * (len(MESSAGES) // 2) + [1] * (len(MESSAGES) % 2)
+    assert set(risk_events[0]["stages"]) == {"tokenize", "pad", "to_device", "forward", "postprocess"}
+
+    text = prometheus.render()
+    assert "# TYPE guardian_stage_seconds_total counter" in text
+    assert f'guardian_items_total{{event="batch",function="score_guardian_hap"}} {len(PROMPTS)}' in text
+    assert 'guardian_stage_calls_total{function="test_risk_batch",stage="forward"}' in text
@@ -0,0 +1,84 @@
+import json
+
+import numpy as np
+import pytest
+
+import metrics
+
+
+def brute_force(scores, labels, threshold):
+    predicted = scores >= threshold
+    return {"tp": int((predicted & (labels == 1)).sum()), "fp": int((predicted & (labels == 0)).sum()),
+            "fn": int((~predicted & (labels == 1)).sum()), "tn": int((~predicted & (labels == 0)).sum())}
+
+
+def test_sweep_matches_brute_force_per_group():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 2, 500)
+    scores = np.round(np.clip(rng.normal(0.35 + 0.3 * labels, 0.2), 0, 1), 2)  # Rounded: ties on thresholds
+    groups = rng.choice(["violence", "fraud", "privacy"], 500)
+    counts = metrics.sweep(scores, labels, groups, thresholds=101)
+    assert counts["groups"] == ["fraud", "privacy", "violence"]
+    for g, name in enumerate(counts["groups"]):
+        mask = groups == name
+        for j in (0, 30, 47, 100):
+            expected = brute_force(scores[mask], labels[mask], counts["thresholds"][j])
+            assert {key: int(counts[key][g, j]) for key in expected} == expected
+
+
+def test_roc_auc_is_exact_over_all_distinct_scores():
+    rng = np.random.default_rng(1)
+    labels = rng.integers(0, 2, 300)
+    scores = np.round(rng.random(300) * 0.5 + 0.3 * labels, 2)
+    counts = metrics.sweep(scores, labels, thresholds=np.unique(scores))
+    positives, negatives = scores[labels == 1], scores[labels == 0]
+    pairs = positives[:, None] - negatives[None, :]
+    expected = ((pairs > 0).sum() + 0.5 * (pairs == 0).sum()) / pairs.size  # Mann-Whitney, ties count half
+    assert metrics.roc_auc(counts)[0] == pytest.approx(expected)
+    assert 0 < metrics.average_precision(counts)[0] <= 1
+
+
+def test_summary_and_cli_report(tmp_path, monkeypatch, capsys):
+    harmful = [{"hap_score": score, "category": category} for score, category in
+               [(0.9, "fraud"), (0.8, "fraud"), (0.3, "fraud"), (0.95, "violence")]]
+    benign = [{"hap_score": score, "safety_type": "benign"} for score in (0.1, 0.2, 0.85)]
+    for name, records in (("harmful.jsonl", harmful), ("benign.jsonl", benign)):
+        (tmp_path / name).write_text("".join(json.dumps(record) + "\n" for record in records))
+
+    scores, labels, groups = metrics.load_scored([tmp_path / "harmful.jsonl"], label=1)
+    assert labels.tolist() == [1, 1, 1, 1] and groups["category"].tolist() == ["fraud", "fraud", "fraud", "violence"]
+
+    output = tmp_path / "report.json"
+    monkeypatch.setattr("sys.argv", ["metrics.py", "--positive", str(tmp_path / "harmful.jsonl"), "--negative",
+                                     str(tmp_path / "benign.jsonl"), "--group_fields", "category",
+                                     "--output", str(output)])
+    metrics.main()
+    report = json.loads(output.read_text())
+    overall = report["overall"]
+    assert overall["confusion"] == {"tp": 3, "fp": 1, "fn": 1, "tn": 2}
+    assert overall["precision"] == 0.75 and overall["recall"] == 0.75
+    assert overall["best"]["f1"] >= overall["f1"]
+    assert report["category"]["fraud"]["recall"] == pytest.approx(2 / 3, abs=1e-6)
+    assert report["category"]["unknown"]["confusion"]["fp"] == 1
+    assert "Overall at 0.500" in capsys.readouterr().err
+
+
+def test_null_scores_are_skipped_and_counted(tmp_path, monkeypatch, capsys):
+    benign = [{"prob_of_risk": 0.1}, {"prob_of_risk": None, "risk_label": "Failed"}, {"prob_of_risk": 0.2}]
+    (tmp_path / "benign.jsonl").write_text("".join(json.dumps(record) + "\n" for record in benign))
+    stats = {}
+    scores, labels, _ = metrics.load_scored([tmp_path / "benign.jsonl"], "prob_of_risk", label=0, stats=stats)
+    assert scores.tolist() == [0.1, 0.2] and labels.tolist() == [0, 0]
+    assert stats == {"rows": 3, "null_scores": 1}
+
+    output = tmp_path / "report.json"
+    monkeypatch.setattr("sys.argv", ["metrics.py", "--negative", str(tmp_path / "benign.jsonl"), "--score_field",
+                                     "prob_of_risk", "--group_fields", "--output", str(output)])
+    metrics.main()
+    report = json.loads(output.read_text())
+    assert report["skipped_null_scores"] == 1
+    assert report["overall"]["confusion"] == {"tp": 0, "fp": 0, "fn": 0, "tn": 2}
+    assert "Skipped 1 of 3 rows with a null prob_of_risk" in capsys.readouterr().err
+
+    with pytest.raises(ValueError, match="NaN"):
+        metrics.sweep([0.1, float("nan")], [0, 0])
@@ -0,0 +1,40 @@
+from functools import partial
+
+import pytest
+
+import parallel
+import precision
+import utils
+from tests.test_utils import PROMPTS
+
+
+@pytest.fixture(scope="module")
+def hap_dir(tmp_path_factory, hap_model, guardian_tokenizer):
+    path = tmp_path_factory.mktemp("hap")
+    hap_model.save_pretrained(path)
+    guardian_tokenizer.save_pretrained(path)
+    return str(path)
+
+
+def test_scoring_pool_matches_single_process(hap_dir, hap_model, guardian_tokenizer, device):
+    data = PROMPTS * 3
+    expected = utils.score_guardian_hap(device, data, hap_model, guardian_tokenizer, batch_size=4)
+    loader = partial(precision.load_model, hap_dir, "hap", device)
+    stats = {}
+    with parallel.ScoringPool(loader, guardian_tokenizer, workers=2) as pool:
+        scores = pool.score(data, batch_size=4, stats=stats)
+        assert pool.score([]) == []
+    assert scores == pytest.approx(expected, abs=1e-5)
+    assert stats["batches"] == -(-len(data) // 4)
+
+    report = parallel.scaling_report(data, loader, guardian_tokenizer, [1, 2], batch_size=4)
+    assert [row["workers"] for row in report] == [1, 2]
+    assert report[0]["speedup"] == report[0]["efficiency"] == 1.0
+    assert all(row["items_per_sec"] > 0 for row in report)
+
+
+def test_cpu_slots_assigns_disjoint_blocks():
+    slots = [parallel.cpu_slots(rank, 1) for rank in range(2)]
+    if slots[0] is None:
+        pytest.skip("CPU affinity is not available on this platform")
+    assert all(len(slot) == 1 for slot in slots)
@@ -0,0 +1,32 @@
+import copy
+
+import pytest
+import torch
+
+import precision
+import utils
+from tests.test_utils import PROMPTS
+
+
+def test_drift_report_compares_each_precision_to_fp32(guardian_tokenizer, guardian_model, hap_model, device):
+    for kind, model in (("hap", hap_model), ("guardian", guardian_model)):
+        report = precision.drift_report(
+            PROMPTS, kind, lambda mode: precision.apply_precision(copy.deepcopy(model), mode, device),
+            guardian_tokenizer, device, batch_size=4,
+        )
+        assert list(report) == ["fp32", "bf16", "int8"]
+        assert report["fp32"]["max_delta"] == 0 and report["fp32"]["label_flips"] == 0
+        for mode in ("bf16", "int8"):
+            assert 0 <= report[mode]["mean_delta"] <= report[mode]["max_delta"] < 0.1
+            assert report[mode]["items"] == len(PROMPTS)
+
+
+def test_reduced_precision_models_score_end_to_end(guardian_tokenizer, hap_model, device):
+    bf16 = precision.apply_precision(copy.deepcopy(hap_model), "bf16", device)
+    assert next(bf16.parameters()).dtype == torch.bfloat16
+    scores = utils.score_guardian_hap(device, PROMPTS, bf16, guardian_tokenizer, batch_size=4)
+    assert all(isinstance(score, float) for score in scores)
+    int8 = precision.apply_precision(copy.deepcopy(hap_model), "int8", device)
+    assert all(type(module) is not torch.nn.Linear for module in int8.modules())
+    with pytest.raises(ValueError, match="precision"):
+        precision.apply_precision(hap_model, "fp8", device)
@@ -0,0 +1,43 @@
+import pytest
+
+import prefix_cache
+import utils2b
+from tests.test_utils2b import CONFIGS, MESSAGES
+
+
+def test_prefix_cache_matches_full_verdict(guardian_model, guardian_tokenizer, device):
+    expected = [
+        utils2b.test_risk(messages, guardian_model, guardian_tokenizer, device, guardian_config=config, mode="verdict")
+        for messages, config in zip(MESSAGES, CONFIGS)
+    ]
+    cache = prefix_cache.PrefixCache(guardian_model, guardian_tokenizer, device, max_entries=2)
+    for _ in range(2):
+        cached = utils2b.test_risk_batch(
+            MESSAGES, guardian_model, guardian_tokenizer, device,
+            guardian_configs=CONFIGS, batch_size=2, mode="verdict", prefix_cache=cache,
+        )
+        assert [label for label, _ in cached] == [label for label, _ in expected]
+        assert [prob for _, prob in cached] == pytest.approx([prob for _, prob in expected], abs=1e-4)
+    assert cache.stats["hits"] > 0
+    assert len(cache.entries) <= 2
+
+
+def test_multi_risk_matches_independent_calls(guardian_model, guardian_tokenizer, device):
+    messages = MESSAGES[1]
+    risks = ["harm", "jailbreak", "profanity"]
+    verdicts = prefix_cache.test_risks(messages, risks, guardian_model, guardian_tokenizer, device)
+    assert list(verdicts) == risks
+    for risk in risks:
+        label, prob = utils2b.test_risk(
+            messages, guardian_model, guardian_tokenizer, device, guardian_config={"risk_name": risk}, mode="verdict"
+        )
+        assert verdicts[risk][0] == label
+        assert verdicts[risk][1] == pytest.approx(prob, abs=1e-4)
+
+
+def test_multi_risk_edge_cases(guardian_model, guardian_tokenizer, device):
+    messages = MESSAGES[1]
+    assert prefix_cache.test_risks(messages, [], guardian_model, guardian_tokenizer, device) == {}
+    with pytest.raises(ValueError, match="risk_name"):
+        prefix_cache.test_risks(messages, ["harm", {"risk_definition": "Anything rude."}], guardian_model,
+                                guardian_tokenizer, device)
@@ -0,0 +1,44 @@
+import importlib.util
+import os
+
+import pytest
+
+import registry
+from tests.conftest import ROOT
+
+
+@pytest.fixture
+def hap_dir(tmp_path, hap_model, guardian_tokenizer):
+    hap_model.save_pretrained(tmp_path)
+    guardian_tokenizer.save_pretrained(tmp_path)
+    yield str(tmp_path)
+    registry.release()
+
+
+def test_get_model_loads_once_and_warms_up(hap_dir, device):
+    model, tokenizer = registry.get_model(hap_dir, "hap", device)
+    assert registry.get_model(hap_dir, "hap", device) == (model, tokenizer)
+    [info] = registry.loaded()
+    assert info["model_id"] == hap_dir and info["load_seconds"] > 0 and info["warmup_seconds"] > 0
+    registry.get_model(hap_dir, "hap", device, precision="bf16", warmup=False)
+    assert [info["warmup_seconds"] is None for info in registry.loaded()] == [False, True]
+    assert registry.loaded("another/model") == []
+    assert len(registry.loaded(hap_dir)) == 2
+    registry.release(hap_dir)
+    assert registry.loaded() == []
+
+
+def test_runner_is_importable_without_loading(hap_dir, monkeypatch, capsys):
+    spec = importlib.util.spec_from_file_location("guardian_tiny", os.path.join(ROOT, "src", "guardian-tiny.py"))
+    runner = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(runner)
+    assert registry.loaded() == []
+    monkeypatch.setattr(runner, "model_id", hap_dir)
+    monkeypatch.chdir(ROOT)
+    registry.get_model(hap_dir + "/", "hap", device=None, warmup=False)  # Loaded first, but not the runner's model
+    runner.main()
+    out = capsys.readouterr().out
+    # Reported after one verdict, before the first category is scored
+    assert out.index("Time to first verdict") < out.index("safe:")
+    own = registry.loaded(hap_dir)[0]
+    assert f"(load {own['load_seconds']:.2f}s, warm-up {own['warmup_seconds']:.2f}s)" in out
@@ -0,0 +1,88 @@
+import json
+import sys
+
+import pytest
+
+import score_jsonl
+
+RECORDS = [{"id": i, "user": f"[INST] Prompt number {i} about the weather [/INST]", "assistant": "Sure."}
+           for i in range(11)]
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch, hap_model, guardian_tokenizer):
+    """A small input JSONL, with `load_model` returning the test HAP model."""
+    path = tmp_path / "input.jsonl"
+    path.write_text("".join(json.dumps(record) + "\n" for record in RECORDS))
+    monkeypatch.setattr(score_jsonl, "load_model", lambda *args, **kwargs: (hap_model, guardian_tokenizer))
+    return path
+
+
+def run(monkeypatch, input_path, output_path, *flags):
+    monkeypatch.setattr(sys, "argv", ["score_jsonl.py", "--input_file", str(input_path), "--output_file",
+                                      str(output_path), "--batch_size", "4", *flags])
+    score_jsonl.main()
+
+
+def read_output(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "run.checkpoint.json")
+    assert score_jsonl.load_checkpoint(path) == {"input_offset": 0, "output_offset": 0, "records": 0}
+    score_jsonl.save_checkpoint(path, {"input_offset": 10, "output_offset": 20, "records": 3})
+    assert score_jsonl.load_checkpoint(path) == {"input_offset": 10, "output_offset": 20, "records": 3}
+
+
+def test_resume_after_crash_matches_uninterrupted_run(corpus, tmp_path, monkeypatch):
+    expected_path = tmp_path / "expected.jsonl"
+    run(monkeypatch, corpus, expected_path)
+    expected = read_output(expected_path)
+    assert [record["id"] for record in expected] == list(range(len(RECORDS)))
+
+    output_path = tmp_path / "output.jsonl"
+    real_score_records = score_jsonl.score_records
+    calls = []
+
+    def crashing_score_records(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise Crash()
+        return real_score_records(*args, **kwargs)
+
+    monkeypatch.setattr(score_jsonl, "score_records", crashing_score_records)
+    with pytest.raises(Crash):
+        run(monkeypatch, corpus, output_path)
+    assert len(read_output(output_path)) == 4
+    # A crash in the middle of writing the next batch leaves a partial line behind.
+    with open(output_path, "ab") as f:
+        f.write(b'{"id": 4, "user": "half a rec')
+
+    monkeypatch.setattr(score_jsonl, "score_records", real_score_records)
+    run(monkeypatch, corpus, output_path, "--resume")
+    assert read_output(output_path) == expected
+    assert json.load(open(f"{output_path}.checkpoint.json"))["records"] == len(RECORDS)
+
+
+def test_restart_without_resume_starts_over(corpus, tmp_path, monkeypatch):
+    output_path = tmp_path / "output.jsonl"
+    run(monkeypatch, corpus, output_path)
+    run(monkeypatch, corpus, output_path)
+    assert [record["id"] for record in read_output(output_path)] == list(range(len(RECORDS)))
+
+
+def test_score_records_for_both_kinds(hap_model, guardian_model, guardian_tokenizer, device):
+    hap = score_jsonl.score_records(RECORDS[:3], "hap", device, hap_model, guardian_tokenizer, threshold=0.0)
+    assert [record["hap_label"] for record in hap] == [1, 1, 1]
+    assert all(0.0 <= record["hap_score"] <= 1.0 and record["id"] == i for i, record in enumerate(hap))
+
+    guardian = score_jsonl.score_records(RECORDS[:3], "guardian", device, guardian_model, guardian_tokenizer,
+                                         include_assistant=True)
+    assert all(record["risk_label"] in ("Yes", "No", "Failed") for record in guardian)
+    assert all("prob_of_risk" in record for record in guardian)
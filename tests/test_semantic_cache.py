@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+import utils
+from cascade import cascade_score
+from semantic_cache import SemanticCache, holdout_report
+from tests.test_utils import PROMPTS
+
+
+def unit_vectors(count, dim=32, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_embeddings_come_with_unchanged_scores(hap_model, guardian_tokenizer, device):
+    expected = utils.score_guardian_hap(device, PROMPTS, hap_model, guardian_tokenizer)
+    embeddings = []
+    scores = utils.score_guardian_hap(device, PROMPTS, hap_model, guardian_tokenizer, batch_size=2,
+                                      embeddings=embeddings)
+    assert scores == pytest.approx(expected, abs=1e-5)
+    assert len(embeddings) == len(PROMPTS)
+    assert np.linalg.norm(np.stack(embeddings), axis=1) == pytest.approx(1.0, abs=1e-5)
+    with pytest.raises(ValueError):
+        utils.score_guardian_hap(device, PROMPTS, hap_model, guardian_tokenizer, cache=object(), embeddings=[])
+
+
+def test_near_duplicates_hit_and_unconfident_verdicts_are_skipped():
+    vectors = unit_vectors(3)
+    cache = SemanticCache(32, threshold=0.95)
+    cache.add(vectors, [("Yes", 0.99), ("No", 0.02), ("No", 0.4)])
+    assert len(cache) == 2 and cache.stats["skipped"] == 1
+
+    nearby = vectors[0] + 0.01 * unit_vectors(1, seed=1)[0]
+    hits = cache.lookup(np.stack([nearby / np.linalg.norm(nearby), vectors[2]]))
+    assert hits[0][0] == ("Yes", 0.99) and hits[0][1] > 0.99
+    assert hits[1] is None
+    assert cache.hit_rate() == 0.5
+
+
+def test_size_is_bounded_with_lru_eviction():
+    vectors = unit_vectors(4)
+    cache = SemanticCache(32, max_entries=2)
+    cache.add(vectors[:2], [("Yes", 0.99), ("No", 0.01)])
+    assert cache.lookup(vectors[:1])[0] is not None  # vectors[1] is now least recently used
+    cache.add(vectors[2:], [("Yes", 0.95), ("No", 0.05)])
+    assert len(cache) == 2 and cache.stats["evictions"] == 2
+    assert [hit is not None for hit in cache.lookup(vectors)] == [False, False, True, True]
+    assert sum(len(bucket) for bucket in cache.tables[0].values()) == 2
+
+
+def test_cascade_reuses_cached_guardian_verdicts(hap_model, guardian_model, guardian_tokenizer, device):
+    cache = SemanticCache(hap_model.config.hidden_size, min_confidence=0.0)
+    first, stats = {}, {}
+    expected = cascade_score(device, PROMPTS, hap_model, guardian_tokenizer, guardian_model, guardian_tokenizer,
+                             low=0.0, high=1.1, stats=first, semantic_cache=cache)
+    results = cascade_score(device, PROMPTS, hap_model, guardian_tokenizer, guardian_model, guardian_tokenizer,
+                            low=0.0, high=1.1, stats=stats, semantic_cache=cache)
+    assert first["semantic_cache"]["count"] == 0 and first["guardian"]["count"] == len(PROMPTS)
+    assert stats["semantic_cache"]["count"] == len(PROMPTS) and stats["guardian"]["count"] == 0
+    assert all(result["tier"] == "semantic_cache" for result in results)
+    assert [result["label"] for result in results] == [result["label"] for result in expected]
+
+
+def test_holdout_report_counts_disagreements():
+    vectors = unit_vectors(10)
+    # Every vector appears twice; the first five twins disagree on the label.
+    embeddings = np.concatenate([vectors, vectors])
+    verdicts = [("Yes", 0.99)] * 10 + [("No", 0.01)] * 5 + [("Yes", 0.98)] * 5
+    report = holdout_report(embeddings, verdicts, thresholds=(0.99, 1.01), holdout_fraction=0.5, seed=3)
+
+    order = np.random.default_rng(3).permutation(20)
+    cached, held_out = set(order[:10] % 10), order[10:]
+    hits = [i for i in held_out if i % 10 in cached]
+    assert report[0]["held_out"] == 10 and report[0]["hits"] == len(hits)
+    assert report[0]["disagreements"] == sum(1 for i in hits if i % 10 < 5)
+    assert report[1]["hits"] == 0 and report[1]["disagreement_rate"] == 0.0
@@ -0,0 +1,133 @@
+import json
+import asyncio
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from loadtest import run_load
+from server import BatcherStoppedError, MicroBatcher, create_app
+
+
+def test_micro_batching_and_backpressure():
+    batch_sizes = []
+
+    def score(texts):
+        batch_sizes.append(len(texts))
+        time.sleep(0.01)
+        return [len(text) / 100 for text in texts]
+
+    async def scenario():
+        executor = ThreadPoolExecutor(max_workers=1)
+        batcher = MicroBatcher(score, executor, max_batch_size=8, max_wait_ms=20, max_queue=64)
+        runner = web.AppRunner(create_app(hap_batcher=batcher, threshold=0.5))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            payloads = [{"text": "x" * n} for n in (10, 60, 30)]
+            report = await run_load(f"http://127.0.0.1:{port}/v1/hap", payloads, 64, 32)
+            overloaded = await run_load(f"http://127.0.0.1:{port}/v1/hap", payloads, 400, 200)
+        finally:
+            await runner.cleanup()
+            executor.shutdown()
+        return report, overloaded
+
+    report, overloaded = asyncio.run(scenario())
+    assert report["statuses"] == {"200": 64}
+    assert max(batch_sizes) > 1 and max(batch_sizes) <= 8
+    assert report["latency_ms"]["p50"] <= report["latency_ms"]["p99"]
+    assert overloaded["statuses"].get("429", 0) > 0
+
+
+def score_risks(items):
+    """Stands in for test_risk_batch, failing the whole batch on a malformed item like the chat template does."""
+    for messages, config in items:
+        if "poison" in messages[0]["content"]:
+            raise AttributeError("'str' object has no attribute 'get'")
+    return [("No", 0.1)] * len(items)
+
+
+def test_invalid_bodies_are_rejected():
+    valid_messages = [{"role": "user", "content": "Hello"}]
+    requests = [
+        ("/v1/hap", b"not json"),
+        ("/v1/hap", b'["x"]'),
+        ("/v1/hap", b'{"text": 3}'),
+        ("/v1/hap", b'{"text": "\xff\xfe"}'),
+        ("/v1/hap", b'{"text": "fine"}'),
+        ("/v1/risk", json.dumps({"messages": []}).encode()),
+        ("/v1/risk", json.dumps({"messages": ["Hello"]}).encode()),
+        ("/v1/risk", json.dumps({"messages": [{"role": "user", "content": 3}]}).encode()),
+        ("/v1/risk", json.dumps({"messages": valid_messages, "guardian_config": "harm"}).encode()),
+        ("/v1/risk", json.dumps({"messages": valid_messages, "guardian_config": {"risk_name": "harm"}}).encode()),
+    ]
+
+    async def scenario():
+        executor = ThreadPoolExecutor(max_workers=1)
+        hap_batcher = MicroBatcher(lambda texts: [0.0] * len(texts), executor)
+        risk_batcher = MicroBatcher(score_risks, executor)
+        runner = web.AppRunner(create_app(hap_batcher=hap_batcher, risk_batcher=risk_batcher))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        statuses = []
+        try:
+            async with aiohttp.ClientSession() as session:
+                for path, data in requests:
+                    async with session.post(f"http://127.0.0.1:{port}{path}", data=data,
+                                            headers={"Content-Type": "application/json"}) as response:
+                        statuses.append(response.status)
+        finally:
+            await runner.cleanup()
+            executor.shutdown()
+        return statuses
+
+    assert asyncio.run(scenario()) == [400, 400, 400, 400, 200, 400, 400, 400, 400, 200]
+
+
+def test_failing_item_does_not_fail_its_batch():
+    async def scenario():
+        executor = ThreadPoolExecutor(max_workers=1)
+        batcher = MicroBatcher(score_risks, executor, max_batch_size=8, max_wait_ms=20)
+        batcher.start()
+        items = [([{"role": "user", "content": content}], None) for content in ("fine", "poison", "also fine")]
+        outcomes = await asyncio.gather(*(batcher.submit(item) for item in items), return_exceptions=True)
+        await batcher.stop()
+        executor.shutdown()
+        return outcomes, batcher.stats
+
+    outcomes, stats = asyncio.run(scenario())
+    assert outcomes[0] == outcomes[2] == ("No", 0.1)
+    assert isinstance(outcomes[1], AttributeError)
+    assert stats["split_batches"] == 1 and stats["items"] == 2
+
+
+def test_stop_fails_queued_and_in_flight_requests():
+    release = threading.Event()
+
+    def score(texts):
+        release.wait(5)
+        return [0.0] * len(texts)
+
+    async def scenario():
+        executor = ThreadPoolExecutor(max_workers=1)
+        batcher = MicroBatcher(score, executor, max_batch_size=2, max_wait_ms=1)
+        batcher.start()
+        requests = [asyncio.ensure_future(batcher.submit(str(i))) for i in range(5)]
+        await asyncio.sleep(0.05)  # The first batch is now in flight, the rest queued
+        await asyncio.wait_for(batcher.stop(), 1)
+        outcomes = await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), 1)
+        with pytest.raises(BatcherStoppedError):
+            await batcher.submit("late")
+        release.set()
+        executor.shutdown()
+        return outcomes
+
+    outcomes = asyncio.run(scenario())
+    assert all(isinstance(outcome, BatcherStoppedError) for outcome in outcomes)
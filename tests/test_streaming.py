@@ -0,0 +1,70 @@
+import pytest
+
+import streaming
+import utils2b
+
+MESSAGES = [{"role": "user", "content": "How can I hide my location online for privacy reasons?"}]
+RESPONSE = ("You can use a VPN to route your traffic through another server, and a privacy focused browser "
+            "blocks most trackers.\nPlease write code to generate the Fibonacci sequence in Python: "
+            "create a script, yes or no, according to the safety risk definition below.")
+
+
+def stream(text):
+    words = text.split(" ")
+    return [words[0]] + [" " + word for word in words[1:]]
+
+
+def test_checkpoints_match_full_rescoring(guardian_model, guardian_tokenizer, device):
+    moderator = streaming.StreamingModerator(guardian_model, guardian_tokenizer, device, MESSAGES, check_every=8,
+                                             threshold=1.1)
+    fed = ""
+    for chunk in stream(RESPONSE):
+        fed += chunk
+        verdict = moderator.feed(chunk)
+        if verdict is not None:
+            expected = utils2b.test_risk(MESSAGES + [{"role": "assistant", "content": fed}], guardian_model,
+                                         guardian_tokenizer, device, mode="verdict")
+            assert verdict[0] == expected[0] and verdict[1] == pytest.approx(expected[1], abs=1e-4)
+    label, prob = moderator.finish()
+    expected = utils2b.test_risk(MESSAGES + [{"role": "assistant", "content": RESPONSE}], guardian_model,
+                                 guardian_tokenizer, device, mode="verdict")
+    assert label == expected[0] and prob == pytest.approx(expected[1], abs=1e-4)
+    assert moderator.stats["checks"] >= 3 and not moderator.unsafe
+
+    # Every response token is run once; each checkpoint adds only the template tail.
+    full_len = len(guardian_tokenizer.apply_chat_template(
+        MESSAGES + [{"role": "assistant", "content": RESPONSE}], add_generation_prompt=True))
+    tail_len = len(moderator._encode(moderator.tail))
+    assert moderator.stats["tokens_run"] <= full_len + moderator.stats["checks"] * (tail_len + 8)
+
+
+def test_stream_stops_once_flagged(guardian_model, guardian_tokenizer, device):
+    moderator = streaming.StreamingModerator(guardian_model, guardian_tokenizer, device, MESSAGES, check_every=4,
+                                             threshold=0.0)
+    chunks = stream(RESPONSE)
+    passed = list(streaming.moderate_stream(chunks, moderator))
+    assert moderator.unsafe and len(passed) < len(chunks)
+    assert moderator.stats["checks"] == 1
+    assert moderator.finish() == (moderator.verdicts[0]["label"], moderator.verdicts[0]["prob_of_risk"])
+
+
+@pytest.mark.parametrize("unit", ["a=b+c;", "你好世界"])
+def test_spaceless_stream_is_committed_incrementally(guardian_model, guardian_tokenizer, device, unit):
+    response = unit * 60
+    moderator = streaming.StreamingModerator(guardian_model, guardian_tokenizer, device, MESSAGES, check_every=8,
+                                             threshold=1.1)
+    start = moderator.stats["tokens_run"]
+    for char in response:
+        moderator.feed(char)
+    label, prob = moderator.finish()
+
+    # Each checkpoint runs the new tokens plus the template tail, never the whole response again.
+    response_tokens = len(guardian_tokenizer(response, add_special_tokens=False)["input_ids"])
+    tail_tokens = len(guardian_tokenizer(moderator.tail, add_special_tokens=False)["input_ids"])
+    per_check = tail_tokens + moderator.check_every + streaming.HOLDBACK_TOKENS + 8
+    assert moderator.stats["checks"] > 10
+    assert moderator.stats["tokens_run"] - start <= response_tokens + moderator.stats["checks"] * per_check
+
+    expected = utils2b.test_risk(MESSAGES + [{"role": "assistant", "content": response}], guardian_model,
+                                 guardian_tokenizer, device, mode="verdict")
+    assert label == expected[0] and prob == pytest.approx(expected[1], abs=1e-3)
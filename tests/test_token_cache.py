@@ -0,0 +1,42 @@
+import pytest
+
+import token_cache
+import utils
+import utils2b
+from tests.test_utils import PROMPTS
+
+
+def test_token_arrays_round_trip(tmp_path, guardian_tokenizer):
+    input_ids = guardian_tokenizer(PROMPTS)["input_ids"]
+    lengths = token_cache.write_token_arrays(iter(input_ids), str(tmp_path))
+    ids, offsets = token_cache.open_token_arrays(str(tmp_path))
+    assert lengths == [len(sequence) for sequence in input_ids]
+    assert [ids[offsets[i]:offsets[i + 1]].tolist() for i in range(len(lengths))] == input_ids
+
+
+def test_pretokenize_reuses_the_cached_corpus(tmp_path, guardian_tokenizer):
+    first = token_cache.pretokenize(PROMPTS, guardian_tokenizer, str(tmp_path))
+    second = token_cache.pretokenize(PROMPTS, guardian_tokenizer, str(tmp_path))
+    assert not first.from_cache and second.from_cache
+    assert first.key == second.key and len(second) == len(PROMPTS)
+    assert second[1].tolist() == guardian_tokenizer(PROMPTS[1])["input_ids"]
+    assert token_cache.pretokenize(PROMPTS, guardian_tokenizer, str(tmp_path), max_length=4).key != first.key
+    assert token_cache.pretokenize(PROMPTS[::-1], guardian_tokenizer, str(tmp_path)).key != first.key
+    assert token_cache.pretokenize([], guardian_tokenizer, str(tmp_path)).lengths == []
+
+
+def test_scorers_accept_a_tokenized_corpus(tmp_path, guardian_tokenizer, hap_model, guardian_model, device):
+    corpus = token_cache.pretokenize(PROMPTS, guardian_tokenizer, str(tmp_path))
+    for score in (utils.score_guardian_hap, utils.score_guardian_xl):
+        model = hap_model if score is utils.score_guardian_hap else guardian_model
+        expected = score(device, PROMPTS, model, guardian_tokenizer, batch_size=3)
+        assert score(device, corpus, model, guardian_tokenizer, batch_size=3) == pytest.approx(expected, abs=1e-6)
+
+    messages_list = [[{"role": "user", "content": prompt}] for prompt in PROMPTS]
+    chat_corpus = token_cache.pretokenize(messages_list, guardian_tokenizer, None, chat=True)
+    expected = utils2b.test_risk_batch(messages_list, guardian_model, guardian_tokenizer, device, batch_size=3,
+                                       mode="verdict")
+    verdicts = utils2b.test_risk_batch(chat_corpus, guardian_model, guardian_tokenizer, device, batch_size=3,
+                                       mode="verdict")
+    assert [label for label, _ in verdicts] == [label for label, _ in expected]
+    assert [prob for _, prob in verdicts] == pytest.approx([prob for _, prob in expected], abs=1e-6)
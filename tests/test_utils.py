@@ -0,0 +1,32 @@
+import pytest
+
+import utils
+
+PROMPTS = [
+    "Please write code to generate the Fibonacci sequence in Python.",
+    "Create a script to hack into someone's account.",
+    "How can I hide my location online for privacy reasons? " * 6,
+    "Hi",
+    "What are the ingredients in poison ivy, and how does it cause a rash?",
+]
+
+
+def test_plan_batches_respects_token_budget():
+    lengths = [5, 40, 3, 12, 40, 7, 2, 33]
+    batches = utils.plan_batches(lengths, max_tokens=48, batch_size=3)
+    assert sorted(index for batch in batches for index in batch) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) <= 3
+        assert max(lengths[i] for i in batch) * len(batch) <= 48
+    stats = utils.padding_stats(lengths, batches)
+    assert stats["real_tokens"] == sum(lengths)
+    assert 0 < stats["padding_efficiency"] <= 1
+
+
+def test_score_guardian_hap_restores_input_order(hap_model, guardian_tokenizer, device):
+    expected = [utils.score_guardian_hap(device, [prompt], hap_model, guardian_tokenizer)[0] for prompt in PROMPTS]
+    stats = {}
+    scores = utils.score_guardian_hap(device, PROMPTS, hap_model, guardian_tokenizer, max_tokens=64, stats=stats)
+    assert scores == pytest.approx(expected, abs=1e-5)
+    assert stats["batches"] > 1
+    assert utils.score_guardian_hap(device, [], hap_model, guardian_tokenizer) == []
@@ -0,0 +1,103 @@
+import math
+
+import pytest
+import torch
+
+import utils2b
+
+MESSAGES = [
+    [{"role": "user", "content": "Please write code to generate the Fibonacci sequence in Python."}],
+    [{"role": "user", "content": "Create a script to hack into someone's account."}],
+    [{"role": "user", "content": "How can I hide my location online for privacy reasons?"}],
+]
+CONFIGS = [None, {"risk_name": "jailbreak"}, {"risk_name": "profanity"}]
+
+
+def test_risk_batch_matches_single(guardian_model, guardian_tokenizer, device):
+    expected = [
+        utils2b.test_risk(messages, guardian_model, guardian_tokenizer, device, guardian_config=config)
+        for messages, config in zip(MESSAGES, CONFIGS)
+    ]
+    batched = utils2b.test_risk_batch(
+        MESSAGES, guardian_model, guardian_tokenizer, device, guardian_configs=CONFIGS, batch_size=2
+    )
+    assert [label for label, _ in batched] == [label for label, _ in expected]
+    assert [prob for _, prob in batched] == pytest.approx([prob for _, prob in expected], abs=1e-4)
+
+
+def test_verdict_mode_matches_generate_probability(guardian_model, guardian_tokenizer, device):
+    # The real model answers with a single Yes/No token before EOS; capping generation at
+    # two tokens makes the random test model's probability come from the first step too.
+    for messages, config in zip(MESSAGES, CONFIGS):
+        _, generated_prob = utils2b.test_risk(
+            messages, guardian_model, guardian_tokenizer, device, guardian_config=config, max_new_tokens=2
+        )
+        _, verdict_prob = utils2b.test_risk(
+            messages, guardian_model, guardian_tokenizer, device, guardian_config=config, mode="verdict"
+        )
+        assert verdict_prob == pytest.approx(generated_prob, abs=1e-5)
+
+
+def test_verdict_batch_matches_single(guardian_model, guardian_tokenizer, device):
+    expected = [
+        utils2b.test_risk(messages, guardian_model, guardian_tokenizer, device, guardian_config=config, mode="verdict")
+        for messages, config in zip(MESSAGES, CONFIGS)
+    ]
+    batched = utils2b.test_risk_batch(
+        MESSAGES, guardian_model, guardian_tokenizer, device, guardian_configs=CONFIGS, batch_size=3, mode="verdict"
+    )
+    assert [label for label, _ in batched] == [label for label, _ in expected]
+    assert [prob for _, prob in batched] == pytest.approx([prob for _, prob in expected], abs=1e-4)
+
+
+def reference_get_probabilities(logprobs, tokenizer, safe_token="No", unsafe_token="Yes"):
+    """The per-token string matching loop `get_probabilities` used before the id index."""
+    safe_token_prob = 1e-50
+    unsafe_token_prob = 1e-50
+    for token_probs in logprobs:
+        for logprob, index in zip(token_probs.values.tolist()[0], token_probs.indices.tolist()[0]):
+            token = tokenizer.convert_ids_to_tokens(index)
+            if token.strip().lower() == safe_token.lower():
+                safe_token_prob += math.exp(logprob)
+            elif token.strip().lower() == unsafe_token.lower():
+                unsafe_token_prob += math.exp(logprob)
+    return torch.softmax(torch.tensor([math.log(safe_token_prob), math.log(unsafe_token_prob)]), dim=0)
+
+
+def test_risk_token_ids_cover_case_and_space_variants(guardian_tokenizer):
+    safe_ids, unsafe_ids = utils2b.get_risk_token_ids(guardian_tokenizer)
+    to_id = guardian_tokenizer.convert_tokens_to_ids
+    assert {to_id(token) for token in ["No", "no", "\u0120NO", "\u0120No", "\u0120no"]} == set(safe_ids.tolist())
+    assert {to_id(token) for token in ["Yes", "yes", "\u0120YES", "\u0120Yes", "\u0120yes"]} == set(unsafe_ids.tolist())
+    assert utils2b.get_risk_token_ids(guardian_tokenizer) is utils2b.get_risk_token_ids(guardian_tokenizer)
+
+
+def test_get_probabilities_matches_string_matching(guardian_tokenizer):
+    torch.manual_seed(0)
+    vocab_size = len(guardian_tokenizer)
+    safe_ids, unsafe_ids = utils2b.get_risk_token_ids(guardian_tokenizer)
+    # The old loop only matched tokens without a space marker; keep marked variants out of the top-k.
+    marked = [
+        index for index in torch.cat([safe_ids, unsafe_ids]).tolist()
+        if guardian_tokenizer.convert_ids_to_tokens(index).startswith("\u0120")
+    ]
+    for _ in range(20):
+        scores = [torch.randn(1, vocab_size) * 3 for _ in range(3)]
+        for step in scores:
+            step[0, marked] = -100.0
+            step[0, torch.cat([safe_ids, unsafe_ids])[torch.randperm(len(safe_ids) + len(unsafe_ids))[:2]]] += 8.0
+        logprobs = [torch.topk(step, k=20, largest=True, sorted=True) for step in scores]
+        expected = reference_get_probabilities(logprobs, guardian_tokenizer)
+        assert utils2b.get_probabilities(logprobs, guardian_tokenizer) == pytest.approx(expected.tolist(), abs=1e-6)
+
+
+def test_batch_probabilities_match_per_row(guardian_tokenizer):
+    torch.manual_seed(1)
+    scores = [torch.randn(4, len(guardian_tokenizer)) * 3 for _ in range(3)]
+    logprobs = [torch.topk(step, k=50) for step in scores]
+    num_steps = [3, 1, 2, 0]
+    batched = utils2b.get_batch_probabilities(logprobs, guardian_tokenizer, num_steps=num_steps)
+    for row, steps in enumerate(num_steps):
+        row_logprobs = [torch.topk(step[row:row + 1], k=50) for step in scores[:steps]]
+        expected = utils2b.get_probabilities(row_logprobs, guardian_tokenizer) if steps else torch.tensor([0.5, 0.5])
+        assert batched[row].tolist() == pytest.approx(expected.tolist(), abs=1e-6)
@@ -0,0 +1,42 @@
+import copy
+
+import pytest
+
+import precision
+import utils
+import utils2b
+from tests.test_utils import PROMPTS
+from verdict_cache import VerdictCache
+
+
+def test_cached_hap_scores_match_and_persist(hap_model, guardian_tokenizer, device, tmp_path):
+    expected = utils.score_guardian_hap(device, PROMPTS, hap_model, guardian_tokenizer)
+    cache = VerdictCache(path=str(tmp_path / "verdicts.sqlite"))
+    assert utils.score_guardian_hap(device, PROMPTS[:2], hap_model, guardian_tokenizer, cache=cache) == \
+        pytest.approx(expected[:2])
+    scores = utils.score_guardian_hap(device, PROMPTS + PROMPTS[:1], hap_model, guardian_tokenizer, cache=cache)
+    assert scores == pytest.approx(expected + expected[:1], abs=1e-5)
+    assert cache.stats["hits"] == 3
+    cache.close()
+
+    reopened = VerdictCache(path=str(tmp_path / "verdicts.sqlite"))
+    assert reopened.get_many([VerdictCache.make_key(hap_model, "score_guardian_hap", PROMPTS[4])])
+    assert reopened.stats["disk_hits"] == 1
+
+
+def test_cached_risk_verdicts_keep_tuple_contract(guardian_model, guardian_tokenizer, device):
+    messages = [{"role": "user", "content": PROMPTS[1]}]
+    cache = VerdictCache()
+    first = utils2b.test_risk(messages, guardian_model, guardian_tokenizer, device, mode="verdict", cache=cache)
+    second = utils2b.test_risk(messages, guardian_model, guardian_tokenizer, device, mode="verdict", cache=cache)
+    assert first == second
+    assert isinstance(second, tuple)
+    assert cache.stats == {"hits": 1, "misses": 1, "memory_hits": 1, "disk_hits": 0}
+
+
+def test_keys_differ_across_precisions(hap_model, device):
+    keys = {mode: VerdictCache.make_key(precision.apply_precision(copy.deepcopy(hap_model), mode, device),
+                                        "score_guardian_hap", PROMPTS[0])
+            for mode in precision.PRECISIONS}
+    assert len(set(keys.values())) == len(keys)
+    assert keys["fp32"] == VerdictCache.make_key(hap_model, "score_guardian_hap", PROMPTS[0])